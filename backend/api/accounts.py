@@ -0,0 +1,72 @@
+"""
+Удаление пользователей.
+
+Каскад удаляет рецепты пользователя, его избранное, корзину и подписки
+вместе с производными данными, которые принадлежат ему самому. Данные
+остальных пользователей и рецептов правятся здесь, до удаления, пока
+связи на месте: списки покупок и индекс продуктов без удаленных
+рецептов, ссылки на изображения, счетчики избранного и подписчиков,
+оценки популярности.
+"""
+from collections import Counter, defaultdict
+
+from api import cache, counters, images, pantry, ranking, shopping_list
+from api.models import Favorite, Recipe, ShoppingCart
+from users.models import Subscription
+
+
+def added_times(model, user_ids, recipe_ids):
+    """
+    Время добавления рецептов в избранное или корзину каждого
+    пользователя: [{recipe_id: created}], кроме рецептов recipe_ids.
+    """
+
+    times = defaultdict(dict)
+    rows = model.objects.filter(user_id__in=user_ids).exclude(
+        recipe_id__in=recipe_ids).values_list(
+        'user_id', 'recipe_id', 'created')
+    for user_id, recipe_id, created in rows:
+        times[user_id][recipe_id] = created
+    return list(times.values())
+
+
+def delete_recipes(user_ids):
+    """Рецепты пользователей удаляются вместе с ними."""
+
+    recipes = list(Recipe.objects.filter(
+        author_id__in=user_ids).values_list('id', 'image'))
+    recipe_ids = [recipe_id for recipe_id, _ in recipes]
+    for recipe_id in recipe_ids:
+        shopping_list.delete_recipe(recipe_id)
+    pantry.delete_recipes(recipe_ids)
+    images.release(*[image for _, image in recipes])
+    return recipe_ids
+
+
+def unfollow(user_ids):
+    """Подписки пользователей удаляются: счетчики подписчиков авторов."""
+
+    authors = Counter(Subscription.objects.filter(
+        user_id__in=user_ids).exclude(
+        author_id__in=user_ids).values_list('author_id', flat=True))
+    groups = defaultdict(list)
+    for author_id, count in authors.items():
+        groups[count].append(author_id)
+    for count, author_ids in groups.items():
+        counters.change_followers(author_ids, -count)
+
+
+def delete_users(user_ids):
+    """Пользователи удаляются: вызывается в транзакции до удаления."""
+
+    recipe_ids = delete_recipes(user_ids)
+    favorites = added_times(Favorite, user_ids, recipe_ids)
+    for times in favorites:
+        counters.change_favorites(
+            list(times), -1, **ranking.updates(times, -1))
+    carts = added_times(ShoppingCart, user_ids, recipe_ids)
+    for times in carts:
+        ranking.change(times, -1)
+    if favorites or carts:
+        cache.invalidate_ranking()
+    unfollow(user_ids)
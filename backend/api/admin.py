@@ -1,7 +1,9 @@
 from django.contrib import admin
+from django.db import transaction
 
-from api.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
-                        ShoppingCart, Tag)
+from api import counters, feed, images, pantry, ranking, shopping_list, similar
+from api.models import (Favorite, ImageFile, ImageTask, Ingredient,
+                        IngredientInRecipe, Recipe, ShoppingCart, Tag)
 
 
 class IngredientInline(admin.TabularInline):
@@ -11,13 +13,69 @@ class IngredientInline(admin.TabularInline):
 class RecipeAdmin(admin.ModelAdmin):
     inlines = (IngredientInline,)
     list_display = ('name', 'author', 'cooking_time',
-                    'id', 'count_favorite', 'pub_date',)
+                    'id', 'favorites_count', 'pub_date',)
+    readonly_fields = ('favorites_count',)
     search_fields = ('name', 'author', 'tags')
     list_filter = ('name', 'author', 'tags')
     empty_value_display = 'пусто'
 
-    def count_favorite(self, obj):
-        return Favorite.objects.filter(recipe=obj).count()
+    def save_model(self, request, obj, form, change):
+        """
+        Новый рецепт или смена автора меняют счетчики авторов и ленты
+        подписок, новое изображение получает ссылку и ставится в очередь
+        на обработку.
+        """
+
+        with transaction.atomic():
+            if change and 'author' in form.changed_data:
+                counters.change_recipes(form.initial['author'], -1)
+            super().save_model(request, obj, form, change)
+            if not change or 'author' in form.changed_data:
+                counters.change_recipes(obj.author_id, 1)
+            if not change:
+                feed.publish(obj)
+                images.acquire(obj.image.name)
+                images.enqueue(obj)
+                return
+            if {'author', 'pub_date'} & set(form.changed_data):
+                feed.republish(obj)
+            if form.initial['image'].name != obj.image.name:
+                images.replace(form.initial['image'].name, obj.image.name)
+                images.enqueue(obj)
+
+    def save_related(self, request, form, formsets, change):
+        """
+        Изменение состава в инлайнах переносится в списки покупок
+        и индекс подбора по продуктам, похожие рецепты пересчитываются.
+        """
+
+        recipe_id = form.instance.id
+        old_amounts = shopping_list.recipe_amounts(recipe_id) if change else {}
+        super().save_related(request, form, formsets, change)
+        new_amounts = shopping_list.recipe_amounts(recipe_id)
+        if change:
+            shopping_list.change_recipe(recipe_id, old_amounts, new_amounts)
+        pantry.change_recipe(recipe_id, old_amounts, new_amounts)
+        similar.mark_stale([recipe_id])
+
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            shopping_list.delete_recipe(obj.id)
+            pantry.delete_recipes([obj.id])
+            super().delete_model(request, obj)
+            counters.change_recipes(obj.author_id, -1)
+            images.release(obj.image.name)
+
+    def delete_queryset(self, request, queryset):
+        recipes = list(queryset.values_list('id', 'author_id', 'image'))
+        with transaction.atomic():
+            for recipe_id, _, _ in recipes:
+                shopping_list.delete_recipe(recipe_id)
+            pantry.delete_recipes([recipe_id for recipe_id, _, _ in recipes])
+            super().delete_queryset(request, queryset)
+            for _, author_id, _ in recipes:
+                counters.change_recipes(author_id, -1)
+            images.release(*[image for _, _, image in recipes])
 
 
 class FavoriteAdmin(admin.ModelAdmin):
@@ -26,6 +84,32 @@ class FavoriteAdmin(admin.ModelAdmin):
     list_filter = ('user',)
     empty_value_display = 'пусто'
 
+    def change_recipe(self, recipe_id, created, delta):
+        """Счетчик избранного и оценки популярности одним UPDATE."""
+
+        counters.change_favorites(
+            [recipe_id], delta, **ranking.updates({recipe_id: created}, delta))
+
+    def save_model(self, request, obj, form, change):
+        with transaction.atomic():
+            if change and 'recipe' in form.changed_data:
+                self.change_recipe(form.initial['recipe'], obj.created, -1)
+            super().save_model(request, obj, form, change)
+            if not change or 'recipe' in form.changed_data:
+                self.change_recipe(obj.recipe_id, obj.created, 1)
+
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            super().delete_model(request, obj)
+            self.change_recipe(obj.recipe_id, obj.created, -1)
+
+    def delete_queryset(self, request, queryset):
+        rows = list(queryset.values_list('recipe_id', 'created'))
+        with transaction.atomic():
+            super().delete_queryset(request, queryset)
+            for recipe_id, created in rows:
+                self.change_recipe(recipe_id, created, -1)
+
 
 class ShoppingCartAdmin(admin.ModelAdmin):
     list_display = ('user', 'recipe', 'id')
@@ -33,6 +117,52 @@ class ShoppingCartAdmin(admin.ModelAdmin):
     list_filter = ('user',)
     empty_value_display = 'пусто'
 
+    def save_model(self, request, obj, form, change):
+        """
+        Правка корзины пересчитывает список покупок владельцев
+        и оценки популярности рецептов.
+        """
+
+        users = {obj.user_id}
+        if change:
+            users |= set(ShoppingCart.objects.filter(
+                id=obj.id).values_list('user_id', flat=True))
+        with transaction.atomic():
+            if change and 'recipe' in form.changed_data:
+                ranking.change({form.initial['recipe']: obj.created}, -1)
+            super().save_model(request, obj, form, change)
+            shopping_list.rebuild(users)
+            if not change or 'recipe' in form.changed_data:
+                ranking.change({obj.recipe_id: obj.created}, 1)
+
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            super().delete_model(request, obj)
+            shopping_list.remove_recipes(obj.user_id, [obj.recipe_id])
+            ranking.change({obj.recipe_id: obj.created}, -1)
+
+    def delete_queryset(self, request, queryset):
+        users = set(queryset.values_list('user_id', flat=True))
+        rows = list(queryset.values_list('recipe_id', 'created'))
+        with transaction.atomic():
+            super().delete_queryset(request, queryset)
+            shopping_list.rebuild(users)
+            for recipe_id, created in rows:
+                ranking.change({recipe_id: created}, -1)
+
+
+class ImageTaskAdmin(admin.ModelAdmin):
+    list_display = ('source', 'recipe', 'status', 'attempts', 'updated')
+    list_filter = ('status',)
+    readonly_fields = ('recipe', 'source', 'attempts', 'error', 'created')
+    empty_value_display = 'пусто'
+
+
+class ImageFileAdmin(admin.ModelAdmin):
+    list_display = ('name', 'references', 'updated')
+    readonly_fields = ('name', 'references', 'updated')
+    search_fields = ('name',)
+
 
 class TagAdmin(admin.ModelAdmin):
     list_display = ('name', 'color', 'slug')
@@ -53,3 +183,5 @@ admin.site.register(Tag, TagAdmin)
 admin.site.register(Ingredient, IngredientAdmin)
 admin.site.register(Favorite, FavoriteAdmin)
 admin.site.register(ShoppingCart, ShoppingCartAdmin)
+admin.site.register(ImageTask, ImageTaskAdmin)
+admin.site.register(ImageFile, ImageFileAdmin)
@@ -0,0 +1,185 @@
+"""
+Кэш пользователь-независимого представления рецептов.
+
+Ключи версионируются счетчиками, которые хранятся в том же кэше:
+общим (теги, ингредиенты, профили авторов), списочным (любая запись
+рецептов), отдельным для каждого рецепта и версией оценок популярности
+для списков с ordering. Смена версии делает старые
+записи недостижимыми, они вытесняются бэкендом по таймауту.
+Версии меняются только после фиксации транзакции: иначе параллельное
+чтение успело бы сохранить старые строки под новой версией.
+Признаки is_favorited, is_in_shopping_cart и is_subscribed
+накладываются поверх найденных данных для текущего пользователя,
+счетчик избранного в найденных данных обновляется из базы: отметки
+в избранном, самая частая запись, не сбрасывают закэшированные страницы.
+Выгрузки списка покупок версионируются счетчиком пользователя.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from api.membership import get_membership
+from api.models import Recipe
+
+SHARED_VERSION = 'recipes:version:shared'
+LIST_VERSION = 'recipes:version:list'
+RANKING_VERSION = 'recipes:version:ranking'
+RECIPE_VERSION = 'recipes:version:recipe:{}'
+SHOPPING_LIST_VERSION = 'shopping_list:version:{}'
+USER_DEPENDENT_FILTERS = ('is_favorited', 'is_in_shopping_cart')
+RANKING_PARAM = 'ordering'
+
+
+def get_cache():
+    return caches[settings.RECIPE_CACHE_ALIAS]
+
+
+def new_version():
+    """Начальная версия больше любой ранее выданной, даже после сброса."""
+
+    return time.time_ns()
+
+
+def get_versions(*keys):
+    cache = get_cache()
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        for key in missing:
+            cache.add(key, new_version(), None)
+        versions.update(cache.get_many(missing))
+    return [versions[key] for key in keys]
+
+
+def increment(keys):
+    cache = get_cache()
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, new_version(), None)
+
+
+def bump(*keys):
+    """Смена версий после фиксации текущей транзакции."""
+
+    transaction.on_commit(lambda: increment(keys))
+
+
+def invalidate_recipe(recipe_id):
+    """Рецепт создан, изменен или удален."""
+
+    invalidate_recipes([recipe_id])
+
+
+def invalidate_recipes(recipe_ids):
+    """Изменились признаки нескольких рецептов."""
+
+    bump(LIST_VERSION,
+         *[RECIPE_VERSION.format(recipe_id) for recipe_id in recipe_ids])
+
+
+def invalidate_ranking():
+    """
+    Изменились оценки популярности без изменения закэшированных данных
+    рецептов (избранное, список покупок): сбрасываются только списки
+    с ordering.
+    """
+
+    bump(RANKING_VERSION)
+
+
+def invalidate_shared():
+    """Изменились теги, ингредиенты или профиль автора."""
+
+    bump(SHARED_VERSION)
+
+
+def invalidate_shopping_lists(user_ids):
+    """Изменились списки покупок пользователей."""
+
+    bump(*[SHOPPING_LIST_VERSION.format(user_id) for user_id in user_ids])
+
+
+def is_cacheable(request):
+    return not any(
+        name in request.query_params for name in USER_DEPENDENT_FILTERS)
+
+
+def request_fingerprint(request):
+    """Хост входит в ключ: от него зависят абсолютные ссылки в ответе."""
+
+    raw = '{}://{}{}?{}'.format(
+        request.scheme, request.get_host(), request.path,
+        sorted(request.query_params.lists()))
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def list_key(request):
+    keys = [SHARED_VERSION, LIST_VERSION]
+    if RANKING_PARAM in request.query_params:
+        keys.append(RANKING_VERSION)
+    versions = ':'.join(str(version) for version in get_versions(*keys))
+    return f'recipes:list:{versions}:{request_fingerprint(request)}'
+
+
+def detail_key(request, pk):
+    shared, recipe = get_versions(SHARED_VERSION, RECIPE_VERSION.format(pk))
+    return (f'recipes:detail:{pk}:{shared}:{recipe}:'
+            f'{request_fingerprint(request)}')
+
+
+def shopping_list_key(user_id, file_format):
+    shared, own = get_versions(
+        SHARED_VERSION, SHOPPING_LIST_VERSION.format(user_id))
+    return f'shopping_list:{user_id}:{file_format}:{shared}:{own}'
+
+
+def load(key):
+    return get_cache().get(key)
+
+
+def store(key, data):
+    get_cache().set(key, data, settings.RECIPE_CACHE_TIMEOUT)
+
+
+def store_stream(key, chunks):
+    """
+    Части потокового ответа отдаются по мере готовности и сохраняются
+    целиком после последней. Прерванная отдача в кэш не попадает.
+    """
+
+    parts = []
+    for chunk in chunks:
+        parts.append(chunk)
+        yield chunk
+    store(key, b''.join(parts))
+
+
+def refresh_favorites(recipes):
+    """Свежие счетчики избранного в найденных в кэше рецептах."""
+
+    if not recipes:
+        return
+    favorites = dict(Recipe.objects.filter(
+        id__in=[recipe['id'] for recipe in recipes]
+        ).order_by().values_list('id', 'favorites_count'))
+    for recipe in recipes:
+        recipe['favorites_count'] = favorites.get(
+            recipe['id'], recipe['favorites_count'])
+
+
+def overlay(recipes, request):
+    """Признаки текущего пользователя поверх закэшированных рецептов."""
+
+    membership = get_membership(request)
+    for recipe in recipes:
+        recipe['is_favorited'] = recipe['id'] in membership.favorites
+        recipe['is_in_shopping_cart'] = (
+            recipe['id'] in membership.shopping_cart)
+        recipe['author']['is_subscribed'] = (
+            recipe['author']['id'] in membership.following)
+    return recipes
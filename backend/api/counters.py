@@ -0,0 +1,74 @@
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from api import feed
+from api.models import Favorite, Recipe
+from users.models import Subscription, User
+
+
+def shift(queryset, field, delta, **also):
+    """
+    Атомарное изменение счетчика без ухода ниже нуля.
+    also — другие поля, которые меняются тем же UPDATE.
+    """
+
+    queryset.update(**{field: Greatest(F(field) + delta, 0)}, **also)
+
+
+def change_favorites(recipe_ids, delta, **also):
+    """Рецепты добавлены в избранное (delta > 0) или убраны из него."""
+
+    shift(Recipe.objects.filter(id__in=recipe_ids), 'favorites_count', delta,
+          **also)
+
+
+def change_recipes(author_id, delta):
+    """Автор опубликовал (delta > 0) или удалил рецепты."""
+
+    shift(User.objects.filter(id=author_id), 'recipes_count', delta)
+
+
+def change_followers(author_ids, delta):
+    """
+    На авторов подписались (delta > 0) или отписались от них.
+    Авторы, опустившиеся до порога раскладки, возвращаются в ленты.
+    """
+
+    shift(User.objects.filter(id__in=author_ids), 'followers_count', delta)
+    if delta < 0:
+        feed.refill(author_ids, delta)
+
+
+def count_of(model, field):
+    """Подзапрос числа строк model, ссылающихся на текущую запись."""
+
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+            field).annotate(total=Count('id')).values('total'),
+        output_field=IntegerField(),
+        ), 0)
+
+
+def recount():
+    """
+    Пересчет счетчиков по фактическим данным.
+    Возвращает число исправленных рецептов и пользователей.
+    """
+
+    recipes = Recipe.objects.annotate(
+        actual=count_of(Favorite, 'recipe')).exclude(
+        favorites_count=F('actual'))
+    users = User.objects.annotate(
+        actual_recipes=count_of(Recipe, 'author'),
+        actual_followers=count_of(Subscription, 'author'),
+        ).exclude(
+        recipes_count=F('actual_recipes'),
+        followers_count=F('actual_followers'),
+        )
+    fixed_recipes, fixed_users = recipes.count(), users.count()
+    Recipe.objects.update(favorites_count=count_of(Favorite, 'recipe'))
+    User.objects.update(
+        recipes_count=count_of(Recipe, 'author'),
+        followers_count=count_of(Subscription, 'author'),
+        )
+    return fixed_recipes, fixed_users
@@ -0,0 +1,156 @@
+"""
+Лента подписок /api/recipes/feed/.
+
+Рецепт при публикации раскладывается в ленты подписчиков автора одним
+INSERT ... SELECT в той же транзакции, при подписке в ленту добавляются
+рецепты автора, при отписке они удаляются. Авторы, у которых больше
+FEED_FANOUT_LIMIT подписчиков, в ленты не раскладываются: их рецепты
+подмешиваются при чтении по индексу рецептов автора, пока число
+подписчиков снова не опустится до порога. Лента читается
+по ключу (pub_date, recipe_id) одним проходом по индексу
+feed_user_pub_date_recipe_idx.
+"""
+from django.conf import settings
+from django.db import connection
+from django.db.models import DateField, F, IntegerField, Value
+
+from api.models import FeedEntry, Recipe
+from users.models import Subscription
+
+ORDERING = ('-pub_date', '-recipe_id')
+COLUMNS = ('user', 'recipe', 'author', 'pub_date')
+
+
+def fan_out(queryset):
+    """
+    Вставка в ленты строк queryset с колонками user, recipe, author,
+    pub_date одним INSERT ... SELECT. Имеющиеся записи пропускаются.
+    """
+
+    qn = connection.ops.quote_name
+    meta = FeedEntry._meta
+    columns = ', '.join(
+        qn(meta.get_field(name).column) for name in COLUMNS)
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {qn(meta.db_table)} ({columns}) {sql} '
+            f'ON CONFLICT DO NOTHING',
+            params,
+            )
+
+
+def rows(queryset, user, recipe, author, pub_date):
+    """Выборка queryset в виде строк ленты в порядке COLUMNS."""
+
+    return queryset.order_by().annotate(
+        feed_user=user,
+        feed_recipe=recipe,
+        feed_author=author,
+        feed_pub_date=pub_date,
+        ).values_list(
+        'feed_user', 'feed_recipe', 'feed_author', 'feed_pub_date')
+
+
+def publish(recipe):
+    """Новый рецепт попадает в ленты подписчиков автора."""
+
+    fan_out(rows(
+        Subscription.objects.filter(
+            author_id=recipe.author_id,
+            author__followers_count__lte=settings.FEED_FANOUT_LIMIT,
+            ),
+        F('user_id'),
+        Value(recipe.id, IntegerField()),
+        F('author_id'),
+        Value(recipe.pub_date, DateField()),
+        ))
+
+
+def republish(recipe):
+    """У рецепта сменились автор или дата публикации."""
+
+    FeedEntry.objects.filter(recipe_id=recipe.id).delete()
+    publish(recipe)
+
+
+def follow(user_id, author_ids):
+    """Пользователь подписался на авторов: их рецепты попадают в ленту."""
+
+    fan_out(rows(
+        Recipe.objects.filter(
+            author_id__in=author_ids,
+            author__followers_count__lte=settings.FEED_FANOUT_LIMIT,
+            ),
+        Value(user_id, IntegerField()),
+        F('id'),
+        F('author_id'),
+        F('pub_date'),
+        ))
+
+
+def unfollow(user_id, author_ids):
+    """Пользователь отписался от авторов."""
+
+    FeedEntry.objects.filter(
+        user_id=user_id, author_id__in=author_ids).delete()
+
+
+def refill(author_ids, delta):
+    """
+    У авторов стало на -delta подписчиков меньше. Те, у кого число
+    подписчиков опустилось до FEED_FANOUT_LIMIT, снова раскладываются
+    в ленты всех подписчиков вместе с рецептами, которые до этого
+    подмешивались при чтении.
+    """
+
+    limit = settings.FEED_FANOUT_LIMIT
+    fan_out(rows(
+        Recipe.objects.filter(
+            author_id__in=author_ids,
+            author__following__isnull=False,
+            author__followers_count__gt=limit + delta,
+            author__followers_count__lte=limit,
+            ),
+        F('author__following__user_id'),
+        F('id'),
+        F('author_id'),
+        F('pub_date'),
+        ))
+
+
+def rebuild():
+    """
+    Пересборка всех лент по подпискам, например после смены
+    FEED_FANOUT_LIMIT.
+    """
+
+    FeedEntry.objects.all().delete()
+    fan_out(rows(
+        Recipe.objects.filter(
+            author__following__isnull=False,
+            author__followers_count__lte=settings.FEED_FANOUT_LIMIT,
+            ),
+        F('author__following__user_id'),
+        F('id'),
+        F('author_id'),
+        F('pub_date'),
+        ))
+
+
+def entries(user):
+    """Записи ленты пользователя."""
+
+    return FeedEntry.objects.filter(user=user)
+
+
+def merged(user):
+    """
+    Рецепты авторов вне ленты, на которых подписан пользователь,
+    с теми же полями ключа, что у записей ленты.
+    """
+
+    return Recipe.objects.filter(author_id__in=Subscription.objects.filter(
+        user=user,
+        author__followers_count__gt=settings.FEED_FANOUT_LIMIT,
+        ).values('author_id')).annotate(recipe_id=F('id'))
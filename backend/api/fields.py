@@ -0,0 +1,71 @@
+from django.core.files.uploadedfile import UploadedFile
+from drf_extra_fields.fields import Base64ImageField
+from rest_framework import serializers
+
+from api import images
+
+
+def absolute(url, context):
+    request = context.get('request')
+    if url is None or request is None:
+        return url
+    return request.build_absolute_uri(url)
+
+
+class RecipeImageField(serializers.Field):
+    """
+    Ссылка на изображение рецепта в формате JPEG.
+    Размер берется из контекста image_size, иначе из аргумента size;
+    без размера и до готовности копий отдается оригинал.
+    """
+
+    def __init__(self, size=None, **kwargs):
+        self.size = size
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        size = self.context.get('image_size', self.size)
+        return absolute(images.image_url(recipe, size), self.context)
+
+
+class ImageVariantsField(serializers.Field):
+    """Ссылки на все копии изображения: {size: {format: url}} или null."""
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        urls = images.variant_urls(recipe)
+        if urls is None:
+            return None
+        return {
+            size: {
+                image_format: absolute(url, self.context)
+                for image_format, url in formats.items()
+                }
+            for size, formats in urls.items()
+            }
+
+
+class UploadedImageField(Base64ImageField):
+    """
+    Изображение строкой base64 в JSON или файлом из multipart/form-data.
+    Файлу дается случайное имя с расширением по сигнатуре формата,
+    как и декодированному из base64.
+    """
+
+    def to_internal_value(self, data):
+        if not isinstance(data, UploadedFile):
+            return super().to_internal_value(data)
+        data.seek(0)
+        extension = images.detect_extension(
+            data.read(images.SIGNATURE_LENGTH))
+        data.seek(0)
+        if extension is None:
+            raise serializers.ValidationError(self.INVALID_TYPE_MESSAGE)
+        data.name = f'{self.get_file_name(None)}.{extension}'
+        return serializers.ImageField.to_internal_value(self, data)
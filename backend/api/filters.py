@@ -1,7 +1,9 @@
-from django_filters.rest_framework import CharFilter, FilterSet
-from rest_framework.filters import SearchFilter
+from django.db.models import Exists, OuterRef
+from django_filters.rest_framework import CharFilter, ChoiceFilter, FilterSet
+from rest_framework.filters import BaseFilterBackend, SearchFilter
 
-from api.models import Recipe
+from api import ranking, search
+from api.models import Favorite, Recipe, ShoppingCart, Tag
 
 
 class IngredientSearchFilter(SearchFilter):
@@ -10,20 +12,79 @@ class IngredientSearchFilter(SearchFilter):
     search_param = 'name'
 
 
+class IngredientAutocompleteFilter(BaseFilterBackend):
+    """
+    Подсказки ингредиентов: сначала совпадения по началу названия,
+    затем по вхождению. Оба запроса ограничены параметром limit и
+    используют индексы по UPPER(name) на PostgreSQL.
+    """
+
+    search_param = 'name'
+    limit_param = 'limit'
+    default_limit = 10
+    max_limit = 50
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.query_params[self.limit_param])
+        except (KeyError, ValueError):
+            return self.default_limit
+        return max(1, min(limit, self.max_limit))
+
+    def filter_queryset(self, request, queryset, view):
+        name = request.query_params.get(self.search_param, '').strip()
+        limit = self.get_limit(request)
+        queryset = queryset.order_by('name')
+        if not name:
+            return list(queryset[:limit])
+        ingredients = list(queryset.filter(name__istartswith=name)[:limit])
+        if len(ingredients) < limit:
+            ingredients += queryset.filter(name__icontains=name).exclude(
+                name__istartswith=name)[:limit - len(ingredients)]
+        return ingredients
+
+
 class FavoritedAndshoppingCartAndAuthorAndTagFilter(FilterSet):
-    """Фильтрация по избранному, автору, списку покупок и тегам."""
+    """
+    Фильтрация по избранному, автору, списку покупок и тегам,
+    полнотекстовый поиск по названию и описанию (см. api.search),
+    сортировка по популярности (см. api.ranking).
+    Связанные таблицы проверяются полусоединениями вместо JOIN:
+    строки рецептов не размножаются, DISTINCT не нужен.
+    Теги проверяются коррелированным EXISTS при обходе индекса
+    (pub_date, id) до заполнения страницы. Избранное и корзину
+    проверяет подзапрос IN: PostgreSQL превращает его в полусоединение
+    по индексу (user, recipe) и сам выбирает порядок обхода. Exists в
+    Django 2.2 фильтруется только как аннотация (EXISTS(...) = true),
+    такое условие остается фильтром по хэшу подзапроса над всеми
+    рецептами и попадает в GROUP BY запроса COUNT.
+    """
 
     tags = CharFilter(field_name='tags__slug', method='filter_tags')
     is_favorited = CharFilter(method='filter_is_favorited')
     is_in_shopping_cart = CharFilter(method='filter_is_in_shopping_cart')
+    search = CharFilter(method='filter_search')
+    ordering = ChoiceFilter(
+        choices=[(name, name) for name in ranking.ORDERINGS],
+        method='filter_ordering',
+        )
 
     class Meta:
         model = Recipe
-        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart')
+        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart',
+                  'search', 'ordering')
 
     def filter_tags(self, queryset, slug, tags):
         tags = self.request.query_params.getlist('tags')
-        return queryset.filter(tags__slug__in=tags).distinct()
+        tag_ids = list(Tag.objects.filter(
+            slug__in=tags).values_list('id', flat=True))
+        if not tag_ids:
+            return queryset.none()
+        # В Django 2.2 Exists нужно аннотировать перед фильтрацией.
+        return queryset.annotate(has_tags=Exists(
+            Recipe.tags.through.objects.filter(
+                recipe_id=OuterRef('pk'), tag_id__in=tag_ids)
+            )).filter(has_tags=True)
 
     def filter_is_favorited(self, queryset, is_favorited, slug):
         user = self.request.user
@@ -31,9 +92,8 @@ class FavoritedAndshoppingCartAndAuthorAndTagFilter(FilterSet):
             return queryset
         is_favorited = self.request.query_params.get('is_favorited', )
         if is_favorited:
-            return queryset.filter(
-                favorites__user=self.request.user
-                ).distinct()
+            return queryset.filter(id__in=Favorite.objects.filter(
+                user=user).values('recipe_id'))
         return queryset
 
     def filter_is_in_shopping_cart(self, queryset, is_in_shopping_cart, slug):
@@ -44,7 +104,19 @@ class FavoritedAndshoppingCartAndAuthorAndTagFilter(FilterSet):
             'is_in_shopping_cart',
             )
         if is_in_shopping_cart:
-            return queryset.filter(
-                shopping_carts__user=self.request.user
-                ).distinct()
+            return queryset.filter(id__in=ShoppingCart.objects.filter(
+                user=user).values('recipe_id'))
         return queryset
+
+    def filter_search(self, queryset, name, query):
+        """Рецепты со всеми словами запроса, сначала самые релевантные."""
+
+        return search.matching(queryset, query)
+
+    def filter_ordering(self, queryset, name, ordering):
+        """
+        Сначала самые популярные рецепты: popular — за все время,
+        trending — за последние дни. Сортировка идет по индексу оценки.
+        """
+
+        return ranking.order(queryset, ordering)
@@ -0,0 +1,255 @@
+"""
+Уменьшенные копии изображений рецептов.
+
+Запрос только сохраняет оригинал и ставит задачу в очередь ImageTask
+в той же транзакции, что и рецепт. Обработчик process_images строит
+по ней копии всех размеров в WebP и JPEG рядом с оригиналом, имена
+копий выводятся из имени оригинала. Recipe.processed_image хранит
+оригинал, для которого копии готовы: пока он не совпадает с текущим
+изображением, API отдает оригинал.
+
+Оригиналы хранятся под хэшем содержимого и общие у рецептов с одинаковым
+изображением. ImageFile считает ссылки на файл, а файлы без ссылок
+удаляются с копиями по истечении GRACE_PERIOD.
+"""
+import os
+from collections import Counter, defaultdict
+from datetime import timedelta
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from api import cache
+from api.models import ImageFile, ImageTask, Recipe
+
+THUMBNAIL = 'thumbnail'
+CARD = 'card'
+FULL = 'full'
+SIZES = ((THUMBNAIL, 200), (CARD, 600), (FULL, 1600))
+WEBP = 'webp'
+JPEG = 'jpeg'
+FORMATS = ((WEBP, 'WEBP', 'webp'), (JPEG, 'JPEG', 'jpg'))
+QUALITY = 80
+VARIANTS_DIR = 'images/variants'
+MAX_ATTEMPTS = 3
+GRACE_PERIOD = 60 * 60
+SIGNATURES = (
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+    )
+SIGNATURE_LENGTH = max(len(signature) for signature, _ in SIGNATURES)
+
+
+def detect_extension(head):
+    """Расширение по первым байтам файла или None для других форматов."""
+
+    for signature, extension in SIGNATURES:
+        if head.startswith(signature):
+            return extension
+    return None
+
+
+def variant_name(name, size, image_format):
+    """Имя копии оригинала name нужного размера и формата."""
+
+    stem = os.path.splitext(os.path.basename(name))[0]
+    extension = dict((key, ext) for key, _, ext in FORMATS)[image_format]
+    return f'{VARIANTS_DIR}/{stem}_{size}.{extension}'
+
+
+def is_ready(recipe):
+    return bool(recipe.image) and recipe.processed_image == recipe.image.name
+
+
+def image_url(recipe, size=None, image_format=JPEG):
+    """Ссылка на копию размера size, пока ее нет — на оригинал."""
+
+    if not recipe.image:
+        return None
+    if size is None or not is_ready(recipe):
+        return recipe.image.url
+    return default_storage.url(
+        variant_name(recipe.image.name, size, image_format))
+
+
+def variant_urls(recipe):
+    """Ссылки на все копии {size: {format: url}} или None."""
+
+    if not is_ready(recipe):
+        return None
+    return {
+        size: {
+            image_format: default_storage.url(
+                variant_name(recipe.image.name, size, image_format))
+            for image_format, _, _ in FORMATS
+            }
+        for size, _ in SIZES
+        }
+
+
+def enqueue(recipe):
+    """Постановка изображения рецепта в очередь на обработку."""
+
+    return ImageTask.objects.create(recipe=recipe, source=recipe.image.name)
+
+
+def acquire(name):
+    """Новая ссылка рецепта на файл name."""
+
+    ImageFile.objects.bulk_create(
+        [ImageFile(name=name)], ignore_conflicts=True)
+    ImageFile.objects.filter(name=name).update(
+        references=F('references') + 1, updated=timezone.now())
+
+
+def release(*names):
+    """Рецепты больше не ссылаются на файлы names (имя — раз на ссылку)."""
+
+    groups = defaultdict(list)
+    for name, count in Counter(name for name in names if name).items():
+        groups[count].append(name)
+    for count, group in groups.items():
+        ImageFile.objects.filter(name__in=group).update(
+            references=Greatest(F('references') - Value(count), Value(0)),
+            updated=timezone.now(),
+            )
+
+
+def replace(old, new):
+    """Рецепт сменил изображение old на new."""
+
+    if old == new:
+        return
+    acquire(new)
+    release(old)
+
+
+def collect(grace=GRACE_PERIOD):
+    """
+    Удаление файлов, на которые дольше grace секунд нет ссылок,
+    вместе с их копиями. Выдержка защищает файл, который
+    повторно загружают, пока счетчик еще нулевой.
+    """
+
+    storage = Recipe._meta.get_field('image').storage
+    names = ImageFile.objects.filter(
+        references=0,
+        updated__lt=timezone.now() - timedelta(seconds=grace),
+        ).values_list('name', flat=True)
+    removed = 0
+    for name in list(names):
+        deleted, _ = ImageFile.objects.filter(
+            name=name, references=0).delete()
+        if deleted:
+            storage.delete(name)
+            delete_variants(name)
+            removed += 1
+    return removed
+
+
+def claim():
+    """
+    Следующая задача из очереди с отметкой о взятии в работу.
+    На PostgreSQL строки, взятые другими обработчиками, пропускаются.
+    """
+
+    with transaction.atomic():
+        task = ImageTask.objects.select_for_update(skip_locked=True).filter(
+            status=ImageTask.PENDING).order_by('id').first()
+        if task is None:
+            return None
+        task.status = ImageTask.PROCESSING
+        task.attempts += 1
+        task.save(update_fields=('status', 'attempts', 'updated'))
+    return task
+
+
+def release_stale(timeout):
+    """Возврат в очередь задач, брошенных упавшим обработчиком."""
+
+    return ImageTask.objects.filter(
+        status=ImageTask.PROCESSING,
+        updated__lt=timezone.now() - timedelta(seconds=timeout),
+        ).update(status=ImageTask.PENDING)
+
+
+def render(image, limit, pil_format):
+    copy = image.copy()
+    copy.thumbnail((limit, limit), Image.LANCZOS)
+    if pil_format == 'JPEG' and copy.mode != 'RGB':
+        copy = copy.convert('RGB')
+    elif copy.mode not in ('RGB', 'RGBA'):
+        copy = copy.convert('RGBA')
+    buffer = BytesIO()
+    copy.save(buffer, format=pil_format, quality=QUALITY, optimize=True)
+    return buffer.getvalue()
+
+
+def build_variants(name):
+    """
+    Запись копий всех размеров и форматов для оригинала name.
+    Копии оригинала, общего с другим рецептом, уже могут быть готовы.
+    """
+
+    targets = [
+        variant_name(name, size, image_format)
+        for size, _ in SIZES for image_format, _, _ in FORMATS
+        ]
+    if all(default_storage.exists(target) for target in targets):
+        return
+    with default_storage.open(name) as source:
+        image = Image.open(source)
+        image.load()
+    image = ImageOps.exif_transpose(image)
+    for size, limit in SIZES:
+        for image_format, pil_format, _ in FORMATS:
+            target = variant_name(name, size, image_format)
+            if default_storage.exists(target):
+                default_storage.delete(target)
+            default_storage.save(
+                target, ContentFile(render(image, limit, pil_format)))
+
+
+def delete_variants(name):
+    for size, _ in SIZES:
+        for image_format, _, _ in FORMATS:
+            default_storage.delete(variant_name(name, size, image_format))
+
+
+def process(task):
+    """
+    Обработка задачи. Задача по замененному с тех пор изображению
+    пропускается: для нового поставлена своя. Копии прежнего
+    изображения удаляются вместе с ним в collect.
+    """
+
+    recipe = Recipe.objects.filter(id=task.recipe_id).only(
+        'image', 'processed_image').first()
+    if recipe is not None and recipe.image.name == task.source:
+        build_variants(task.source)
+        updated = Recipe.objects.filter(
+            id=recipe.id, image=task.source
+            ).update(processed_image=task.source)
+        if updated:
+            cache.invalidate_recipe(recipe.id)
+    task.status = ImageTask.DONE
+    task.error = ''
+    task.save(update_fields=('status', 'error', 'updated'))
+
+
+def fail(task, error):
+    """Ошибка обработки: повтор до MAX_ATTEMPTS попыток."""
+
+    task.status = (
+        ImageTask.FAILED if task.attempts >= MAX_ATTEMPTS
+        else ImageTask.PENDING)
+    task.error = str(error)
+    task.save(update_fields=('status', 'error', 'updated'))
@@ -0,0 +1,823 @@
+import base64
+import json
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+from collections import namedtuple
+from datetime import date, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.tokens import default_token_generator
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection
+from django.test import Client
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from django.test.utils import (CaptureQueriesContext, override_settings,
+                               setup_test_environment,
+                               teardown_test_environment)
+from django.urls import URLResolver
+from djoser.utils import encode_uid
+from rest_framework.authtoken.models import Token
+
+from api import counters, feed, images, pantry, ranking, shopping_list, similar
+from api.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
+                        ShoppingCart, Tag)
+from users.models import Subscription, User
+
+PASSWORD = 'benchmark-password'
+# Слова описаний рецептов для сценариев поиска.
+WORDS = (
+    'борщ', 'суп', 'салат', 'пирог', 'каша', 'котлеты', 'плов', 'блины',
+    'курица', 'говядина', 'рыба', 'грибы', 'сыр', 'томаты', 'картофель',
+    'капуста', 'свекла', 'морковь', 'лук', 'чеснок', 'запеченный',
+    'жареный', 'тушеный', 'домашний', 'быстрый', 'праздничный',
+    )
+# Число id в одном запросе массового добавления и удаления.
+BULK_SIZE = 50
+
+# Допустимое число SQL-запросов на один вызов маршрута для набора
+# данных по умолчанию. Бюджет складывается из запросов, которые маршрут
+# должен делать по замыслу, а не из замеренных: лишний запрос в любой
+# части обработки выводит маршрут за бюджет.
+AUTH = 1  # токен вместе с пользователем
+ATOMIC = 1  # BEGIN транзакции, виден в счетчике на SQLite
+PAGE_COUNT = 1  # COUNT для постраничного вывода, у курсора его нет
+RECIPES = 3  # рецепты с авторами, их теги и состав
+FLAGS = 3  # подписки, избранное и корзина читателя для ответа
+CATALOG = 2  # версия справочника и сами записи
+VALIDATION = 2  # ингредиенты и теги рецепта, по запросу на каждые
+CONTENTS = 3  # рецепт, теги и состав, по вставке на каждые
+PANTRY = 2  # чтение и запись строк индекса продуктов
+RECIPE_LIST = AUTH + PAGE_COUNT + RECIPES + FLAGS
+RECIPE_CURSOR = AUTH + RECIPES + FLAGS
+TAG_FILTER = 1  # id тегов по slug
+SHOPPING_LIST = 3  # состав рецептов, вставка и правка строк списка
+CART = ATOMIC + 1 + SHOPPING_LIST + 1  # связь, список и оценка рецепта
+FAVORITE = ATOMIC + 1 + 1  # связь и счетчик с оценками рецепта
+SUBSCRIBE = ATOMIC + 1 + 1 + 1  # связь, счетчик подписчиков и лента
+# Отписка еще возвращает в ленты авторов, опустившихся до порога
+# раскладки FEED_FANOUT_LIMIT.
+UNSUBSCRIBE = SUBSCRIBE + 1
+BUDGETS = {
+    'api-root': 0,
+    'tag-list': CATALOG,
+    'tag-detail': CATALOG,
+    'ingredient-list': CATALOG,
+    'ingredient-search': CATALOG,
+    'ingredient-detail': CATALOG,
+    # Поиск по началу названия, затем по вхождению.
+    'ingredient-autocomplete': CATALOG + 1,
+    'recipes-list-anonymous': PAGE_COUNT + RECIPES,
+    'recipes-list': RECIPE_LIST,
+    'recipes-list-limit-50': RECIPE_LIST,
+    'recipes-list-cursor': RECIPE_CURSOR,
+    'recipes-filter-tags': RECIPE_LIST + TAG_FILTER,
+    'recipes-filter-tags-cursor': RECIPE_CURSOR + TAG_FILTER,
+    # Автор фильтра проверяется отдельным запросом.
+    'recipes-filter-author': RECIPE_LIST + 1,
+    'recipes-filter-favorited': RECIPE_LIST + TAG_FILTER,
+    'recipes-filter-shopping-cart': RECIPE_LIST,
+    'recipes-search': RECIPE_LIST,
+    'recipes-search-tags': RECIPE_LIST + TAG_FILTER,
+    'recipes-popular': RECIPE_LIST,
+    'recipes-trending-cursor': RECIPE_CURSOR,
+    'recipes-detail': AUTH + RECIPES + FLAGS,
+    # Счетчик рецептов автора, две ссылки на изображение и его задача,
+    # очередь похожих и лента подписчиков. Теги и состав для ответа
+    # уже известны.
+    'recipes-create': (
+        AUTH + VALIDATION + ATOMIC + CONTENTS + PANTRY + 1 + 1 + 3 + 1
+        + FLAGS),
+    'recipes-create-multipart': (
+        AUTH + VALIDATION + ATOMIC + CONTENTS + PANTRY + 1 + 1 + 3 + 1
+        + FLAGS),
+    # Теги те же, состав заменен целиком: чтение тегов и состава,
+    # вставка, выборка и удаление старых строк, корзины с рецептом,
+    # индекс продуктов, очередь похожих, сам рецепт, замена
+    # изображения с задачей обработки.
+    'recipes-update': (
+        AUTH + 1 + VALIDATION + ATOMIC + 2 + 3 + 1 + PANTRY + 1 + 1 + 4
+        + FLAGS),
+    # Меняется одно количество: чтение тегов и состава, одно
+    # обновление строки, корзины с рецептом и сам рецепт.
+    'recipes-update-one-amount': (
+        AUTH + 1 + VALIDATION + ATOMIC + 2 + 1 + 1 + 1 + FLAGS),
+    # Корзины с рецептом, индекс продуктов (состав, чтение и запись),
+    # каскад Django (две выборки и десять удалений), счетчик рецептов
+    # автора и ссылка на изображение.
+    'recipes-delete': AUTH + 1 + ATOMIC + 1 + 1 + PANTRY + 12 + 1 + 1,
+    'recipes-favorite-add': AUTH + FAVORITE,
+    'recipes-favorite-remove': AUTH + FAVORITE,
+    'recipes-shopping-cart-add': AUTH + CART,
+    'recipes-shopping-cart-remove': AUTH + CART,
+    # Записи ленты, рецепты из них и рецепты популярных авторов.
+    'recipes-feed': AUTH + 1 + 1 + RECIPES + FLAGS,
+    'recipes-pantry': AUTH + 1 + RECIPES + FLAGS,
+    'recipes-similar': AUTH + 1,
+    'recipes-favorite-bulk-add': AUTH + FAVORITE,
+    'recipes-favorite-bulk-remove': AUTH + FAVORITE,
+    'recipes-shopping-cart-bulk-add': AUTH + CART,
+    'recipes-shopping-cart-bulk-remove': AUTH + CART,
+    # Проверка пустого списка и сам список.
+    'recipes-download-shopping-cart': AUTH + 2,
+    'user-list': PAGE_COUNT + 1,
+    # Уникальность email и username, вставка.
+    'user-create': 2 + ATOMIC + 1,
+    'user-detail': AUTH + 1 + 1,
+    'user-me': AUTH + 1,
+    # Подписки с авторами, последние рецепты авторов и подписки
+    # читателя для ответа.
+    'user-subscriptions': AUTH + PAGE_COUNT + 1 + 1 + 1,
+    'user-subscriptions-cursor': AUTH + 1 + 1 + 1,
+    # Автор, подписки читателя и рецепты автора для ответа.
+    'user-subscribe-add': AUTH + SUBSCRIBE + 1 + 1 + 1,
+    'user-subscribe-remove': AUTH + UNSUBSCRIBE,
+    'user-subscribe-bulk-add': AUTH + SUBSCRIBE,
+    'user-subscribe-bulk-remove': AUTH + UNSUBSCRIBE,
+    'user-set-password': AUTH + 1,
+    'user-reset-password': 1,
+    'user-reset-password-confirm': 1 + 1,
+    'user-activation': 1 + 1,
+    'user-resend-activation': 1,
+    # Поиск пользователя (djoser и ModelBackend), токен и вход.
+    'login': 2 + 1 + ATOMIC + 1 + 1,
+    'logout': AUTH + ATOMIC + 1,
+}
+
+Case = namedtuple('Case', ('name', 'route', 'method', 'prepare', 'auth'))
+
+
+class Dataset:
+    """Синтетический набор данных и вспомогательные объекты для запросов."""
+
+    def __init__(self, options):
+        self.options = options
+        self.random = random.Random(options['seed'])
+        self.password_hash = make_password(PASSWORD)
+
+    def bulk(self, model, objects):
+        model.objects.bulk_create(objects)
+
+    def seed(self):
+        """Наполнение базы пакетными вставками с явными первичными ключами."""
+
+        options = self.options
+        rnd = self.random
+        self.bulk(User, [
+            User(id=i, username=f'user{i}', email=f'user{i}@example.com',
+                 first_name='Имя', last_name='Фамилия',
+                 password=self.password_hash)
+            for i in range(1, options['users'] + 1)
+            ])
+        self.user_ids = list(range(1, options['users'] + 1))
+        self.bulk(Tag, [
+            Tag(id=i, name=f'Тэг {i}', color=f'#{i:06X}', slug=f'tag{i}')
+            for i in range(1, options['tags'] + 1)
+            ])
+        self.tag_ids = list(range(1, options['tags'] + 1))
+        self.bulk(Ingredient, [
+            Ingredient(id=i, name=f'ингредиент {i}', measurement_unit='г')
+            for i in range(1, options['ingredients'] + 1)
+            ])
+        self.ingredient_ids = list(range(1, options['ingredients'] + 1))
+
+        today = date.today()
+        tags_through = Recipe.tags.through
+        chunk = options['batch_size']
+        for start in range(1, options['recipes'] + 1, chunk):
+            ids = range(start, min(start + chunk, options['recipes'] + 1))
+            recipes, amounts, tags = [], [], []
+            for recipe_id in ids:
+                recipes.append(Recipe(
+                    id=recipe_id, author_id=rnd.choice(self.user_ids),
+                    name=f'Рецепт {recipe_id} {rnd.choice(WORDS)}',
+                    text=' '.join(rnd.sample(WORDS, 6)),
+                    cooking_time=rnd.randint(1, 120),
+                    image='images/benchmark.png',
+                    pub_date=today - timedelta(days=rnd.randint(0, 365)),
+                    ))
+                amounts.extend(
+                    IngredientInRecipe(
+                        recipe_id=recipe_id, ingredient_id=ingredient_id,
+                        amount=rnd.randint(1, 500))
+                    for ingredient_id in rnd.sample(
+                        self.ingredient_ids,
+                        options['ingredients_per_recipe'])
+                    )
+                tags.extend(
+                    tags_through(recipe_id=recipe_id, tag_id=tag_id)
+                    for tag_id in rnd.sample(
+                        self.tag_ids, min(2, len(self.tag_ids)))
+                    )
+            self.bulk(Recipe, recipes)
+            self.bulk(IngredientInRecipe, amounts)
+            self.bulk(tags_through, tags)
+        self.recipe_ids = list(range(1, options['recipes'] + 1))
+
+        favorites, carts, subscriptions = [], [], []
+        for user_id in self.user_ids:
+            favorites.extend(
+                Favorite(user_id=user_id, recipe_id=recipe_id)
+                for recipe_id in self.sample(
+                    self.recipe_ids, options['favorites']))
+            carts.extend(
+                ShoppingCart(user_id=user_id, recipe_id=recipe_id)
+                for recipe_id in self.sample(
+                    self.recipe_ids, options['carts']))
+            subscriptions.extend(
+                Subscription(user_id=user_id, author_id=author_id)
+                for author_id in self.sample(
+                    self.user_ids, options['subscriptions'] + 1)
+                if author_id != user_id)
+        self.bulk(Favorite, favorites)
+        self.bulk(ShoppingCart, carts)
+        self.bulk(Subscription, subscriptions)
+        shopping_list.rebuild()
+
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [
+                    User, Tag, Ingredient, Recipe, IngredientInRecipe,
+                    tags_through, Favorite, ShoppingCart, Subscription]):
+                cursor.execute(sql)
+
+        self.user = User.objects.get(id=self.user_ids[0])
+        self.own_recipe = Recipe.objects.create(
+            author=self.user, name='Рецепт для изменения', text='Описание.',
+            cooking_time=10, image='images/benchmark.png')
+        self.set_recipe_contents(self.own_recipe)
+        # Изображение то же, что в теле запроса: правка одного количества
+        # не должна выглядеть как загрузка новой картинки.
+        self.wide_recipe = Recipe.objects.create(
+            author=self.user, name='Рецепт с большим составом',
+            text='Описание.', cooking_time=10, image=SimpleUploadedFile(
+                'benchmark.png', base64.b64decode(IMAGE.split(',', 1)[1])))
+        images.acquire(self.wide_recipe.image.name)
+        self.wide_recipe.tags.set(self.tag_ids[:2])
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(recipe=self.wide_recipe,
+                               ingredient_id=ingredient_id, amount=10)
+            for ingredient_id in self.ingredient_ids[:30]
+            )
+        counters.recount()
+        feed.rebuild()
+        pantry.rebuild()
+        similar.rebuild()
+        ranking.rebuild()
+        self.target_recipe = self.recipe_ids[-1]
+        self.target_author = self.user_ids[-1]
+
+    def sample(self, population, size):
+        return self.random.sample(population, min(size, len(population)))
+
+    def set_recipe_contents(self, recipe):
+        recipe.tags.set(self.tag_ids[:2])
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(recipe=recipe, ingredient_id=ingredient_id,
+                               amount=10)
+            for ingredient_id in self.ingredient_ids[
+                :self.options['ingredients_per_recipe']]
+            )
+
+    def recipe_payload(self):
+        return {
+            'name': 'Новый рецепт',
+            'text': 'Описание нового рецепта.',
+            'cooking_time': 15,
+            'image': IMAGE,
+            'tags': self.tag_ids[:2],
+            'ingredients': [
+                {'id': ingredient_id, 'amount': self.random.randint(1, 50)}
+                for ingredient_id in self.sample(
+                    self.ingredient_ids,
+                    self.options['ingredients_per_recipe'])
+                ],
+            }
+
+    def next_number(self):
+        self.counter = getattr(self, 'counter', 0) + 1
+        return self.counter
+
+    def fresh_user(self, **fields):
+        number = self.next_number()
+        return User.objects.create(
+            username=f'fresh{number}', email=f'fresh{number}@example.com',
+            first_name='Имя', last_name='Фамилия',
+            password=self.password_hash, **fields)
+
+
+# Минимальное валидное изображение PNG 1x1.
+IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAA'
+    'DUlEQVR42mP8z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg=='
+)
+
+
+class Scenarios:
+    """
+    Подготовка запросов для сценариев.
+    Каждый метод выполняется перед вызовом вне замера и возвращает
+    адрес, тело запроса и пользователя.
+    """
+
+    def __init__(self, ds):
+        self.ds = ds
+
+    def get(self, url):
+        return lambda: (url, None, self.ds.user)
+
+    def toggle(self, model, url, exists):
+        """Избранное или корзина в нужном состоянии перед вызовом."""
+
+        ds = self.ds
+
+        def prepare():
+            if exists:
+                model.objects.get_or_create(
+                    user=ds.user, recipe_id=ds.target_recipe)
+            else:
+                model.objects.filter(
+                    user=ds.user, recipe_id=ds.target_recipe).delete()
+            return url, None, ds.user
+        return prepare
+
+    def subscribe(self, exists):
+        ds = self.ds
+
+        def prepare():
+            if exists:
+                Subscription.objects.get_or_create(
+                    user=ds.user, author_id=ds.target_author)
+            else:
+                Subscription.objects.filter(
+                    user=ds.user, author_id=ds.target_author).delete()
+            return (f'/api/users/{ds.target_author}/subscribe/',
+                    None, ds.user)
+        return prepare
+
+    def bulk(self, model, field, url, exists):
+        """BULK_SIZE рецептов или авторов в нужном состоянии перед вызовом."""
+
+        ds = self.ds
+        population = ds.recipe_ids if field == 'recipe' else ds.user_ids[1:]
+        targets = population[-BULK_SIZE:]
+
+        def prepare():
+            model.objects.filter(
+                user=ds.user, **{f'{field}_id__in': targets}).delete()
+            if exists:
+                model.objects.bulk_create(
+                    model(user=ds.user, **{f'{field}_id': pk})
+                    for pk in targets)
+            return url, {'ids': targets}, ds.user
+        return prepare
+
+    def create_recipe(self):
+        return '/api/recipes/', self.ds.recipe_payload(), self.ds.user
+
+    def create_recipe_multipart(self):
+        """Тот же рецепт в multipart/form-data с изображением файлом."""
+
+        payload = self.ds.recipe_payload()
+        image = base64.b64decode(payload.pop('image').split(',')[1])
+        body = encode_multipart(BOUNDARY, {
+            'name': payload['name'],
+            'text': payload['text'],
+            'cooking_time': payload['cooking_time'],
+            'tags': json.dumps(payload['tags']),
+            'ingredients': json.dumps(payload['ingredients']),
+            'image': SimpleUploadedFile('image.png', image),
+            })
+        return '/api/recipes/', body, self.ds.user
+
+    def update_recipe(self):
+        return (f'/api/recipes/{self.ds.own_recipe.id}/',
+                self.ds.recipe_payload(), self.ds.user)
+
+    def update_one_amount(self):
+        """Тот же состав из 30 ингредиентов, изменено одно количество."""
+
+        recipe = self.ds.wide_recipe
+        amounts = dict(IngredientInRecipe.objects.filter(
+            recipe=recipe).values_list('ingredient_id', 'amount'))
+        amounts[min(amounts)] += 1
+        payload = dict(self.ds.recipe_payload(), ingredients=[
+            {'id': ingredient_id, 'amount': amount}
+            for ingredient_id, amount in amounts.items()
+            ])
+        return f'/api/recipes/{recipe.id}/', payload, self.ds.user
+
+    def delete_recipe(self):
+        victim = Recipe.objects.create(
+            author=self.ds.user, name='Рецепт для удаления',
+            text='Описание.', cooking_time=10, image='images/benchmark.png')
+        self.ds.set_recipe_contents(victim)
+        return f'/api/recipes/{victim.id}/', None, self.ds.user
+
+    def set_password(self):
+        return '/api/users/set_password/', {
+            'new_password': 'New-Benchmark-Password-123',
+            'current_password': PASSWORD}, self.ds.fresh_user()
+
+    def confirm(self, url, **data):
+        def prepare():
+            user = self.ds.fresh_user()
+            return url, dict(
+                uid=encode_uid(user.pk),
+                token=default_token_generator.make_token(user),
+                **data), None
+        return prepare
+
+    def activation(self):
+        user = self.ds.fresh_user(is_active=False)
+        return '/api/users/activation/', {
+            'uid': encode_uid(user.pk),
+            'token': default_token_generator.make_token(user)}, None
+
+    def create_user(self):
+        number = self.ds.next_number()
+        return '/api/users/', {
+            'username': f'created{number}',
+            'email': f'created{number}@example.com',
+            'first_name': 'Имя', 'last_name': 'Фамилия',
+            'password': 'Created-Password-123'}, None
+
+    def login(self):
+        return '/api/auth/token/login/', {
+            'email': self.ds.fresh_user().email, 'password': PASSWORD}, None
+
+    def logout(self):
+        return '/api/auth/token/logout/', None, self.ds.fresh_user()
+
+    def email(self, url):
+        return lambda: (url, {'email': self.ds.user.email}, None)
+
+
+def build_cases(ds):
+    """Сценарии для всех маршрутов api.urls и users.urls."""
+
+    scenarios = Scenarios(ds)
+    get = scenarios.get
+    toggle = scenarios.toggle
+    bulk = scenarios.bulk
+    confirm = scenarios.confirm
+    email = scenarios.email
+    recipe = ds.recipe_ids[0]
+    tags = '&'.join(f'tags=tag{tag}' for tag in ds.tag_ids[:2])
+    have = ','.join(str(ingredient) for ingredient in ds.ingredient_ids[:20])
+    favorite_url = f'/api/recipes/{ds.target_recipe}/favorite/'
+    cart_url = f'/api/recipes/{ds.target_recipe}/shopping_cart/'
+    return [
+        Case('api-root', 'api-root', 'get', get('/api/'), False),
+        Case('tag-list', 'tag-list', 'get', get('/api/tags/'), False),
+        Case('tag-detail', 'tag-detail', 'get',
+             get(f'/api/tags/{ds.tag_ids[0]}/'), False),
+        Case('ingredient-list', 'ingredient-list', 'get',
+             get('/api/ingredients/'), False),
+        Case('ingredient-search', 'ingredient-list', 'get',
+             get('/api/ingredients/?name=ингредиент%201'), False),
+        Case('ingredient-autocomplete', 'ingredient-autocomplete', 'get',
+             get('/api/ingredients/autocomplete/?name=1&limit=20'), False),
+        Case('ingredient-detail', 'ingredient-detail', 'get',
+             get(f'/api/ingredients/{ds.ingredient_ids[0]}/'), False),
+        Case('recipes-list-anonymous', 'recipes-list', 'get',
+             get('/api/recipes/'), False),
+        Case('recipes-list', 'recipes-list', 'get',
+             get('/api/recipes/'), True),
+        Case('recipes-list-limit-50', 'recipes-list', 'get',
+             get('/api/recipes/?limit=50'), True),
+        Case('recipes-list-cursor', 'recipes-list', 'get',
+             get('/api/recipes/?cursor=&limit=50'), True),
+        Case('recipes-filter-tags', 'recipes-list', 'get',
+             get(f'/api/recipes/?{tags}'), True),
+        Case('recipes-filter-tags-cursor', 'recipes-list', 'get',
+             get(f'/api/recipes/?cursor=&{tags}'), True),
+        Case('recipes-filter-author', 'recipes-list', 'get',
+             get(f'/api/recipes/?author={ds.target_author}'), True),
+        Case('recipes-filter-favorited', 'recipes-list', 'get',
+             get(f'/api/recipes/?is_favorited=1&{tags}'), True),
+        Case('recipes-filter-shopping-cart', 'recipes-list', 'get',
+             get('/api/recipes/?is_in_shopping_cart=1'), True),
+        Case('recipes-search', 'recipes-list', 'get',
+             get('/api/recipes/?search=борщ%20кап'), True),
+        Case('recipes-search-tags', 'recipes-list', 'get',
+             get(f'/api/recipes/?search=суп&{tags}'), True),
+        Case('recipes-popular', 'recipes-list', 'get',
+             get('/api/recipes/?ordering=popular'), True),
+        Case('recipes-trending-cursor', 'recipes-list', 'get',
+             get('/api/recipes/?ordering=trending&cursor=&limit=50'), True),
+        Case('recipes-detail', 'recipes-detail', 'get',
+             get(f'/api/recipes/{recipe}/'), True),
+        Case('recipes-create', 'recipes-list', 'post',
+             scenarios.create_recipe, True),
+        Case('recipes-create-multipart', 'recipes-list', 'post',
+             scenarios.create_recipe_multipart, True),
+        Case('recipes-update', 'recipes-detail', 'patch',
+             scenarios.update_recipe, True),
+        Case('recipes-update-one-amount', 'recipes-detail', 'patch',
+             scenarios.update_one_amount, True),
+        Case('recipes-delete', 'recipes-detail', 'delete',
+             scenarios.delete_recipe, True),
+        Case('recipes-favorite-add', 'recipes-favorite', 'post',
+             toggle(Favorite, favorite_url, False), True),
+        Case('recipes-favorite-remove', 'recipes-favorite', 'delete',
+             toggle(Favorite, favorite_url, True), True),
+        Case('recipes-shopping-cart-add', 'recipes-shopping_cart', 'post',
+             toggle(ShoppingCart, cart_url, False), True),
+        Case('recipes-shopping-cart-remove', 'recipes-shopping_cart',
+             'delete', toggle(ShoppingCart, cart_url, True), True),
+        Case('recipes-feed', 'recipes-feed', 'get',
+             get('/api/recipes/feed/?limit=20'), True),
+        Case('recipes-similar', 'recipes-similar', 'get',
+             get(f'/api/recipes/{recipe}/similar/'), True),
+        Case('recipes-pantry', 'recipes-pantry', 'get',
+             get(f'/api/recipes/pantry/?ingredients={have}&limit=20'), True),
+        Case('recipes-favorite-bulk-add', 'recipes-favorite-bulk', 'post',
+             bulk(Favorite, 'recipe', '/api/recipes/favorite/', False), True),
+        Case('recipes-favorite-bulk-remove', 'recipes-favorite-bulk',
+             'delete',
+             bulk(Favorite, 'recipe', '/api/recipes/favorite/', True), True),
+        Case('recipes-shopping-cart-bulk-add', 'recipes-shopping_cart-bulk',
+             'post', bulk(ShoppingCart, 'recipe',
+                          '/api/recipes/shopping_cart/', False), True),
+        Case('recipes-shopping-cart-bulk-remove',
+             'recipes-shopping_cart-bulk', 'delete',
+             bulk(ShoppingCart, 'recipe',
+                  '/api/recipes/shopping_cart/', True), True),
+        Case('recipes-download-shopping-cart',
+             'recipes-download_shopping_cart', 'get',
+             get('/api/recipes/download_shopping_cart/'), True),
+        Case('user-list', 'user-list', 'get', get('/api/users/'), False),
+        Case('user-create', 'user-list', 'post', scenarios.create_user, False),
+        Case('user-detail', 'user-detail', 'get',
+             get(f'/api/users/{ds.target_author}/'), True),
+        Case('user-me', 'user-me', 'get', get('/api/users/me/'), True),
+        Case('user-subscriptions', 'user-subscriptions', 'get',
+             get('/api/users/subscriptions/?recipes_limit=3'), True),
+        Case('user-subscriptions-cursor', 'user-subscriptions', 'get',
+             get('/api/users/subscriptions/?cursor=&recipes_limit=3'), True),
+        Case('user-subscribe-add', 'user-subscribe', 'post',
+             scenarios.subscribe(False), True),
+        Case('user-subscribe-remove', 'user-subscribe', 'delete',
+             scenarios.subscribe(True), True),
+        Case('user-subscribe-bulk-add', 'user-subscribe-bulk', 'post',
+             bulk(Subscription, 'author', '/api/users/subscribe/', False),
+             True),
+        Case('user-subscribe-bulk-remove', 'user-subscribe-bulk', 'delete',
+             bulk(Subscription, 'author', '/api/users/subscribe/', True),
+             True),
+        Case('user-set-password', 'user-set-password', 'post',
+             scenarios.set_password, True),
+        Case('user-reset-password', 'user-reset-password', 'post',
+             email('/api/users/reset_password/'), False),
+        Case('user-reset-password-confirm', 'user-reset-password-confirm',
+             'post',
+             confirm('/api/users/reset_password_confirm/',
+                     new_password='Reset-Password-123'),
+             False),
+        Case('user-activation', 'user-activation', 'post',
+             scenarios.activation, False),
+        Case('user-resend-activation', 'user-resend-activation', 'post',
+             email('/api/users/resend_activation/'), False),
+        Case('login', 'login', 'post', scenarios.login, False),
+        Case('logout', 'logout', 'post', scenarios.logout, True),
+    ]
+
+
+def route_names(patterns):
+    """Имена всех маршрутов модуля urls, включая вложенные."""
+
+    names = set()
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            names |= route_names(pattern.url_patterns)
+        elif pattern.name:
+            names.add(pattern.name)
+    return names
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(fraction * (len(values) - 1))))
+    return values[index]
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный прогон всех маршрутов api и users на синтетических '
+        'данных во временной тестовой базе: число запросов к БД, '
+        'задержки p50/p95 и выделенная память. Завершается ошибкой при '
+        'превышении бюджета запросов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--recipes', type=int, default=300)
+        parser.add_argument('--tags', type=int, default=8)
+        parser.add_argument('--ingredients', type=int, default=500)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--favorites', type=int, default=20,
+                            help='Избранных рецептов на пользователя.')
+        parser.add_argument('--carts', type=int, default=10,
+                            help='Рецептов в корзине на пользователя.')
+        parser.add_argument('--subscriptions', type=int, default=10,
+                            help='Подписок на пользователя.')
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='Число замеров задержки на маршрут.')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Рецептов в одной пачке при наполнении.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--only', nargs='*', default=None,
+                            help='Запустить только указанные сценарии.')
+        parser.add_argument('--output', default='benchmark.json',
+                            help='Путь для отчета в формате JSON.')
+        parser.add_argument('--keepdb', action='store_true',
+                            help='Не удалять тестовую базу после прогона.')
+        parser.add_argument('--explain', action='store_true',
+                            help='Снять планы SELECT-запросов каждого '
+                                 'сценария (на PostgreSQL с ANALYZE).')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        # Картинки, загруженные сценариями, не попадают в настоящий MEDIA_ROOT.
+        media_root = tempfile.mkdtemp()
+        try:
+            with override_settings(MEDIA_ROOT=media_root):
+                report = self.run(options)
+        finally:
+            connection.creation.destroy_test_db(
+                old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+            shutil.rmtree(media_root, ignore_errors=True)
+
+        with open(options['output'], 'w', encoding='utf-8') as output:
+            json.dump(report, output, ensure_ascii=False, indent=2)
+        self.stdout.write(f'Отчет записан в {options["output"]}')
+
+        failures = [
+            name for name, result in report['routes'].items()
+            if not result['within_budget'] or result['status'] >= 500
+            ]
+        if failures:
+            raise CommandError(
+                'Превышен бюджет запросов или ошибка сервера: '
+                + ', '.join(failures))
+
+    def run(self, options):
+        started = time.perf_counter()
+        ds = Dataset(options)
+        ds.seed()
+        seed_seconds = time.perf_counter() - started
+        self.stdout.write(f'Данные подготовлены за {seed_seconds:.1f} с')
+
+        cases = build_cases(ds)
+        if options['only']:
+            cases = [case for case in cases if case.name in options['only']]
+        routes = {}
+        for case in cases:
+            routes[case.name] = self.measure(
+                case, options['repeat'], options['explain'])
+            if 'error' in routes[case.name]:
+                self.stdout.write(self.style.ERROR(
+                    f'{case.name:32} {routes[case.name]["error"]}'))
+                continue
+            self.stdout.write(
+                '{name:32} {status} queries={queries:<3} budget={budget:<3} '
+                'cold={cold_ms:.1f}ms p50={p50_ms:.1f}ms p95={p95_ms:.1f}ms '
+                'memory={memory_kb:.0f}KiB'.format(
+                    name=case.name, **routes[case.name]))
+            self.write_plan(routes[case.name].get('plans'))
+
+        from api import urls as api_urls
+        from users import urls as users_urls
+        covered = {case.route for case in cases}
+        uncovered = sorted(
+            (route_names(api_urls.urlpatterns)
+             | route_names(users_urls.urlpatterns)) - covered)
+        if uncovered and not options['only']:
+            self.stdout.write(self.style.WARNING(
+                'Маршруты без сценария: ' + ', '.join(uncovered)))
+        return {
+            'vendor': connection.vendor,
+            'dataset': {
+                key: options[key] for key in (
+                    'users', 'recipes', 'tags', 'ingredients',
+                    'ingredients_per_recipe', 'favorites', 'carts',
+                    'subscriptions', 'seed')
+                },
+            'seed_seconds': round(seed_seconds, 3),
+            'repeat': options['repeat'],
+            'routes': routes,
+            'uncovered_routes': uncovered,
+        }
+
+    def write_plan(self, plans):
+        """Вывод плана самого долгого запроса сценария."""
+
+        if not plans:
+            return
+        slowest = max(plans, key=lambda plan: plan['time_ms'])
+        self.stdout.write(f'    {slowest["time_ms"]:.1f}ms {slowest["sql"]}')
+        for line in slowest['plan'].splitlines():
+            self.stdout.write(f'      {line}')
+
+    def call(self, case):
+        url, data, user = case.prepare()
+        client = Client()
+        if case.auth and user is not None:
+            token, _ = Token.objects.get_or_create(user=user)
+            client.defaults['HTTP_AUTHORIZATION'] = f'Token {token.key}'
+        if isinstance(data, bytes):
+            return lambda: client.generic(
+                case.method.upper(), url, data, MULTIPART_CONTENT)
+        kwargs = {}
+        if data is not None:
+            kwargs = {'data': json.dumps(data),
+                      'content_type': 'application/json'}
+        return lambda: getattr(client, case.method)(url, **kwargs)
+
+    def measure(self, case, repeat, explain=False):
+        """
+        Число запросов и время снимаются на холодном кэше,
+        задержки p50/p95 — на последующих вызовах.
+        """
+
+        for cache in caches.all():
+            cache.clear()
+        request = self.call(case)
+        try:
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = self.consume(request())
+                cold_ms = (time.perf_counter() - started) * 1000
+            captured = list(queries.captured_queries)
+        except Exception as error:
+            return {
+                'method': case.method.upper(),
+                'route': case.route,
+                'status': 500,
+                'error': repr(error),
+                'within_budget': False,
+            }
+
+        timings = []
+        for _ in range(repeat):
+            request = self.call(case)
+            started = time.perf_counter()
+            self.consume(request())
+            timings.append((time.perf_counter() - started) * 1000)
+
+        request = self.call(case)
+        tracemalloc.start()
+        self.consume(request())
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        budget = BUDGETS.get(case.name)
+        result = {
+            'method': case.method.upper(),
+            'route': case.route,
+            'status': response.status_code,
+            'queries': len(captured),
+            'budget': budget,
+            'within_budget': budget is None or len(captured) <= budget,
+            'cold_ms': round(cold_ms, 3),
+            'p50_ms': round(percentile(timings, 0.5), 3),
+            'p95_ms': round(percentile(timings, 0.95), 3),
+            'memory_kb': round(peak / 1024, 1),
+        }
+        if explain:
+            result['plans'] = [
+                {'sql': query['sql'], 'time_ms': float(query['time']) * 1000,
+                 'plan': self.explain(query['sql'])}
+                for query in captured
+                if query['sql'].lstrip().upper().startswith('SELECT')
+                ]
+        return result
+
+    def explain(self, sql):
+        """План запроса в текстовом виде для текущей СУБД."""
+
+        prefixes = {
+            'postgresql': 'EXPLAIN (ANALYZE, BUFFERS) ',
+            'sqlite': 'EXPLAIN QUERY PLAN ',
+            }
+        prefix = prefixes.get(connection.vendor, 'EXPLAIN ')
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + sql)
+            rows = cursor.fetchall()
+        return '\n'.join(str(row[-1]) for row in rows)
+
+    def consume(self, response):
+        """Потоковые ответы дочитываются, чтобы замер включал их генерацию."""
+
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
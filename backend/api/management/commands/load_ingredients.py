@@ -0,0 +1,133 @@
+import csv
+import io
+import json
+import os
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from api.models import Ingredient
+
+READ_CHUNK = 64 * 1024
+
+
+def iter_csv(file):
+    """Строки CSV без заголовка: название, единица измерения."""
+
+    for row in csv.reader(file):
+        if len(row) < 2:
+            continue
+        yield row[0].strip(), row[1].strip()
+
+
+def iter_json(file):
+    """
+    Потоковый разбор JSON-массива объектов вида
+    {"name": ..., "measurement_unit": ...} без загрузки файла целиком.
+    """
+
+    decoder = json.JSONDecoder()
+    buffer = file.read(READ_CHUNK).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('Ожидается JSON-массив ингредиентов.')
+    buffer = buffer[1:]
+    while True:
+        buffer = buffer.lstrip().lstrip(',').lstrip()
+        if buffer.startswith(']'):
+            return
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            chunk = file.read(READ_CHUNK)
+            if not chunk:
+                raise CommandError('Файл JSON обрывается посреди массива.')
+            buffer += chunk
+            continue
+        buffer = buffer[end:]
+        yield item['name'].strip(), item['measurement_unit'].strip()
+
+
+def batches(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Command(BaseCommand):
+    help = (
+        'Пакетная загрузка справочника ингредиентов из CSV или JSON. '
+        'Повторная загрузка не создает дубликатов по паре '
+        '(name, measurement_unit).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к файлу .csv или .json.')
+        parser.add_argument('--format', choices=('csv', 'json'),
+                            help='Формат файла, по умолчанию по расширению.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--no-copy', action='store_true',
+                            help='Не использовать COPY на PostgreSQL.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or os.path.splitext(
+            path)[1].lstrip('.').lower()
+        readers = {'csv': iter_csv, 'json': iter_json}
+        if file_format not in readers:
+            raise CommandError(f'Неизвестный формат файла: {path}')
+        use_copy = (connection.vendor == 'postgresql'
+                    and not options['no_copy'])
+        insert = self.insert_copy if use_copy else self.insert_bulk
+
+        started = time.perf_counter()
+        before = Ingredient.objects.count()
+        total = 0
+        with open(path, encoding='utf-8', newline='') as file:
+            for batch in batches(readers[file_format](file),
+                                 options['batch_size']):
+                with transaction.atomic():
+                    insert(batch)
+                total += len(batch)
+        created = Ingredient.objects.count() - before
+        seconds = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Прочитано {total} строк, добавлено {created} ингредиентов '
+            f'за {seconds:.2f} с ({total / max(seconds, 1e-9):.0f} строк/с).'
+        ))
+
+    def insert_bulk(self, batch):
+        Ingredient.objects.bulk_create(
+            [Ingredient(name=name, measurement_unit=unit)
+             for name, unit in batch],
+            ignore_conflicts=True,
+            )
+
+    def insert_copy(self, batch):
+        """COPY во временную таблицу и вставка без конфликтов."""
+
+        table = Ingredient._meta.db_table
+        data = io.StringIO()
+        csv.writer(data).writerows(batch)
+        data.seek(0)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMPORARY TABLE ingredient_load '
+                '(name varchar(200), measurement_unit varchar(200)) '
+                'ON COMMIT DROP'
+                )
+            cursor.copy_expert(
+                'COPY ingredient_load (name, measurement_unit) '
+                'FROM STDIN WITH (FORMAT csv)',
+                data,
+                )
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit, updated) '
+                'SELECT DISTINCT name, measurement_unit, now() '
+                'FROM ingredient_load '
+                'ON CONFLICT (name, measurement_unit) DO NOTHING'
+                )
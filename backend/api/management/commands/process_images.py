@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api import images
+
+
+class Command(BaseCommand):
+    help = (
+        'Обработчик очереди изображений рецептов: построение копий '
+        'thumbnail, card и full в форматах WebP и JPEG. Когда очередь '
+        'пуста, удаляются файлы, на которые не ссылается ни один рецепт.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Разобрать очередь и завершиться.')
+        parser.add_argument(
+            '--interval', type=float, default=2,
+            help='Пауза в секундах, когда очередь пуста.')
+        parser.add_argument(
+            '--stale', type=int, default=600,
+            help='Через сколько секунд вернуть в очередь зависшую задачу.')
+        parser.add_argument(
+            '--grace', type=int, default=images.GRACE_PERIOD,
+            help='Через сколько секунд без ссылок удалить файл.')
+
+    def handle(self, *args, **options):
+        processed = removed = 0
+        while True:
+            images.release_stale(options['stale'])
+            task = images.claim()
+            if task is None:
+                removed += images.collect(options['grace'])
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+                continue
+            try:
+                images.process(task)
+            except Exception as error:
+                images.fail(task, error)
+                self.stderr.write(
+                    f'Изображение {task.source}: {error}')
+            else:
+                processed += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано изображений: {processed}, '
+            f'удалено файлов без ссылок: {removed}.'))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api import cache, counters, feed, pantry, ranking, shopping_list
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчет денормализованных данных: числа добавлений рецептов '
+        'в избранное, числа рецептов и подписчиков автора, списков покупок, '
+        'лент подписок, индекса подбора по продуктам и оценок популярности.'
+    )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            recipes, users = counters.recount()
+            shopping_list.rebuild()
+            feed.rebuild()
+            pantry.rebuild()
+            ranking.rebuild()
+        cache.invalidate_shared()
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено счетчиков: рецептов {recipes}, '
+            f'пользователей {users}. Списки покупок, ленты, индекс '
+            f'продуктов и оценки популярности пересобраны.'
+        ))
@@ -0,0 +1,54 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api import similar
+
+
+class Command(BaseCommand):
+    help = (
+        'Расчет похожих рецептов по общим ингредиентам и тегам. '
+        'С --full пересчитывает все рецепты, иначе разбирает очередь '
+        'рецептов, у которых изменились состав или теги.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Пересчитать похожие для всех рецептов и завершиться.')
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Разобрать очередь и завершиться.')
+        parser.add_argument(
+            '--interval', type=float, default=60,
+            help='Пауза в секундах, когда очередь пуста.')
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Число процессов для расчета блоков рецептов.')
+        parser.add_argument(
+            '--chunk-size', type=int, default=similar.CHUNK_SIZE,
+            help='Число рецептов в блоке.')
+        parser.add_argument(
+            '--batch', type=int, default=1000,
+            help='Наибольшее число рецептов из очереди за один пересчет.')
+
+    def handle(self, *args, **options):
+        workers, chunk_size = options['workers'], options['chunk_size']
+        if options['full']:
+            started = time.perf_counter()
+            total = similar.rebuild(workers, chunk_size)
+            self.stdout.write(self.style.SUCCESS(
+                f'Похожие рассчитаны для {total} рецептов '
+                f'за {time.perf_counter() - started:.1f} с.'))
+            return
+        processed = 0
+        while True:
+            count = similar.update(workers, chunk_size, options['batch'])
+            processed += count
+            if count:
+                continue
+            if options['once']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитаны похожие для рецептов из очереди: {processed}.'))
@@ -0,0 +1,35 @@
+import mimetypes
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils._os import safe_join
+from django.views.static import serve
+
+from api.storage import is_content_addressed
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'public, max-age=3600'
+
+
+def serve_media(request, path):
+    """
+    Файлы из MEDIA_ROOT, которые nginx не отдает сам: за nginx сюда
+    попадают только имена не из хэша содержимого, файл отдается
+    по внутреннему адресу из X-Accel-Redirect. Без MEDIA_ACCEL_REDIRECT
+    (локальный запуск) файл отдает Django, имена из хэша содержимого
+    кэшируются бессрочно.
+    """
+
+    safe_join(settings.MEDIA_ROOT, path)
+    cache_control = IMMUTABLE if is_content_addressed(path) else REVALIDATE
+    if settings.MEDIA_ACCEL_REDIRECT:
+        content_type, _ = mimetypes.guess_type(path)
+        response = HttpResponse(
+            content_type=content_type or 'application/octet-stream')
+        response['X-Accel-Redirect'] = (
+            settings.MEDIA_ACCEL_REDIRECT + quote(path))
+    else:
+        response = serve(request, path, document_root=settings.MEDIA_ROOT)
+    response['Cache-Control'] = cache_control
+    return response
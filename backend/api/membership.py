@@ -0,0 +1,159 @@
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+from api.models import Favorite, ShoppingCart
+from users.models import Subscription
+
+TARGETS = {Favorite: 'recipe', ShoppingCart: 'recipe', Subscription: 'author'}
+NAMES = {
+    Favorite: 'favorites',
+    ShoppingCart: 'shopping_cart',
+    Subscription: 'following',
+    }
+
+
+class Membership:
+    """
+    Подписки, избранное и корзина текущего пользователя.
+    Каждое множество загружается одним запросом при первом обращении
+    и живет до конца запроса, либо до сброса методом invalidate.
+    """
+
+    def __init__(self, user):
+        self.user = user
+
+    def _ids(self, queryset, field):
+        if not self.user.is_authenticated:
+            return set()
+        return set(queryset.filter(
+            user=self.user).values_list(field, flat=True))
+
+    @cached_property
+    def following(self):
+        """id авторов, на которых подписан пользователь."""
+
+        return self._ids(Subscription.objects, 'author_id')
+
+    @cached_property
+    def favorites(self):
+        """id рецептов в избранном."""
+
+        return self._ids(Favorite.objects, 'recipe_id')
+
+    @cached_property
+    def shopping_cart(self):
+        """id рецептов в списке покупок."""
+
+        return self._ids(ShoppingCart.objects, 'recipe_id')
+
+    def invalidate(self, *names):
+        """Сброс загруженных множеств после изменения данных."""
+
+        for name in names:
+            self.__dict__.pop(name, None)
+
+
+def get_membership(request):
+    """Membership, общий для всех сериализаторов одного запроса."""
+
+    membership = getattr(request, '_membership', None)
+    if membership is None:
+        membership = Membership(request.user)
+        request._membership = membership
+    return membership
+
+
+def columns(model):
+    """Таблица связи, ее колонки user и цели и таблица цели с ключом."""
+
+    qn = connection.ops.quote_name
+    target = model._meta.get_field(TARGETS[model])
+    related = target.related_model._meta
+    return (
+        qn(model._meta.db_table),
+        qn(model._meta.get_field('user').column),
+        qn(target.column),
+        qn(related.db_table),
+        qn(related.pk.column),
+        )
+
+
+def created_column(model):
+    """Колонка времени добавления связи или None, если его нет."""
+
+    fields = {field.name: field for field in model._meta.concrete_fields}
+    if 'created' not in fields:
+        return None
+    return connection.ops.quote_name(fields['created'].column)
+
+
+def to_datetime(value):
+    """Время из RETURNING: SQLite отдает строку без часового пояса."""
+
+    if isinstance(value, str):
+        value = parse_datetime(value)
+    if settings.USE_TZ and timezone.is_naive(value):
+        return timezone.make_aware(value, timezone.utc)
+    return value
+
+
+def link(model, user_id, target_ids):
+    """
+    Добавление связей пользователя с целями (рецептами или авторами)
+    одним INSERT ... SELECT ... ON CONFLICT DO NOTHING. Существующие
+    связи и несуществующие цели пропускаются без ошибок при гонках.
+    Возвращает {id цели: время добавления} для действительно
+    добавленных связей (None, если время у связей не хранится).
+    """
+
+    target_ids = list(target_ids)
+    if not target_ids:
+        return {}
+    table, user_column, target_column, related, pk = columns(model)
+    created = created_column(model)
+    now = timezone.now() if created else None
+    extra_column, extra_value, extra_params = (
+        (f', {created}', ', %s',
+         [connection.ops.adapt_datetimefield_value(now)])
+        if created else ('', '', [])
+        )
+    placeholders = ', '.join(['%s'] * len(target_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ({user_column}, {target_column}'
+            f'{extra_column}) '
+            f'SELECT %s, {pk}{extra_value} FROM {related} '
+            f'WHERE {pk} IN ({placeholders}) '
+            f'ON CONFLICT DO NOTHING RETURNING {target_column}',
+            [user_id, *extra_params, *target_ids],
+            )
+        return {row[0]: now for row in cursor.fetchall()}
+
+
+def unlink(model, user_id, target_ids):
+    """
+    Удаление связей одним DELETE ... RETURNING.
+    Возвращает {id цели: время добавления} для действительно
+    удаленных связей (None, если время у связей не хранится).
+    """
+
+    target_ids = list(target_ids)
+    if not target_ids:
+        return {}
+    table, user_column, target_column, _, _ = columns(model)
+    created = created_column(model)
+    placeholders = ', '.join(['%s'] * len(target_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {table} WHERE {user_column} = %s '
+            f'AND {target_column} IN ({placeholders}) '
+            f'RETURNING {target_column}, {created or "NULL"}',
+            [user_id, *target_ids],
+            )
+        return {
+            target_id: to_datetime(moment) if created else None
+            for target_id, moment in cursor.fetchall()
+            }
@@ -0,0 +1,49 @@
+# Generated by Django 2.2.16 on 2026-10-18 16:46
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    """
+    Слияние повторяющихся ингредиентов перед добавлением ограничения
+    следующей миграцией: в PostgreSQL ALTER TABLE в одной транзакции
+    с правкой строк, на которые ссылаются внешние ключи, завершается
+    ошибкой pending trigger events. Ссылки из рецептов переносятся
+    на ингредиент с наименьшим id.
+    """
+
+    Ingredient = apps.get_model('api', 'Ingredient')
+    IngredientInRecipe = apps.get_model('api', 'IngredientInRecipe')
+    duplicates = Ingredient.objects.values(
+        'name', 'measurement_unit'
+        ).annotate(keep=Min('id'), total=Count('id')).filter(total__gt=1)
+    for duplicate in duplicates:
+        extra = Ingredient.objects.filter(
+            name=duplicate['name'],
+            measurement_unit=duplicate['measurement_unit'],
+            ).exclude(id=duplicate['keep'])
+        recipes = set(IngredientInRecipe.objects.filter(
+            ingredient_id=duplicate['keep']
+            ).values_list('recipe_id', flat=True))
+        for amount in IngredientInRecipe.objects.filter(
+                ingredient__in=extra):
+            if amount.recipe_id in recipes:
+                amount.delete()
+                continue
+            recipes.add(amount.recipe_id)
+            amount.ingredient_id = duplicate['keep']
+            amount.save(update_fields=('ingredient',))
+        extra.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_auto_20220619_1654'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_ingredients, migrations.RunPython.noop),
+    ]
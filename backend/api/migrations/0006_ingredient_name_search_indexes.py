@@ -0,0 +1,36 @@
+from django.db import migrations
+
+INDEXES = (
+    # Поиск по началу названия: UPPER("name"::text) LIKE UPPER('...%').
+    'CREATE INDEX IF NOT EXISTS api_ingredient_name_prefix '
+    'ON api_ingredient (UPPER(name::text) text_pattern_ops)',
+    # Поиск по вхождению: UPPER("name"::text) LIKE UPPER('%...%').
+    'CREATE INDEX IF NOT EXISTS api_ingredient_name_trgm '
+    'ON api_ingredient USING gin (UPPER(name::text) gin_trgm_ops)',
+)
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for sql in INDEXES:
+        schema_editor.execute(sql)
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS api_ingredient_name_prefix')
+    schema_editor.execute('DROP INDEX IF EXISTS api_ingredient_name_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_ingredient_unique_name_measurement_unit'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 2.2.16 on 2026-10-18 16:56
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    """Начальные значения счетчиков по существующим данным."""
+
+    Favorite = apps.get_model('api', 'Favorite')
+    Recipe = apps.get_model('api', 'Recipe')
+    User = apps.get_model('users', 'User')
+    favorites = Favorite.objects.filter(recipe=OuterRef('pk')).order_by(
+        ).values('recipe').annotate(total=Count('id')).values('total')
+    Recipe.objects.update(favorites_count=Coalesce(
+        Subquery(favorites, output_field=IntegerField()), 0))
+    recipes = Recipe.objects.filter(author=OuterRef('pk')).order_by(
+        ).values('author').annotate(total=Count('id')).values('total')
+    User.objects.update(recipes_count=Coalesce(
+        Subquery(recipes, output_field=IntegerField()), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_auto_20261018_1651'),
+        ('users', '0002_user_recipes_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 2.2.16 on 2026-10-18 17:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_auto_20261018_1659'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-pub_date', '-id'], name='recipe_author_pub_date_id_idx'),
+        ),
+        # Фильтр по тегам со стороны тега: автоматическая промежуточная
+        # таблица имеет только индекс (recipe_id, tag_id) и tag_id.
+        migrations.RunSQL(
+            'CREATE INDEX api_recipe_tags_tag_recipe_idx '
+            'ON api_recipe_tags (tag_id, recipe_id)',
+            'DROP INDEX api_recipe_tags_tag_recipe_idx',
+        ),
+    ]
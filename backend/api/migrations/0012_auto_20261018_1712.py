@@ -0,0 +1,53 @@
+# Generated by Django 2.2.16 on 2026-10-18 17:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def enqueue_images(apps, schema_editor):
+    """Существующие изображения ставятся в очередь на обработку."""
+
+    Recipe = apps.get_model('api', 'Recipe')
+    ImageTask = apps.get_model('api', 'ImageTask')
+    ImageTask.objects.bulk_create(
+        ImageTask(recipe_id=recipe_id, source=image)
+        for recipe_id, image in Recipe.objects.exclude(
+            image='').values_list('id', 'image').iterator()
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_recipe_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='processed_image',
+            field=models.CharField(blank=True, editable=False, max_length=100, verbose_name='Изображение с готовыми копиями'),
+        ),
+        migrations.CreateModel(
+            name='ImageTask',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=100, verbose_name='Оригинал')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('processing', 'Обрабатывается'), ('done', 'Готово'), ('failed', 'Ошибка')], default='pending', max_length=16, verbose_name='Состояние')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Попыток')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='Дата изменения')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='image_tasks', to='api.Recipe', verbose_name='Рецепт')),
+            ],
+            options={
+                'verbose_name': 'Обработка изображения',
+                'verbose_name_plural': 'Обработка изображений',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='imagetask',
+            index=models.Index(fields=['status', 'id'], name='image_task_status_id_idx'),
+        ),
+        migrations.RunPython(enqueue_images, migrations.RunPython.noop),
+    ]
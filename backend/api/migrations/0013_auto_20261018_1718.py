@@ -0,0 +1,46 @@
+# Generated by Django 2.2.16 on 2026-10-18 17:18
+
+import api.storage
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_references(apps, schema_editor):
+    """Счетчики ссылок для уже загруженных изображений."""
+
+    Recipe = apps.get_model('api', 'Recipe')
+    ImageFile = apps.get_model('api', 'ImageFile')
+    ImageFile.objects.bulk_create(
+        ImageFile(name=row['image'], references=row['total'])
+        for row in Recipe.objects.exclude(image='').values('image').annotate(
+            total=Count('id')).order_by()
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_auto_20261018_1712'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageFile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='Файл')),
+                ('references', models.PositiveIntegerField(default=0, verbose_name='Ссылок')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='Дата изменения')),
+            ],
+            options={
+                'verbose_name': 'Файл изображения',
+                'verbose_name_plural': 'Файлы изображений',
+            },
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(storage=api.storage.ContentAddressedStorage(), upload_to='images/', verbose_name='Изображение'),
+        ),
+        migrations.RunPython(count_references, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,71 @@
+from django.conf import settings
+from django.db import migrations
+
+POSTGRESQL = (
+    'ALTER TABLE api_recipe ADD COLUMN IF NOT EXISTS search_vector tsvector',
+    # Название весит больше описания при ранжировании.
+    'CREATE OR REPLACE FUNCTION api_recipe_search_vector() '
+    'RETURNS trigger AS $$ BEGIN '
+    'NEW.search_vector := '
+    "setweight(to_tsvector(%(config)s::regconfig, coalesce(NEW.name, '')), "
+    "'A') || "
+    "setweight(to_tsvector(%(config)s::regconfig, coalesce(NEW.text, '')), "
+    "'B'); "
+    'RETURN NEW; END $$ LANGUAGE plpgsql',
+    'DROP TRIGGER IF EXISTS api_recipe_search_vector ON api_recipe',
+    'CREATE TRIGGER api_recipe_search_vector '
+    'BEFORE INSERT OR UPDATE OF name, text ON api_recipe '
+    'FOR EACH ROW EXECUTE PROCEDURE api_recipe_search_vector()',
+    'UPDATE api_recipe SET search_vector = '
+    "setweight(to_tsvector(%(config)s::regconfig, coalesce(name, '')), 'A') "
+    "|| setweight(to_tsvector(%(config)s::regconfig, coalesce(text, '')), "
+    "'B')",
+    'CREATE INDEX IF NOT EXISTS api_recipe_search_vector_gin '
+    'ON api_recipe USING gin (search_vector)',
+)
+# Триггеры синхронизации создаются после каждого migrate
+# в api.search.install_triggers.
+SQLITE = (
+    'CREATE VIRTUAL TABLE IF NOT EXISTS api_recipe_search USING fts5('
+    "name, text, content='api_recipe', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    "INSERT INTO api_recipe_search (api_recipe_search) VALUES ('rebuild')",
+)
+
+
+def create_search(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        config = schema_editor.quote_value(settings.RECIPE_SEARCH_CONFIG)
+        for sql in POSTGRESQL:
+            schema_editor.execute(sql % {'config': config}, params=None)
+    elif vendor == 'sqlite':
+        for sql in SQLITE:
+            schema_editor.execute(sql, params=None)
+
+
+def drop_search(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            'DROP TRIGGER IF EXISTS api_recipe_search_vector ON api_recipe')
+        schema_editor.execute(
+            'DROP FUNCTION IF EXISTS api_recipe_search_vector()')
+        schema_editor.execute(
+            'ALTER TABLE api_recipe DROP COLUMN IF EXISTS search_vector')
+    elif vendor == 'sqlite':
+        for trigger in ('insert', 'delete', 'update'):
+            schema_editor.execute(
+                f'DROP TRIGGER IF EXISTS api_recipe_search_{trigger}')
+        schema_editor.execute('DROP TABLE IF EXISTS api_recipe_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_auto_20261018_1727'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search, drop_search),
+    ]
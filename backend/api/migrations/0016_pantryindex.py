@@ -0,0 +1,56 @@
+# Generated by Django 2.2.16 on 2026-10-18 17:44
+
+import sys
+from array import array
+
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+ID_BITS = 32
+SIZE_LIMIT = 0xFFFF
+
+
+def fill_pantry_index(apps, schema_editor):
+    """Индекс продуктов по составам существующих рецептов, см. api.pantry."""
+
+    PantryIndex = apps.get_model('api', 'PantryIndex')
+    Recipe = apps.get_model('api', 'Recipe')
+    IngredientInRecipe = apps.get_model('api', 'IngredientInRecipe')
+    sizes = dict(Recipe.objects.order_by().annotate(
+        size=Count('ingredientinrecipe')).values_list('id', 'size'))
+    index = {}
+    rows = IngredientInRecipe.objects.order_by().values_list(
+        'ingredient_id', 'recipe_id').iterator()
+    for ingredient_id, recipe_id in rows:
+        size = min(sizes[recipe_id], SIZE_LIMIT)
+        index.setdefault(ingredient_id, array('Q')).append(
+            (SIZE_LIMIT - size) << ID_BITS | recipe_id)
+    for ingredient_id, keys in index.items():
+        keys = array('Q', sorted(keys))
+        if sys.byteorder == 'big':
+            keys.byteswap()
+        PantryIndex.objects.create(
+            ingredient_id=ingredient_id, recipes=keys.tobytes())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_recipe_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PantryIndex',
+            fields=[
+                ('ingredient', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='pantry_index', serialize=False, to='api.Ingredient', verbose_name='Ингредиент')),
+                ('recipes', models.BinaryField(verbose_name='Рецепты')),
+            ],
+            options={
+                'verbose_name': 'Индекс ингредиента',
+                'verbose_name_plural': 'Индекс продуктов',
+            },
+        ),
+        migrations.RunPython(fill_pantry_index, migrations.RunPython.noop),
+    ]
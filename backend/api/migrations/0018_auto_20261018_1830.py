@@ -0,0 +1,82 @@
+# Generated by Django 2.2.16 on 2026-10-18 18:30
+
+import math
+from datetime import datetime
+
+from django.conf import settings
+from django.db import migrations, models
+import django.utils.timezone
+
+EPOCH = datetime(2022, 1, 1, tzinfo=django.utils.timezone.utc)
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+def log_sum(exponents):
+    """ln(sum(e ** x)) без переполнения."""
+
+    top = max(exponents)
+    return top + math.log(sum(math.exp(x - top) for x in exponents))
+
+
+def fill_scores(apps, schema_editor):
+    """Оценки популярности по избранному и корзинам, см. api.ranking."""
+
+    Recipe = apps.get_model('api', 'Recipe')
+    half_lives = {
+        'popular_score': settings.POPULAR_HALF_LIFE_DAYS * SECONDS_PER_DAY,
+        'trending_score': settings.TRENDING_HALF_LIFE_DAYS * SECONDS_PER_DAY,
+    }
+    seconds = {}
+    for model_name in ('Favorite', 'ShoppingCart'):
+        rows = apps.get_model('api', model_name).objects.order_by(
+            ).values_list('recipe_id', 'created').iterator()
+        for recipe_id, created in rows:
+            seconds.setdefault(recipe_id, []).append(
+                (created - EPOCH).total_seconds())
+    for recipe_id, values in seconds.items():
+        Recipe.objects.filter(id=recipe_id).update(**{
+            field: log_sum([value * math.log(2) / half_life
+                            for value in values])
+            for field, half_life in half_lives.items()
+        })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_auto_20261018_1752'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='favorite',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now, verbose_name='Дата добавления'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='popular_score',
+            field=models.FloatField(default=-1000000000.0, editable=False, verbose_name='Популярность'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='trending_score',
+            field=models.FloatField(default=-1000000000.0, editable=False, verbose_name='Популярность за последние дни'),
+        ),
+        migrations.AddField(
+            model_name='shoppingcart',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now, verbose_name='Дата добавления'),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-popular_score', '-id'], name='recipe_popular_score_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-trending_score', '-id'], name='recipe_trending_score_id_idx'),
+        ),
+        migrations.RunPython(fill_scores, migrations.RunPython.noop),
+    ]
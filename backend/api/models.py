@@ -2,8 +2,13 @@ from django.core.validators import MinValueValidator
 from django.db import models
 from django.utils.datetime_safe import date
 
+from api.storage import ContentAddressedStorage
 from users.models import User
 
+# Оценка популярности рецепта, который никто не добавлял в избранное
+# и список покупок, см. api.ranking.
+EMPTY_SCORE = -1e9
+
 
 class Tag(models.Model):
     """Модель тэгов рецептов."""
@@ -24,6 +29,11 @@ class Tag(models.Model):
         max_length=200,
         unique=True,
         )
+    updated = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True,
+        db_index=True,
+        )
 
     class Meta:
         verbose_name = 'Тэг'
@@ -44,10 +54,21 @@ class Ingredient(models.Model):
         verbose_name='Единица измерения',
         max_length=200,
         )
+    updated = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True,
+        db_index=True,
+        )
 
     class Meta:
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient_name_measurement_unit'
+                )
+            ]
 
     def __str__(self):
         return self.name
@@ -66,7 +87,17 @@ class Recipe(models.Model):
         )
     text = models.TextField(verbose_name='Описание',)
     name = models.CharField(verbose_name='Название', max_length=200,)
-    image = models.ImageField(verbose_name='Изображение', upload_to='images/')
+    image = models.ImageField(
+        verbose_name='Изображение',
+        upload_to='images/',
+        storage=ContentAddressedStorage(),
+        )
+    processed_image = models.CharField(
+        verbose_name='Изображение с готовыми копиями',
+        max_length=100,
+        blank=True,
+        editable=False,
+        )
     tags = models.ManyToManyField(
         Tag,
         related_name='recipe',
@@ -90,11 +121,40 @@ class Recipe(models.Model):
         verbose_name='Дата публикации',
         db_index=True
         )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        db_index=True,
+        verbose_name='В избранном',
+        )
+    popular_score = models.FloatField(
+        default=EMPTY_SCORE,
+        editable=False,
+        verbose_name='Популярность',
+        )
+    trending_score = models.FloatField(
+        default=EMPTY_SCORE,
+        editable=False,
+        verbose_name='Популярность за последние дни',
+        )
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
-        ordering = ['-pub_date']
+        ordering = ['-pub_date', '-id']
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'], name='recipe_pub_date_id_idx'),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='recipe_author_pub_date_id_idx'),
+            models.Index(
+                fields=['-popular_score', '-id'],
+                name='recipe_popular_score_id_idx'),
+            models.Index(
+                fields=['-trending_score', '-id'],
+                name='recipe_trending_score_id_idx'),
+            ]
 
 
 class IngredientInRecipe(models.Model):
@@ -141,6 +201,10 @@ class Favorite(models.Model):
         related_name="favorites",
         verbose_name='Рецепт',
         )
+    created = models.DateTimeField(
+        verbose_name='Дата добавления',
+        auto_now_add=True,
+        )
 
     class Meta:
         verbose_name = 'Избранное'
@@ -168,6 +232,10 @@ class ShoppingCart(models.Model):
         related_name="shopping_carts",
         verbose_name='Рецепт',
         )
+    created = models.DateTimeField(
+        verbose_name='Дата добавления',
+        auto_now_add=True,
+        )
 
     class Meta:
         verbose_name = 'Корзина'
@@ -178,3 +246,239 @@ class ShoppingCart(models.Model):
                 name='unique_shoppingCart_user_recipe'
                 )
             ]
+
+
+class ShoppingListItem(models.Model):
+    """
+    Сводный список покупок пользователя: сумма ингредиента
+    по всем рецептам в корзине. Поддерживается при изменении корзины
+    и состава рецептов, см. api.shopping_list.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="shopping_list",
+        verbose_name='Пользователь',
+        )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент',
+        )
+    amount = models.PositiveIntegerField(verbose_name='Кол-во',)
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Список покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_user_ingredient'
+                )
+            ]
+
+
+class FeedEntry(models.Model):
+    """
+    Лента подписок: рецепт автора, на которого подписан пользователь.
+    Заполняется при публикации рецепта и при подписке, см. api.feed.
+    Дата публикации и автор повторяют поля рецепта для чтения ленты
+    по одному индексу.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed',
+        verbose_name='Пользователь',
+        )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Рецепт',
+        )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор',
+        )
+    pub_date = models.DateField(verbose_name='Дата публикации',)
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Лента подписок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed_user_recipe'
+                )
+            ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-recipe'],
+                name='feed_user_pub_date_recipe_idx'),
+            ]
+
+
+class PantryIndex(models.Model):
+    """
+    Инвертированный индекс для подбора рецептов по продуктам:
+    отсортированный массив ключей рецептов, в которые входит ингредиент.
+    Поддерживается при изменении состава рецептов, см. api.pantry.
+    """
+
+    ingredient = models.OneToOneField(
+        Ingredient,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='pantry_index',
+        verbose_name='Ингредиент',
+        )
+    recipes = models.BinaryField(verbose_name='Рецепты',)
+
+    class Meta:
+        verbose_name = 'Индекс ингредиента'
+        verbose_name_plural = 'Индекс продуктов'
+
+
+class SimilarRecipe(models.Model):
+    """
+    Похожий рецепт по общим ингредиентам и тегам (коэффициент Жаккара).
+    Строится командой similar_recipes, см. api.similar.
+    """
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_recipes',
+        verbose_name='Рецепт',
+        )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Похожий рецепт',
+        )
+    score = models.FloatField(verbose_name='Сходство',)
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'similar'],
+                name='unique_similar_recipe'
+                )
+            ]
+        indexes = [
+            models.Index(
+                fields=['recipe', '-score'], name='similar_recipe_score_idx'),
+            ]
+
+
+class SimilarityTask(models.Model):
+    """
+    Рецепт, у которого изменились состав или теги: похожие для него
+    и для связанных с ним рецептов будут пересчитаны.
+    """
+
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='similarity_task',
+        verbose_name='Рецепт',
+        )
+    created = models.DateTimeField(
+        verbose_name='Дата создания',
+        auto_now_add=True,
+        )
+
+    class Meta:
+        verbose_name = 'Пересчет похожих рецептов'
+        verbose_name_plural = 'Пересчет похожих рецептов'
+
+
+class ImageTask(models.Model):
+    """
+    Очередь обработки изображений рецептов,
+    см. api.images и команду process_images.
+    """
+
+    PENDING = 'pending'
+    PROCESSING = 'processing'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'В очереди'),
+        (PROCESSING, 'Обрабатывается'),
+        (DONE, 'Готово'),
+        (FAILED, 'Ошибка'),
+        )
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='image_tasks',
+        verbose_name='Рецепт',
+        )
+    source = models.CharField(verbose_name='Оригинал', max_length=100,)
+    status = models.CharField(
+        verbose_name='Состояние',
+        max_length=16,
+        choices=STATUS_CHOICES,
+        default=PENDING,
+        )
+    attempts = models.PositiveSmallIntegerField(
+        verbose_name='Попыток',
+        default=0,
+        )
+    error = models.TextField(verbose_name='Ошибка', blank=True,)
+    created = models.DateTimeField(
+        verbose_name='Дата создания',
+        auto_now_add=True,
+        )
+    updated = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True,
+        )
+
+    class Meta:
+        verbose_name = 'Обработка изображения'
+        verbose_name_plural = 'Обработка изображений'
+        indexes = [
+            models.Index(
+                fields=['status', 'id'], name='image_task_status_id_idx'),
+            ]
+
+
+class ImageFile(models.Model):
+    """
+    Файл изображения в хранилище и число рецептов, которые на него
+    ссылаются. Файлы без ссылок удаляются вместе с копиями,
+    см. api.images.collect.
+    """
+
+    name = models.CharField(
+        verbose_name='Файл',
+        max_length=100,
+        unique=True,
+        )
+    references = models.PositiveIntegerField(
+        verbose_name='Ссылок',
+        default=0,
+        )
+    updated = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True,
+        )
+
+    class Meta:
+        verbose_name = 'Файл изображения'
+        verbose_name_plural = 'Файлы изображений'
+
+    def __str__(self):
+        return self.name
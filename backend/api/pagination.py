@@ -1,6 +1,218 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from operator import attrgetter
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.exceptions import ValidationError as BadRequest
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from api import ranking
 
 
 class LimitPageNumberPagination(PageNumberPagination):
     page_size = 6
     page_size_query_param = 'limit'
+
+
+class KeysetPagination(BasePagination):
+    """
+    Пагинация по ключу сортировки без OFFSET и подсчета количества.
+    Курсор — закодированные значения полей ordering у граничной записи
+    и направление; следующая страница выбирается условием
+    «строго после курсора», которое обслуживается составным индексом.
+    Последнее поле ordering должно быть уникальным.
+    """
+
+    page_size = 6
+    page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    ordering = ('-id',)
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def __init__(self, ordering=None, page_size=None):
+        if ordering is not None:
+            self.ordering = ordering
+        if page_size is not None:
+            self.page_size = page_size
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return page_size if page_size > 0 else self.page_size
+
+    def get_fields(self, reverse):
+        """Пары (поле, по убыванию) с учетом направления обхода."""
+
+        return [
+            (field.lstrip('-'), field.startswith('-') != reverse)
+            for field in self.ordering
+            ]
+
+    def decode_cursor(self, queryset, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode()))
+            model = queryset.model
+            values = [
+                model._meta.get_field(name).to_python(value)
+                for (name, _), value in zip(self.get_fields(False),
+                                            cursor['v'])
+                ]
+            if len(cursor['v']) != len(self.ordering):
+                raise ValueError
+            return values, bool(cursor['r'])
+        except (KeyError, TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, obj, reverse):
+        values = [
+            str(getattr(obj, name)) for name, _ in self.get_fields(False)]
+        cursor = urlsafe_b64encode(json.dumps(
+            {'v': values, 'r': int(reverse)}).encode()).decode()
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, cursor)
+
+    def after(self, fields, values):
+        """Условие «строго после values» для сортировки fields."""
+
+        (first, descending), *_ = fields
+        condition = Q()
+        for position, (name, descending_field) in enumerate(fields):
+            lookup = 'lt' if descending_field else 'gt'
+            equal = {
+                field: value for (field, _), value in zip(
+                    fields[:position], values[:position])
+                }
+            condition |= Q(**{f'{name}__{lookup}': values[position]},
+                           **equal)
+        bound = Q(**{f'{first}__{"lte" if descending else "gte"}':
+                     values[0]})
+        return bound & condition
+
+    def fetch(self, queryset, fields, values, size):
+        """Первые size записей queryset строго после values."""
+
+        queryset = queryset.order_by(*[
+            f'-{name}' if descending else name
+            for name, descending in fields
+            ])
+        if values is not None:
+            queryset = queryset.filter(self.after(fields, values))
+        return list(queryset[:size])
+
+    def merge(self, pages, fields, size):
+        """
+        Слияние страниц нескольких выборок в общем порядке fields.
+        Записи с одинаковым ключом из разных выборок берутся один раз.
+        """
+
+        rows = {}
+        for page in pages:
+            for row in page:
+                key = tuple(getattr(row, name) for name, _ in fields)
+                rows.setdefault(key, row)
+        rows = list(rows.values())
+        for name, descending in reversed(fields):
+            rows.sort(key=attrgetter(name), reverse=descending)
+        return rows[:size]
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.paginate_querysets([queryset], request)
+
+    def paginate_querysets(self, querysets, request):
+        """
+        Страница объединения выборок с общими полями ordering,
+        каждая выбирается своим проходом по индексу.
+        Курсор разбирается по модели первой выборки.
+        """
+
+        self.base_url = request.build_absolute_uri()
+        size = self.get_page_size(request)
+        values, reverse = self.decode_cursor(querysets[0], request)
+        fields = self.get_fields(reverse)
+        pages = [
+            self.fetch(queryset, fields, values, size + 1)
+            for queryset in querysets
+            ]
+        rows = (pages[0] if len(pages) == 1
+                else self.merge(pages, fields, size + 1))
+        has_more = len(rows) > size
+        rows = rows[:size]
+        if reverse:
+            rows.reverse()
+        has_next = has_more if not reverse else values is not None
+        has_previous = has_more if reverse else values is not None
+        self.next_link = (
+            self.encode_cursor(rows[-1], False)
+            if rows and has_next else None)
+        self.previous_link = (
+            self.encode_cursor(rows[0], True)
+            if rows and has_previous else None)
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.next_link),
+            ('previous', self.previous_link),
+            ('results', data),
+        ]))
+
+
+class OptionalKeysetPagination(LimitPageNumberPagination):
+    """
+    Постраничный вывод по номеру страницы, как ждет фронтенд.
+    При наличии параметра cursor (в том числе пустого) используется
+    пагинация по ключу keyset_ordering без подсчета общего количества.
+    """
+
+    cursor_query_param = 'cursor'
+    keyset_ordering = ('-id',)
+    keyset = None
+
+    def get_keyset_ordering(self, request):
+        return self.keyset_ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_query_param in request.query_params:
+            self.keyset = KeysetPagination(
+                ordering=self.get_keyset_ordering(request),
+                page_size=self.page_size)
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class RecipePagination(OptionalKeysetPagination):
+    keyset_ordering = ('-pub_date', '-id')
+    search_query_param = 'search'
+    search_cursor_message = (
+        'Результаты поиска выводятся по номеру страницы, '
+        'cursor вместе с search не поддерживается.')
+
+    def get_keyset_ordering(self, request):
+        """
+        С ordering=popular|trending ключ — оценка популярности и id.
+        Порядок релевантности поиска вычисляется при запросе и ключом
+        быть не может.
+        """
+
+        ordering = request.query_params.get('ordering')
+        if ordering in ranking.ORDERINGS:
+            return ranking.ORDERINGS[ordering]
+        if request.query_params.get(self.search_query_param, '').strip():
+            raise BadRequest(
+                {self.cursor_query_param: self.search_cursor_message})
+        return self.keyset_ordering
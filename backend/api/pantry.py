@@ -0,0 +1,199 @@
+"""
+Подбор рецептов по продуктам в наличии /api/recipes/pantry/.
+
+Для каждого ингредиента хранится отсортированный массив ключей рецептов,
+в которые он входит (PantryIndex). Ключ — 64-битное число: в старших
+битах дополнение числа ингредиентов рецепта до SIZE_LIMIT, в младших
+его id. Во всех массивах у рецепта один и тот же ключ, поэтому
+совпадения считаются по массивам запрошенных ингредиентов без обращения
+к IngredientInRecipe, а при равном числе совпадений больший ключ
+означает меньше недостающих ингредиентов, затем более новый рецепт.
+Массивы правятся при записи состава через RecipeSerializer и админку,
+команда recount пересобирает индекс.
+"""
+from itertools import islice
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Count
+
+from api.models import IngredientInRecipe, PantryIndex, Recipe
+
+ID_BITS = 32
+ID_MASK = (1 << ID_BITS) - 1
+SIZE_LIMIT = 0xFFFF
+# При выборе лучших число совпадений записывается над ключом рецепта.
+MATCHES_SHIFT = 48
+KEY_MASK = (1 << MATCHES_SHIFT) - 1
+DTYPE = np.dtype('<u8')
+BATCH_SIZE = 500
+
+
+def key(recipe_id, size):
+    """Ключ рецепта с size ингредиентами в массивах индекса."""
+
+    return (SIZE_LIMIT - min(size, SIZE_LIMIT)) << ID_BITS | recipe_id
+
+
+def unpack(recipe_key):
+    """Id рецепта и число его ингредиентов по ключу."""
+
+    return recipe_key & ID_MASK, SIZE_LIMIT - (recipe_key >> ID_BITS)
+
+
+def load(blob):
+    """Массив ключей из поля recipes без копирования."""
+
+    return np.frombuffer(blob, dtype=DTYPE)
+
+
+def dump(keys):
+    """Массив ключей для записи в поле recipes."""
+
+    return np.asarray(keys, dtype=DTYPE).tobytes()
+
+
+def locked_rows(ingredient_ids):
+    """
+    Строки индекса ингредиентов, заблокированные до конца транзакции.
+    Недостающие создаются пустыми, чтобы параллельные записи правили
+    одну и ту же строку, а не затирали друг друга.
+    """
+
+    rows = PantryIndex.objects.select_for_update().in_bulk(ingredient_ids)
+    missing = set(ingredient_ids) - rows.keys()
+    if missing:
+        PantryIndex.objects.bulk_create(
+            [PantryIndex(ingredient_id=ingredient_id, recipes=b'')
+             for ingredient_id in missing],
+            ignore_conflicts=True,
+            )
+        rows.update(
+            PantryIndex.objects.select_for_update().in_bulk(missing))
+    return rows
+
+
+def postings(changes):
+    """
+    Ключи, которые нужно убрать из массивов ингредиентов и добавить
+    в них: {ingredient_id: [ключи]}. Ключ рецепта меняется вместе
+    с числом ингредиентов, и тогда переписываются все его массивы.
+    """
+
+    removed = {}
+    added = {}
+    for recipe_id, (old, new) in changes.items():
+        old_key = key(recipe_id, len(old)) if old else None
+        new_key = key(recipe_id, len(new)) if new else None
+        for ingredient_id in old:
+            if old_key != new_key or ingredient_id not in new:
+                removed.setdefault(ingredient_id, []).append(old_key)
+        for ingredient_id in new:
+            if old_key != new_key or ingredient_id not in old:
+                added.setdefault(ingredient_id, []).append(new_key)
+    return removed, added
+
+
+def apply(changes):
+    """
+    Изменение состава рецептов: {recipe_id: (старые, новые id
+    ингредиентов)}. Затронутые массивы читаются и записываются
+    одним запросом каждый.
+    """
+
+    removed, added = postings(changes)
+    if not removed and not added:
+        return
+    with transaction.atomic(savepoint=False):
+        rows = locked_rows(list(removed.keys() | added.keys()))
+        for ingredient_id, row in rows.items():
+            keys = np.setdiff1d(
+                load(row.recipes),
+                np.array(removed.get(ingredient_id, []), dtype=DTYPE),
+                )
+            row.recipes = dump(np.union1d(
+                keys, np.array(added.get(ingredient_id, []), dtype=DTYPE)))
+        PantryIndex.objects.bulk_update(
+            rows.values(), ['recipes'], batch_size=BATCH_SIZE)
+
+
+def add_recipe(recipe_id, ingredient_ids):
+    """Новый рецепт."""
+
+    apply({recipe_id: ((), set(ingredient_ids))})
+
+
+def change_recipe(recipe_id, old_ingredient_ids, new_ingredient_ids):
+    """Состав рецепта изменился. Правка только количеств индекс не меняет."""
+
+    old = set(old_ingredient_ids)
+    new = set(new_ingredient_ids)
+    if old != new:
+        apply({recipe_id: (old, new)})
+
+
+def delete_recipes(recipe_ids):
+    """Рецепты удаляются: вызывается до удаления, пока состав на месте."""
+
+    changes = {recipe_id: (set(), ()) for recipe_id in recipe_ids}
+    rows = IngredientInRecipe.objects.filter(
+        recipe_id__in=recipe_ids).values_list('recipe_id', 'ingredient_id')
+    for recipe_id, ingredient_id in rows:
+        changes[recipe_id][0].add(ingredient_id)
+    apply(changes)
+
+
+def rebuild():
+    """Пересборка индекса по составам всех рецептов."""
+
+    sizes = dict(Recipe.objects.order_by().annotate(
+        size=Count('ingredientinrecipe')).values_list('id', 'size'))
+    index = {}
+    rows = IngredientInRecipe.objects.order_by().values_list(
+        'ingredient_id', 'recipe_id').iterator()
+    for ingredient_id, recipe_id in rows:
+        index.setdefault(ingredient_id, []).append(
+            key(recipe_id, sizes[recipe_id]))
+    PantryIndex.objects.all().delete()
+    items = iter(index.items())
+    while True:
+        batch = [
+            PantryIndex(
+                ingredient_id=ingredient_id,
+                recipes=dump(np.unique(np.array(keys, dtype=DTYPE))),
+                )
+            for ingredient_id, keys in islice(items, BATCH_SIZE)
+            ]
+        if not batch:
+            break
+        PantryIndex.objects.bulk_create(batch)
+
+
+def rank(ingredient_ids, limit):
+    """
+    limit рецептов, в которых больше всего ингредиентов из
+    ingredient_ids: [(recipe_id, совпало, всего ингредиентов)].
+    При равном числе совпадений выше рецепты, где меньше недостает.
+    Совпадения считает bincount по id рецептов, лучшие выбирает
+    argpartition без сортировки всех кандидатов.
+    """
+
+    arrays = [load(blob) for blob in PantryIndex.objects.filter(
+        ingredient_id__in=ingredient_ids).values_list('recipes', flat=True)]
+    if not arrays:
+        return []
+    keys = np.concatenate(arrays)
+    ids = (keys & np.uint64(ID_MASK)).astype(np.intp)
+    matches = np.bincount(ids)
+    recipe_keys = np.zeros(len(matches), dtype=DTYPE)
+    recipe_keys[ids] = keys
+    found = np.flatnonzero(matches)
+    scores = matches[found].astype(DTYPE) << np.uint64(MATCHES_SHIFT)
+    scores |= recipe_keys[found]
+    if len(scores) > limit:
+        scores = scores[np.argpartition(scores, -limit)[-limit:]]
+    ranked = []
+    for score in np.sort(scores)[::-1].tolist():
+        recipe_id, size = unpack(score & KEY_MASK)
+        ranked.append((recipe_id, score >> MATCHES_SHIFT, size))
+    return ranked
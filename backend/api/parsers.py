@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import MultiPartParser
+
+from api.images import SIGNATURE_LENGTH, detect_extension
+
+
+class ImageUploadHandler(TemporaryFileUploadHandler):
+    """
+    Файл пишется во временный файл по мере чтения запроса.
+    Сигнатура формата проверяется по первым байтам, размер —
+    по каждой части, так что неподходящая загрузка прерывается сразу.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.size = 0
+        self.head = b''
+
+    def check_signature(self):
+        if detect_extension(self.head) is None:
+            raise ValidationError({self.field_name: [
+                'Поддерживаются изображения JPEG, PNG и GIF.']})
+
+    def receive_data_chunk(self, raw_data, start):
+        self.size += len(raw_data)
+        if self.size > settings.RECIPE_IMAGE_MAX_SIZE:
+            raise ValidationError({self.field_name: [
+                'Изображение больше '
+                f'{settings.RECIPE_IMAGE_MAX_SIZE // 1024 // 1024} МБ.']})
+        if len(self.head) < SIGNATURE_LENGTH:
+            self.head += raw_data[:SIGNATURE_LENGTH - len(self.head)]
+            if len(self.head) >= SIGNATURE_LENGTH:
+                self.check_signature()
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        self.check_signature()
+        return super().file_complete(file_size)
+
+
+class RecipeMultiPartParser(MultiPartParser):
+    """
+    Рецепт в multipart/form-data: изображение передается файлом
+    и пишется на диск по частям через ImageUploadHandler.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = parser_context['request']
+        request.upload_handlers = [ImageUploadHandler(request)]
+        return super().parse(stream, media_type, parser_context)
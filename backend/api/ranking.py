@@ -0,0 +1,148 @@
+"""
+Популярные и набирающие популярность рецепты: ?ordering=popular|trending.
+
+Добавление рецепта в избранное или список покупок в момент t весит
+2 ** ((t - EPOCH) / период полураспада). Относительно текущего момента
+вклад события затухает экспоненциально, но отношение весов двух
+событий со временем не меняется: порядок рецептов по сумме весов
+в любой момент тот же, что по затухающей оценке. Поэтому оценки
+не пересчитываются по расписанию, а сортировка идет по индексу
+колонки. Сумма растет экспоненциально, в Recipe хранится ее
+натуральный логарифм. Добавление и удаление меняют его одним UPDATE
+без чтения таблиц избранного и корзины, команда recount пересчитывает
+оценки по этим таблицам.
+"""
+import math
+from datetime import datetime
+from itertools import chain
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Case, F, FloatField, Value, When
+from django.db.models.functions import Abs, Exp, Greatest, Ln
+from django.utils import timezone
+
+from api.models import EMPTY_SCORE, Favorite, Recipe, ShoppingCart
+
+EPOCH = datetime(2022, 1, 1, tzinfo=timezone.utc)
+SECONDS_PER_DAY = 24 * 60 * 60
+# PostgreSQL считает exp от меньших аргументов ошибкой, а не нулем.
+EXP_MIN = -700.0
+# Если после удаления остается меньше этой доли суммы, событий
+# у рецепта не осталось, разница — погрешность вычислений.
+EMPTY_GAP = 1e-6
+BATCH_SIZE = 1000
+ORDERINGS = {
+    'popular': ('-popular_score', '-id'),
+    'trending': ('-trending_score', '-id'),
+    }
+
+
+def half_lives():
+    """Поля оценок и их периоды полураспада в секундах."""
+
+    return {
+        'popular_score': settings.POPULAR_HALF_LIFE_DAYS * SECONDS_PER_DAY,
+        'trending_score': settings.TRENDING_HALF_LIFE_DAYS * SECONDS_PER_DAY,
+        }
+
+
+def exponent(moment, half_life):
+    """Логарифм веса события в момент moment."""
+
+    return (moment - EPOCH).total_seconds() * math.log(2) / half_life
+
+
+def value_of(values):
+    """Выражение со значением values[id рецепта] для каждой строки."""
+
+    distinct = set(values.values())
+    if len(distinct) == 1:
+        return Value(distinct.pop(), output_field=FloatField())
+    return Case(
+        *[When(id=recipe_id, then=Value(value))
+          for recipe_id, value in values.items()],
+        output_field=FloatField(),
+        )
+
+
+def added(field, value):
+    """ln(e ** field + e ** value) без переполнения."""
+
+    return Greatest(F(field), value) + Ln(1.0 + Exp(Greatest(
+        -Abs(F(field) - value), Value(EXP_MIN))))
+
+
+def removed(field, value):
+    """ln(e ** field - e ** value), пустая оценка, если событий не осталось."""
+
+    return Case(
+        When(**{f'{field}__lt': value + EMPTY_GAP},
+             then=Value(EMPTY_SCORE)),
+        default=F(field) + Ln(1.0 - Exp(Greatest(
+            value - F(field), Value(EXP_MIN)))),
+        output_field=FloatField(),
+        )
+
+
+def updates(times, delta):
+    """
+    Выражения UPDATE для оценок рецептов times {recipe_id: время
+    добавления}, которые добавлены (delta > 0) в избранное или список
+    покупок одного пользователя или убраны оттуда.
+    """
+
+    combine = added if delta > 0 else removed
+    return {
+        field: combine(field, value_of({
+            recipe_id: exponent(moment, half_life)
+            for recipe_id, moment in times.items()
+            }))
+        for field, half_life in half_lives().items()
+        }
+
+
+def change(times, delta):
+    """Изменение оценок отдельным UPDATE, см. updates."""
+
+    if times:
+        Recipe.objects.filter(id__in=list(times)).update(
+            **updates(times, delta))
+
+
+def order(queryset, name):
+    """Рецепты в порядке оценки name: сначала самые популярные."""
+
+    return queryset.order_by(*ORDERINGS[name])
+
+
+def rebuild():
+    """Пересчет оценок всех рецептов по избранному и спискам покупок."""
+
+    rows = chain.from_iterable(
+        model.objects.order_by().values_list(
+            'recipe_id', 'created').iterator()
+        for model in (Favorite, ShoppingCart)
+        )
+    recipe_ids, seconds = [], []
+    for recipe_id, created in rows:
+        recipe_ids.append(recipe_id)
+        seconds.append((created - EPOCH).total_seconds())
+    recipe_ids = np.array(recipe_ids, dtype=np.int64)
+    positions = np.argsort(recipe_ids, kind='stable')
+    seconds = np.array(seconds, dtype=np.float64)[positions]
+    found, starts = np.unique(recipe_ids[positions], return_index=True)
+    Recipe.objects.update(**{field: EMPTY_SCORE for field in half_lives()})
+    if not len(found):
+        return
+    scores = {
+        field: np.logaddexp.reduceat(
+            seconds * (math.log(2) / half_life), starts).tolist()
+        for field, half_life in half_lives().items()
+        }
+    recipes = [
+        Recipe(id=recipe_id, **{
+            field: values[position] for field, values in scores.items()})
+        for position, recipe_id in enumerate(found.tolist())
+        ]
+    Recipe.objects.bulk_update(recipes, list(scores), batch_size=BATCH_SIZE)
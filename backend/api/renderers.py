@@ -0,0 +1,161 @@
+import csv
+import json
+import os
+from abc import ABCMeta, abstractmethod
+from io import BytesIO
+
+from django.conf import settings
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+CHUNK_SIZE = 64 * 1024
+PDF_FONT_NAME = 'ShoppingList'
+
+
+class Echo:
+    """Буфер для csv.writer: записанная строка просто возвращается."""
+
+    def write(self, value):
+        return value
+
+
+def chunked(pieces):
+    """Склейка мелких строк в части ответа размером около CHUNK_SIZE."""
+
+    buffer, size = [], 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= CHUNK_SIZE:
+            yield ''.join(buffer).encode()
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer).encode()
+
+
+class ShoppingListRenderer(BaseRenderer, metaclass=ABCMeta):
+    """
+    Базовый формат выгрузки списка покупок.
+    Файл отдается методом stream по строкам (name, amount, unit);
+    render используется только для ответов с ошибкой.
+    """
+
+    charset = 'utf-8'
+    extension = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return JSONRenderer().render(data)
+
+    @abstractmethod
+    def stream(self, rows):
+        """Части файла в байтах по строкам (name, amount, unit)."""
+
+    @property
+    def content_type(self):
+        if self.charset:
+            return f'{self.media_type}; charset={self.charset}'
+        return self.media_type
+
+
+class TextShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+    extension = 'txt'
+
+    def stream(self, rows):
+        return chunked(
+            f'{name}: {amount} {unit}\r\n' for name, amount, unit in rows)
+
+
+class CSVShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+    extension = 'csv'
+
+    def stream(self, rows):
+        writer = csv.writer(Echo())
+        yield writer.writerow(('name', 'amount', 'measurement_unit')).encode()
+        yield from chunked(
+            writer.writerow((name, amount, unit))
+            for name, amount, unit in rows)
+
+
+class JSONShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'application/json'
+    format = 'json'
+    extension = 'json'
+
+    def stream(self, rows):
+        def pieces():
+            separator = '['
+            for name, amount, unit in rows:
+                yield separator + json.dumps(
+                    {'name': name, 'amount': amount,
+                     'measurement_unit': unit},
+                    ensure_ascii=False)
+                separator = ','
+            yield ']' if separator == ',' else '[]'
+
+        return chunked(pieces())
+
+
+class PDFShoppingListRenderer(ShoppingListRenderer):
+    """
+    PDF собирается по страницам из курсора, но таблица ссылок
+    пишется в конец файла, поэтому документ отдается после сборки.
+    """
+
+    media_type = 'application/pdf'
+    format = 'pdf'
+    extension = 'pdf'
+    charset = None
+    render_style = 'binary'
+    margin = 50
+    line_height = 16
+    font_size = 12
+
+    def get_font(self):
+        """Шрифт с кириллицей из настроек, иначе встроенный Helvetica."""
+
+        path = settings.SHOPPING_LIST_PDF_FONT
+        if PDF_FONT_NAME in pdfmetrics.getRegisteredFontNames():
+            return PDF_FONT_NAME
+        if path and os.path.exists(path):
+            pdfmetrics.registerFont(TTFont(PDF_FONT_NAME, path))
+            return PDF_FONT_NAME
+        return 'Helvetica'
+
+    def stream(self, rows):
+        buffer = BytesIO()
+        font = self.get_font()
+        _, height = A4
+        document = canvas.Canvas(buffer, pagesize=A4)
+        document.setTitle('Список покупок')
+        document.setFont(font, self.font_size + 4)
+        document.drawString(self.margin, height - self.margin,
+                            'Список покупок')
+        y = height - self.margin - 2 * self.line_height
+        document.setFont(font, self.font_size)
+        for name, amount, unit in rows:
+            if y < self.margin:
+                document.showPage()
+                document.setFont(font, self.font_size)
+                y = height - self.margin
+            document.drawString(self.margin, y, f'{name}: {amount} {unit}')
+            y -= self.line_height
+        document.save()
+        buffer.seek(0)
+        return iter(lambda: buffer.read(CHUNK_SIZE), b'')
+
+
+SHOPPING_LIST_RENDERERS = (
+    TextShoppingListRenderer,
+    CSVShoppingListRenderer,
+    JSONShoppingListRenderer,
+    PDFShoppingListRenderer,
+)
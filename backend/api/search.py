@@ -0,0 +1,119 @@
+"""
+Полнотекстовый поиск рецептов по названию и описанию.
+
+На PostgreSQL у api_recipe есть колонка search_vector с GIN-индексом,
+ее заполняет триггер: название с весом A, описание с весом B.
+На SQLite рядом с таблицей рецептов лежит виртуальная таблица FTS5
+api_recipe_search, которую синхронизируют триггеры. Django пересоздает
+таблицу на SQLite при изменении схемы и теряет триггеры, поэтому они
+восстанавливаются после каждого migrate. Каждое слово запроса ищется
+по префиксу, результаты упорядочены по релевантности.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection, connections
+from django.db.models import FloatField, Q
+from django.db.models.expressions import RawSQL
+
+from api.models import Recipe
+
+SQLITE_TABLE = 'api_recipe_search'
+SQLITE_TRIGGERS = (
+    f'CREATE TRIGGER IF NOT EXISTS {SQLITE_TABLE}_insert '
+    f'AFTER INSERT ON api_recipe BEGIN '
+    f'INSERT INTO {SQLITE_TABLE} (rowid, name, text) '
+    f'VALUES (new.id, new.name, new.text); END',
+    f'CREATE TRIGGER IF NOT EXISTS {SQLITE_TABLE}_delete '
+    f'AFTER DELETE ON api_recipe BEGIN '
+    f'INSERT INTO {SQLITE_TABLE} ({SQLITE_TABLE}, rowid, name, text) '
+    f"VALUES ('delete', old.id, old.name, old.text); END",
+    f'CREATE TRIGGER IF NOT EXISTS {SQLITE_TABLE}_update '
+    f'AFTER UPDATE OF name, text ON api_recipe BEGIN '
+    f'INSERT INTO {SQLITE_TABLE} ({SQLITE_TABLE}, rowid, name, text) '
+    f"VALUES ('delete', old.id, old.name, old.text); "
+    f'INSERT INTO {SQLITE_TABLE} (rowid, name, text) '
+    f'VALUES (new.id, new.name, new.text); END',
+)
+# Вес совпадения в названии относительно описания для bm25 на SQLite.
+SQLITE_NAME_WEIGHT = 4.0
+
+
+def terms(query):
+    """Слова запроса без знаков препинания и операторов."""
+
+    return re.findall(r'\w+', query.lower())
+
+
+def postgresql(queryset, words):
+    """
+    Совпадения по search_vector через GIN-индекс и ранг ts_rank.
+    Ранг только сортирует: подсчет количества его не вычисляет.
+    """
+
+    table = connection.ops.quote_name(Recipe._meta.db_table)
+    params = (
+        settings.RECIPE_SEARCH_CONFIG,
+        ' & '.join(f'{word}:*' for word in words),
+        )
+    tsquery = 'to_tsquery(%s::regconfig, %s)'
+    return queryset.extra(
+        where=[f'{table}.search_vector @@ {tsquery}'],
+        params=params,
+        ), RawSQL(f'ts_rank({table}.search_vector, {tsquery})', params,
+                  output_field=FloatField())
+
+
+def sqlite(queryset, words):
+    """Совпадения по таблице FTS5 и ранг bm25 с перевесом названия."""
+
+    table = connection.ops.quote_name(Recipe._meta.db_table)
+    match = ' '.join(f'"{word}"*' for word in words)
+    # RawSQL в id__in оборачивается в лишние скобки, и SQLite
+    # принимает подзапрос за скалярный: берется только первая строка.
+    return queryset.extra(
+        where=[f'{table}.id IN (SELECT rowid FROM {SQLITE_TABLE} '
+               f'WHERE {SQLITE_TABLE} MATCH %s)'],
+        params=[match],
+        ), RawSQL(
+            f'(SELECT -bm25({SQLITE_TABLE}, {SQLITE_NAME_WEIGHT}, 1.0) '
+            f'FROM {SQLITE_TABLE} WHERE {SQLITE_TABLE} MATCH %s '
+            f'AND rowid = {table}.id)',
+            (match,),
+            output_field=FloatField(),
+            )
+
+
+def matching(queryset, query):
+    """
+    Рецепты queryset, в названии или описании которых есть все слова
+    query по префиксу, от более релевантных к менее. На других СУБД —
+    поиск вхождений без ранжирования.
+    """
+
+    words = terms(query)
+    if not words:
+        return queryset
+    if connection.vendor == 'postgresql':
+        queryset, rank = postgresql(queryset, words)
+    elif connection.vendor == 'sqlite':
+        queryset, rank = sqlite(queryset, words)
+    else:
+        for word in words:
+            queryset = queryset.filter(
+                Q(name__icontains=word) | Q(text__icontains=word))
+        return queryset
+    return queryset.order_by(rank.desc(), '-pub_date', '-id')
+
+
+def install_triggers(using, **kwargs):
+    """Восстановление триггеров FTS5 после migrate на SQLite."""
+
+    db = connections[using]
+    if db.vendor != 'sqlite':
+        return
+    with db.cursor() as cursor:
+        if SQLITE_TABLE not in db.introspection.table_names(cursor):
+            return
+        for sql in SQLITE_TRIGGERS:
+            cursor.execute(sql)
@@ -1,10 +1,16 @@
-from drf_extra_fields.fields import Base64ImageField
+import json
+
+from django.conf import settings
+from django.db import transaction
 from rest_framework import serializers
 from rest_framework.serializers import ModelSerializer
+from rest_framework.utils import html
 from rest_framework.validators import UniqueValidator
 
-from api.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
-                        ShoppingCart, Tag)
+from api import cache, counters, feed, images, pantry, shopping_list, similar
+from api.fields import ImageVariantsField, RecipeImageField, UploadedImageField
+from api.membership import get_membership
+from api.models import Favorite, Ingredient, IngredientInRecipe, Recipe, Tag
 from users.serializers import CustomUserSerializer
 
 
@@ -52,6 +58,27 @@ class FavoriteSerializer(ModelSerializer):
         fields = ('recipe', 'user')
 
 
+class BulkIdsSerializer(serializers.Serializer):
+    """Список id рецептов или авторов для массового действия."""
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BULK_MAX_IDS,
+        )
+
+
+class PantrySerializer(serializers.Serializer):
+    """Продукты в наличии и число рецептов в подборе."""
+
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.PANTRY_MAX_INGREDIENTS,
+        )
+    limit = serializers.IntegerField(min_value=1, max_value=50, default=10)
+
+
 class IngredientRepresentationSerializer(serializers.ModelSerializer):
     """Общий вывод ингредиентов по Get запросу."""
 
@@ -65,22 +92,87 @@ class IngredientRepresentationSerializer(serializers.ModelSerializer):
         model = IngredientInRecipe
 
 
+def form_list(dictionary, field_name):
+    """
+    Список из multipart/form-data: элементы передаются JSON-строкой
+    со списком или повторяющимся полем. Строка не в JSON остается
+    как есть и отклоняется проверкой поля.
+    """
+
+    items = []
+    for value in dictionary.getlist(field_name):
+        try:
+            decoded = json.loads(value)
+        except (TypeError, ValueError):
+            decoded = value
+        items.extend(decoded if isinstance(decoded, list) else [decoded])
+    return items
+
+
+class BulkManyRelatedField(serializers.ManyRelatedField):
+    """
+    Список первичных ключей, проверяемый одним запросом id__in
+    вместо отдельного запроса на каждый элемент.
+    """
+
+    def get_value(self, dictionary):
+        if html.is_html_input(dictionary) and self.field_name in dictionary:
+            return form_list(dictionary, self.field_name)
+        return super().get_value(dictionary)
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+        child = self.child_relation
+        ids = []
+        for pk in data:
+            if isinstance(pk, bool) or not str(pk).isdigit():
+                child.fail('incorrect_type', data_type=type(pk).__name__)
+            ids.append(int(pk))
+        found = child.get_queryset().in_bulk(set(ids))
+        for pk in ids:
+            if pk not in found:
+                child.fail('does_not_exist', pk_value=pk)
+        return [found[pk] for pk in ids]
+
+
+class IngredientInRecipeListSerializer(serializers.ListSerializer):
+    """Состав рецепта: все ингредиенты ищутся одним запросом."""
+
+    def get_value(self, dictionary):
+        if html.is_html_input(dictionary) and self.field_name in dictionary:
+            return form_list(dictionary, self.field_name)
+        return super().get_value(dictionary)
+
+    def to_internal_value(self, data):
+        items = super().to_internal_value(data)
+        found = Ingredient.objects.in_bulk({item['id'] for item in items})
+        if any(item['id'] not in found for item in items):
+            raise serializers.ValidationError([
+                {} if item['id'] in found else {'id': [
+                    f'Ингредиент с id={item["id"]} не найден.']}
+                for item in items
+                ])
+        for item in items:
+            item['id'] = found[item['id']]
+        return items
+
+
 class IngredientInRecipeSerializer(serializers.ModelSerializer):
     """
     Сериализатор модели IngredientInRecipe для
     обработки Path, Delete, Post запросов.
     """
 
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all(), validators=[
-            UniqueValidator(queryset=Ingredient.objects.all())
-        ]
-    )
+    id = serializers.IntegerField()
     amount = serializers.IntegerField(min_value=0)
 
     class Meta:
         model = IngredientInRecipe
         fields = ('id', 'amount')
+        list_serializer_class = IngredientInRecipeListSerializer
 
 
 class RecipeListSerializer(serializers.ModelSerializer):
@@ -110,22 +202,36 @@ class RecipeListSerializer(serializers.ModelSerializer):
     сериализатора: RecipeSerializer.
     """
 
-    tags = TagSerializer(
-        many=True, read_only=True
-    )
+    tags = serializers.SerializerMethodField(read_only=True)
     author = CustomUserSerializer(read_only=True)
     ingredients = serializers.SerializerMethodField(read_only=True)
     is_favorited = serializers.SerializerMethodField(read_only=True)
     is_in_shopping_cart = serializers.SerializerMethodField(read_only=True)
+    image = RecipeImageField()
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
-        fields = '__all__'
+        # Оценки популярности служат только для сортировки и в
+        # закэшированных страницах не освежаются.
+        exclude = ('processed_image', 'popular_score', 'trending_score')
+
+    def get_tags(self, obj):
+        """Метод получения списка тегов по возрастанию id."""
+
+        tags = getattr(obj, 'tag_list', None)
+        if tags is None:
+            tags = obj.tags.all()
+        return TagSerializer(
+            sorted(tags, key=lambda tag: tag.id), many=True).data
 
     def get_ingredients(self, obj):
         """Метод получения списка ингредиентов."""
 
-        queryset = IngredientInRecipe.objects.filter(recipe=obj)
+        queryset = getattr(obj, 'ingredient_amounts', None)
+        if queryset is None:
+            queryset = IngredientInRecipe.objects.filter(
+                recipe=obj).select_related('ingredient')
         return IngredientRepresentationSerializer(queryset, many=True).data
 
     def get_is_favorited(self, obj):
@@ -134,7 +240,7 @@ class RecipeListSerializer(serializers.ModelSerializer):
         request = self.context.get('request')
         if not request or request.user.is_anonymous:
             return False
-        return Favorite.objects.filter(user=request.user, recipe=obj).exists()
+        return obj.id in get_membership(request).favorites
 
     def get_is_in_shopping_cart(self, obj):
         """Метод проверки добавления рецепта в корзину."""
@@ -142,8 +248,7 @@ class RecipeListSerializer(serializers.ModelSerializer):
         request = self.context.get('request')
         if not request or request.user.is_anonymous:
             return False
-        return ShoppingCart.objects.filter(
-            user=request.user, recipe=obj).exists()
+        return obj.id in get_membership(request).shopping_cart
 
 
 class RecipeSerializer(serializers.ModelSerializer):
@@ -154,17 +259,18 @@ class RecipeSerializer(serializers.ModelSerializer):
     """
 
     ingredients = IngredientInRecipeSerializer(many=True)
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(),
-        many=True
+    tags = BulkManyRelatedField(
+        child_relation=serializers.PrimaryKeyRelatedField(
+            queryset=Tag.objects.all()),
         )
     author = CustomUserSerializer(read_only=True)
-    image = Base64ImageField()
+    image = UploadedImageField()
     cooking_time = serializers.IntegerField(min_value=0)
 
     class Meta:
         fields = '__all__'
-        read_only_fields = ('author',)
+        read_only_fields = (
+            'author', 'favorites_count', 'popular_score', 'trending_score')
         model = Recipe
 
     def validate(self, validated_data):
@@ -175,32 +281,25 @@ class RecipeSerializer(serializers.ModelSerializer):
         """
 
         ingredients = validated_data.get('ingredients')
-        ingredients_list = []
-        for ingredient in ingredients:
-            ingredient_id = ingredient['id']
-            if ingredient_id in ingredients_list:
-                raise serializers.ValidationError({
-                    'ingredients': 'Такой ингредиент уже есть в рецепте.'
-                })
-            ingredients_list.append(ingredient_id)
-            amount = ingredient['amount']
-            if int(amount) <= 0:
-                raise serializers.ValidationError({
-                    'amount': 'Количество не может быть нулевым.'
-                })
+        ingredient_ids = {ingredient['id'].id for ingredient in ingredients}
+        if len(ingredient_ids) != len(ingredients):
+            raise serializers.ValidationError({
+                'ingredients': 'Такой ингредиент уже есть в рецепте.'
+            })
+        if any(int(ingredient['amount']) <= 0 for ingredient in ingredients):
+            raise serializers.ValidationError({
+                'amount': 'Количество не может быть нулевым.'
+            })
 
         tags = validated_data.get('tags')
         if not tags:
             raise serializers.ValidationError({
                 'tags': 'Не задан tag.'
             })
-        tags_list = []
-        for tag in tags:
-            if tag in tags_list:
-                raise serializers.ValidationError({
-                    'tags': 'Такой tag уже существует.'
-                })
-            tags_list.append(tag)
+        if len(set(tags)) != len(tags):
+            raise serializers.ValidationError({
+                'tags': 'Такой tag уже существует.'
+            })
 
         cooking_time = validated_data.get('cooking_time')
         if int(cooking_time) <= 0:
@@ -210,7 +309,10 @@ class RecipeSerializer(serializers.ModelSerializer):
         return validated_data
 
     def create_ingredients(self, ingredients, recipe):
-        """Метод создания ингредиента."""
+        """
+        Метод создания ингредиента.
+        Созданный состав остается на рецепте для ответа.
+        """
 
         create_ingredient = [
             IngredientInRecipe(
@@ -221,13 +323,35 @@ class RecipeSerializer(serializers.ModelSerializer):
             for ingredient in ingredients
             ]
         IngredientInRecipe.objects.bulk_create(create_ingredient)
+        recipe.ingredient_amounts = create_ingredient[::-1]
 
     def create_tags(self, tags, recipe):
-        """Метод создания тега."""
+        """
+        Метод создания тегов одной вставкой: у нового рецепта
+        нет тегов, и проверять существующие связи не нужно.
+        """
+
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe=recipe, tag=tag) for tag in tags
+            ])
+        recipe.tag_list = tags
+
+    def update_tags(self, tags, recipe):
+        """
+        Приведение тегов рецепта к новому списку: удаляются и добавляются
+        только отличающиеся. Возвращает, изменились ли теги.
+        """
 
-        for tag in tags:
-            recipe.tags.add(tag)
+        old = set(recipe.tags.values_list('id', flat=True))
+        new = {tag.id for tag in tags}
+        if old - new:
+            recipe.tags.remove(*(old - new))
+        if new - old:
+            recipe.tags.add(*(new - old))
+        recipe.tag_list = tags
+        return old != new
 
+    @transaction.atomic
     def create(self, validated_data):
         """Метод создания рецепта."""
 
@@ -237,6 +361,14 @@ class RecipeSerializer(serializers.ModelSerializer):
         recipe = Recipe.objects.create(author=author, **validated_data)
         self.create_tags(tags, recipe)
         self.create_ingredients(ingredients, recipe)
+        pantry.add_recipe(
+            recipe.id, [ingredient['id'].id for ingredient in ingredients])
+        similar.mark_stale([recipe.id])
+        counters.change_recipes(author.id, 1)
+        images.acquire(recipe.image.name)
+        images.enqueue(recipe)
+        feed.publish(recipe)
+        cache.invalidate_recipe(recipe.id)
         return recipe
 
     def to_representation(self, instance):
@@ -244,14 +376,87 @@ class RecipeSerializer(serializers.ModelSerializer):
 
         request = self.context.get('request')
         context = {'request': request}
+        if 'image_size' in self.context:
+            context['image_size'] = self.context['image_size']
         return RecipeListSerializer(
             instance, context=context).data
 
+    def update_ingredients(self, ingredients, recipe):
+        """
+        Приведение состава рецепта к новому списку по разнице со старым:
+        не более одной вставки, одного обновления и одного удаления.
+        Возвращает старые и новые количества {ingredient_id: amount},
+        новый состав остается на рецепте для ответа.
+        """
+
+        current = {
+            amount.ingredient_id: amount
+            for amount in IngredientInRecipe.objects.filter(recipe=recipe)
+            }
+        old_amounts = {
+            ingredient_id: amount.amount
+            for ingredient_id, amount in current.items()
+            }
+        new_amounts = {
+            ingredient['id'].id: int(ingredient['amount'])
+            for ingredient in ingredients
+            }
+        found = {ingredient['id'].id: ingredient['id']
+                 for ingredient in ingredients}
+        changed = []
+        for ingredient_id, amount in new_amounts.items():
+            row = current.get(ingredient_id)
+            if row is not None and row.amount != amount:
+                row.amount = amount
+                changed.append(row)
+        created = [
+            IngredientInRecipe(
+                recipe=recipe, ingredient=found[ingredient_id],
+                amount=amount)
+            for ingredient_id, amount in new_amounts.items()
+            if ingredient_id not in current
+            ]
+        IngredientInRecipe.objects.bulk_create(created)
+        if changed:
+            IngredientInRecipe.objects.bulk_update(changed, ['amount'])
+        removed = [
+            row.id for ingredient_id, row in current.items()
+            if ingredient_id not in new_amounts
+            ]
+        if removed:
+            IngredientInRecipe.objects.filter(id__in=removed).delete()
+        kept = sorted(
+            (row for ingredient_id, row in current.items()
+             if ingredient_id in new_amounts),
+            key=lambda row: row.id, reverse=True)
+        for row in kept:
+            row.ingredient = found[row.ingredient_id]
+        recipe.ingredient_amounts = created[::-1] + kept
+        return old_amounts, new_amounts
+
+    @transaction.atomic
     def update(self, instance, validated_data):
-        """Метод обновления рецепта."""
+        """
+        Метод обновления рецепта.
+        Теги и ингредиенты меняются только в отличающейся части,
+        изменение состава переносится в списки покупок пользователей,
+        у которых рецепт лежит в корзине, и в индекс подбора
+        по продуктам. Смена тегов или набора ингредиентов ставит рецепт
+        в очередь пересчета похожих. То же изображение, загруженное
+        повторно, сохраняется под прежним именем и не обрабатывается.
+        """
 
-        instance.tags.clear()
-        IngredientInRecipe.objects.filter(recipe=instance).all().delete()
-        self.create_tags(validated_data.pop('tags'), instance)
-        self.create_ingredients(validated_data.pop('ingredients'), instance)
-        return super().update(instance, validated_data)
+        tags_changed = self.update_tags(validated_data.pop('tags'), instance)
+        old_amounts, new_amounts = self.update_ingredients(
+            validated_data.pop('ingredients'), instance)
+        shopping_list.change_recipe(instance.id, old_amounts, new_amounts)
+        pantry.change_recipe(instance.id, old_amounts, new_amounts)
+        if tags_changed or old_amounts.keys() != new_amounts.keys():
+            similar.mark_stale([instance.id])
+        old_image = instance.image.name
+        instance = super().update(instance, validated_data)
+        if instance.image.name != old_image:
+            images.replace(old_image, instance.image.name)
+            images.enqueue(instance)
+        cache.invalidate_recipe(instance.id)
+        return instance
@@ -0,0 +1,141 @@
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.db.models.functions import Greatest
+
+from api import cache
+from api.models import IngredientInRecipe, ShoppingCart, ShoppingListItem
+
+
+def recipe_amounts(*recipe_ids):
+    """
+    Количество каждого ингредиента в рецептах вместе:
+    {ingredient_id: amount}.
+    """
+
+    amounts = {}
+    rows = IngredientInRecipe.objects.filter(
+        recipe_id__in=recipe_ids).values_list('ingredient_id', 'amount')
+    for ingredient_id, amount in rows:
+        amounts[ingredient_id] = amounts.get(ingredient_id, 0) + amount
+    return amounts
+
+
+def difference(old, new):
+    """Изменение количеств при переходе от old к new."""
+
+    return {
+        ingredient_id: new.get(ingredient_id, 0) - old.get(ingredient_id, 0)
+        for ingredient_id in old.keys() | new.keys()
+        }
+
+
+def apply(user_ids, deltas):
+    """
+    Изменение списков покупок пользователей на величины deltas.
+    Недостающие строки создаются с нулем, затем один UPDATE прибавляет
+    изменения, и строки с нулевым остатком удаляются. Версия выгрузок
+    меняется после фиксации транзакции вызывающего кода.
+    """
+
+    deltas = {key: value for key, value in deltas.items() if value}
+    user_ids = list(user_ids)
+    if not user_ids or not deltas:
+        return
+    added = [ingredient_id for ingredient_id, delta in deltas.items()
+             if delta > 0]
+    with transaction.atomic(savepoint=False):
+        if added:
+            ShoppingListItem.objects.bulk_create(
+                [ShoppingListItem(user_id=user_id,
+                                  ingredient_id=ingredient_id, amount=0)
+                 for user_id in user_ids for ingredient_id in added],
+                ignore_conflicts=True,
+                )
+        items = ShoppingListItem.objects.filter(
+            user_id__in=user_ids, ingredient_id__in=deltas)
+        items.update(amount=Greatest(
+            Case(
+                *[When(ingredient_id=ingredient_id,
+                       then=F('amount') + Value(delta))
+                  for ingredient_id, delta in deltas.items()],
+                default=F('amount'),
+                output_field=IntegerField(),
+                ),
+            Value(0),
+            ))
+        if len(added) < len(deltas):
+            items.filter(amount=0).delete()
+    cache.invalidate_shopping_lists(user_ids)
+
+
+def add_recipes(user_id, recipe_ids):
+    """Рецепты добавлены в корзину пользователя."""
+
+    apply([user_id], recipe_amounts(*recipe_ids))
+
+
+def remove_recipes(user_id, recipe_ids):
+    """Рецепты убраны из корзины пользователя."""
+
+    apply([user_id], difference(recipe_amounts(*recipe_ids), {}))
+
+
+def cart_users(recipe_id):
+    """Пользователи, у которых рецепт лежит в корзине."""
+
+    return list(ShoppingCart.objects.filter(
+        recipe_id=recipe_id).values_list('user_id', flat=True))
+
+
+def change_recipe(recipe_id, old_amounts, new_amounts, user_ids=None):
+    """Состав рецепта изменился: правка списков у всех, кто его купит."""
+
+    deltas = {
+        key: value
+        for key, value in difference(old_amounts, new_amounts).items()
+        if value
+        }
+    if not deltas:
+        return
+    if user_ids is None:
+        user_ids = cart_users(recipe_id)
+    apply(user_ids, deltas)
+
+
+def delete_recipe(recipe_id):
+    """Рецепт удаляется: его ингредиенты вычитаются из всех списков."""
+
+    user_ids = cart_users(recipe_id)
+    if user_ids:
+        apply(user_ids, difference(recipe_amounts(recipe_id), {}))
+
+
+def rebuild(user_ids=None):
+    """
+    Пересчет списков покупок с нуля по содержимому корзин.
+    Используется при первоначальном заполнении и для исправления
+    расхождений после изменений в обход API.
+    """
+
+    items = ShoppingListItem.objects.all()
+    carts = {'recipe__shopping_carts__isnull': False}
+    if user_ids is not None:
+        items = items.filter(user_id__in=user_ids)
+        carts = {'recipe__shopping_carts__user_id__in': user_ids}
+    totals = IngredientInRecipe.objects.filter(**carts).values(
+        'recipe__shopping_carts__user_id', 'ingredient_id'
+        ).annotate(total=Sum('amount')).order_by()
+    with transaction.atomic(savepoint=False):
+        items.delete()
+        ShoppingListItem.objects.bulk_create(
+            ShoppingListItem(
+                user_id=row['recipe__shopping_carts__user_id'],
+                ingredient_id=row['ingredient_id'],
+                amount=row['total'],
+                )
+            for row in totals.iterator()
+            )
+    if user_ids is None:
+        cache.invalidate_shared()
+    else:
+        cache.invalidate_shopping_lists(user_ids)
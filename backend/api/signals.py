@@ -0,0 +1,58 @@
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_save)
+from django.dispatch import receiver
+
+from api import cache
+from api.models import Ingredient, IngredientInRecipe, Recipe, Tag
+from users.models import User
+
+# Поля автора, которые входят в закэшированное представление рецепта.
+AUTHOR_FIELDS = ('username', 'first_name', 'last_name', 'email')
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    cache.invalidate_recipe(instance.id)
+
+
+@receiver(post_save, sender=IngredientInRecipe)
+@receiver(post_delete, sender=IngredientInRecipe)
+def recipe_ingredient_changed(sender, instance, **kwargs):
+    cache.invalidate_recipe(instance.recipe_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        cache.invalidate_shared()
+    else:
+        cache.invalidate_recipe(instance.id)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def catalog_changed(sender, **kwargs):
+    cache.invalidate_shared()
+
+
+@receiver(pre_save, sender=User)
+def author_changed(sender, instance, update_fields=None, **kwargs):
+    """
+    Новый пользователь еще не встречается в рецептах, а вход, смена
+    пароля и счетчики не меняют представление автора.
+    """
+
+    fields = AUTHOR_FIELDS
+    if update_fields is not None:
+        fields = [name for name in fields if name in update_fields]
+    loaded = vars(instance).setdefault('_loaded_values', {})
+    if not instance._state.adding and any(
+            loaded.get(name, instance) != getattr(instance, name)
+            for name in fields):
+        cache.invalidate_shared()
+    loaded.update((name, getattr(instance, name)) for name in fields)
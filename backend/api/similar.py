@@ -0,0 +1,367 @@
+"""
+Похожие рецепты /api/recipes/{id}/similar/.
+
+Рецепт описывается множеством своих ингредиентов и тегов, сходство двух
+рецептов — коэффициент Жаккара этих множеств. Команда similar_recipes
+строит разреженную матрицу «рецепт × признак» и по блокам строк
+считает пересечения произведением матриц, лучшие SIMILAR_RECIPES_COUNT
+соседей каждого рецепта сохраняются в SimilarRecipe. Признаки, которые
+есть больше чем у доли SIMILAR_COMMON_SHARE рецептов и больше чем
+у COMMON_MIN_RECIPES (теги, соль), сделали бы произведение почти
+плотным, поэтому кандидатов порождают только остальные признаки,
+а частые добавляются к пересечению по битовой маске рецепта.
+
+Изменение состава или тегов ставит рецепт в очередь SimilarityTask.
+При ее разборе пересчитываются сам рецепт, рецепты, у которых он был
+среди похожих, и его новые соседи. Для этого загружаются признаки
+только рецептов с общим нечастым признаком, а не всего каталога.
+"""
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, islice
+
+import numpy as np
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Count, Exists, OuterRef, Q
+from django.utils import timezone
+from scipy import sparse
+
+from api.models import (IngredientInRecipe, Recipe, SimilarityTask,
+                        SimilarRecipe)
+
+CHUNK_SIZE = 1000
+BATCH_SIZE = 5000
+# Частые признаки упаковываются в 64-битную маску рецепта.
+MASK_BITS = 64
+COMMON_MIN_RECIPES = 1000
+POPCOUNT = np.array(
+    [bin(byte).count('1') for byte in range(256)], dtype=np.uint8)
+
+Features = namedtuple(
+    'Features', 'recipe_ids sizes candidates transposed masks')
+
+# Признаки рецептов в процессах-обработчиках блоков.
+worker_features = None
+worker_count = None
+
+
+def pairs_array(queryset):
+    """Пары (recipe_id, id признака) без промежуточного списка кортежей."""
+
+    return np.fromiter(
+        chain.from_iterable(queryset.order_by().iterator()),
+        dtype=np.int64,
+        ).reshape(-1, 2)
+
+
+def common_columns(shares, total):
+    """
+    Столбцы частых признаков: не больше MASK_BITS самых частых из тех,
+    что есть больше чем у доли SIMILAR_COMMON_SHARE из total рецептов
+    и больше чем у COMMON_MIN_RECIPES.
+    """
+
+    common = np.argsort(-shares, kind='stable')[:MASK_BITS]
+    return common[shares[common] > max(
+        settings.SIMILAR_COMMON_SHARE * total, COMMON_MIN_RECIPES)]
+
+
+def frequent_features():
+    """
+    Частые признаки всего каталога по числу рецептов у каждого:
+    (id ингредиентов, id тегов). Сами пары рецепт-признак не читаются.
+    """
+
+    ingredients = np.array(IngredientInRecipe.objects.values(
+        'ingredient_id').annotate(total=Count('id')).order_by(
+        'ingredient_id').values_list('ingredient_id', 'total'),
+        dtype=np.int64).reshape(-1, 2)
+    tags = np.array(Recipe.tags.through.objects.values('tag_id').annotate(
+        total=Count('id')).order_by('tag_id').values_list('tag_id', 'total'),
+        dtype=np.int64).reshape(-1, 2)
+    total = Recipe.objects.annotate(
+        has_ingredients=Exists(IngredientInRecipe.objects.filter(
+            recipe_id=OuterRef('pk'))),
+        has_tags=Exists(Recipe.tags.through.objects.filter(
+            recipe_id=OuterRef('pk'))),
+        ).filter(Q(has_ingredients=True) | Q(has_tags=True)).count()
+    common = common_columns(
+        np.concatenate([ingredients[:, 1], tags[:, 1]]), total)
+    return (ingredients[common[common < len(ingredients)], 0],
+            tags[common[common >= len(ingredients)] - len(ingredients), 0])
+
+
+def related_rows(recipe_ids, common_ingredients, common_tags):
+    """
+    Строки состава и тегов рецептов recipe_ids и рецептов, у которых
+    есть общий с ними нечастый признак: среди них все кандидаты
+    в соседи recipe_ids.
+    """
+
+    recipe_ids = list(recipe_ids)
+    common_ingredients = common_ingredients.tolist()
+    common_tags = common_tags.tolist()
+    tagged = Recipe.tags.through.objects
+    own_ingredients = IngredientInRecipe.objects.filter(
+        recipe_id__in=recipe_ids).exclude(
+        ingredient_id__in=common_ingredients).values('ingredient_id')
+    own_tags = tagged.filter(recipe_id__in=recipe_ids).exclude(
+        tag_id__in=common_tags).values('tag_id')
+    related = (
+        Q(recipe_id__in=recipe_ids)
+        | Q(recipe_id__in=IngredientInRecipe.objects.filter(
+            ingredient_id__in=own_ingredients).values('recipe_id'))
+        | Q(recipe_id__in=tagged.filter(
+            tag_id__in=own_tags).values('recipe_id'))
+        )
+    return IngredientInRecipe.objects.filter(related), tagged.filter(related)
+
+
+def load_features(targets=None):
+    """
+    Матрица признаков всех рецептов, у которых есть состав или теги.
+    Если заданы рецепты targets, загружаются только они и их кандидаты
+    в соседи, а частые признаки берутся по всему каталогу.
+    """
+
+    ingredient_rows = IngredientInRecipe.objects.all()
+    tag_rows = Recipe.tags.through.objects.all()
+    frequent = None
+    if targets is not None:
+        frequent = frequent_features()
+        ingredient_rows, tag_rows = related_rows(targets, *frequent)
+    ingredients = pairs_array(ingredient_rows.values_list(
+        'recipe_id', 'ingredient_id'))
+    tags = pairs_array(tag_rows.values_list('recipe_id', 'tag_id'))
+    recipe_ids, rows = np.unique(
+        np.concatenate([ingredients[:, 0], tags[:, 0]]), return_inverse=True)
+    offset = ingredients[:, 1].max(initial=0) + 1
+    keys, columns = np.unique(
+        np.concatenate([ingredients[:, 1], tags[:, 1] + offset]),
+        return_inverse=True,
+        )
+    matrix = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (rows, columns)),
+        shape=(len(recipe_ids), columns.max(initial=-1) + 1),
+        )
+    by_column = matrix.tocsc()
+    if frequent is None:
+        common = common_columns(np.diff(by_column.indptr), len(recipe_ids))
+    else:
+        common = np.flatnonzero(np.isin(
+            keys, np.concatenate([frequent[0], frequent[1] + offset])))
+    masks = np.zeros(len(recipe_ids), dtype=np.uint64)
+    for bit, column in enumerate(common):
+        start, end = by_column.indptr[column], by_column.indptr[column + 1]
+        masks[by_column.indices[start:end]] |= np.uint64(1 << bit)
+    rare = np.ones(matrix.shape[1], dtype=np.float32)
+    rare[common] = 0
+    candidates = (matrix @ sparse.diags(rare)).tocsr()
+    candidates.eliminate_zeros()
+    return Features(
+        recipe_ids=recipe_ids,
+        sizes=np.diff(matrix.indptr),
+        candidates=candidates,
+        transposed=candidates.T.tocsr(),
+        masks=masks,
+        )
+
+
+def popcount(values):
+    """Число единичных битов каждого элемента массива uint64."""
+
+    return POPCOUNT[values.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+def best(scores, others, count):
+    """
+    Позиции count лучших кандидатов строки: по сходству, при равном
+    сходстве выше более новый рецепт. Полная сортировка не нужна:
+    порог находит partition, сортируются только отобранные.
+    """
+
+    if len(scores) > count:
+        threshold = np.partition(scores, len(scores) - count)[
+            len(scores) - count]
+        above = np.flatnonzero(scores > threshold)
+        tied = np.flatnonzero(scores == threshold)
+        tied = tied[np.argsort(-others[tied], kind='stable')]
+        positions = np.concatenate([above, tied[:count - len(above)]])
+    else:
+        positions = np.arange(len(scores))
+    return positions[np.lexsort((-others[positions], -scores[positions]))]
+
+
+def neighbours(features, rows, count):
+    """Лучшие count соседей строк rows: массивы (строка, сосед, сходство)."""
+
+    block = (features.candidates[rows] @ features.transposed).tocsr()
+    source = np.repeat(rows, np.diff(block.indptr))
+    other = block.indices
+    shared = block.data + popcount(
+        features.masks[source] & features.masks[other])
+    scores = shared / (
+        features.sizes[source] + features.sizes[other] - shared)
+    scores[source == other] = 0
+    picked = [
+        start + best(scores[start:end], other[start:end], count)
+        for start, end in zip(block.indptr[:-1], block.indptr[1:])
+        ]
+    picked = np.concatenate(picked or [np.empty(0, dtype=np.intp)])
+    picked = picked[scores[picked] > 0]
+    return source[picked], other[picked], scores[picked]
+
+
+def init_worker(features, count):
+    global worker_features, worker_count
+    worker_features, worker_count = features, count
+
+
+def chunk_neighbours(rows):
+    return neighbours(worker_features, rows, worker_count)
+
+
+def compute(features, rows, workers=1, chunk_size=CHUNK_SIZE):
+    """
+    Соседи строк rows блоками по chunk_size строк. При workers > 1
+    блоки считаются параллельно в процессах, матрица передается
+    каждому процессу один раз.
+    """
+
+    count = settings.SIMILAR_RECIPES_COUNT
+    chunks = [
+        rows[start:start + chunk_size]
+        for start in range(0, len(rows), chunk_size)
+        ]
+    if workers > 1 and len(chunks) > 1:
+        # Соединения с базой не должны наследоваться процессами.
+        connections.close_all()
+        with ProcessPoolExecutor(
+                workers, initializer=init_worker,
+                initargs=(features, count)) as pool:
+            results = list(pool.map(chunk_neighbours, chunks))
+    else:
+        results = [neighbours(features, chunk, count) for chunk in chunks]
+    if not results:
+        return tuple(np.empty(0, dtype=dtype)
+                     for dtype in (np.intp, np.intp, np.float64))
+    return tuple(np.concatenate(parts) for parts in zip(*results))
+
+
+def rows_of(features, recipe_ids):
+    """Номера строк рецептов, у которых есть признаки."""
+
+    recipe_ids = np.array(sorted(recipe_ids), dtype=np.int64)
+    rows = np.searchsorted(features.recipe_ids, recipe_ids)
+    found = rows < len(features.recipe_ids)
+    found[found] = features.recipe_ids[rows[found]] == recipe_ids[found]
+    return rows[found]
+
+
+def by_id(features, pairs):
+    """Пары из номеров строк матрицы features в пары id рецептов."""
+
+    source, other, scores = pairs
+    return features.recipe_ids[source], features.recipe_ids[other], scores
+
+
+def store(pairs, recipe_ids=None):
+    """
+    Замена похожих у рецептов recipe_ids (у всех, если не заданы)
+    найденными парами id рецептов. Рецепты, удаленные во время
+    расчета, пропускаются.
+    """
+
+    source, other, scores = pairs
+    alive = np.fromiter(
+        Recipe.objects.values_list('id', flat=True).iterator(),
+        dtype=np.int64,
+        )
+    keep = np.isin(source, alive) & np.isin(other, alive)
+    rows = zip(source[keep].tolist(), other[keep].tolist(),
+               scores[keep].tolist())
+    existing = SimilarRecipe.objects.all()
+    if recipe_ids is not None:
+        existing = existing.filter(recipe_id__in=recipe_ids)
+    with transaction.atomic():
+        existing.delete()
+        while True:
+            batch = [
+                SimilarRecipe(recipe_id=recipe_id, similar_id=similar_id,
+                              score=score)
+                for recipe_id, similar_id, score in islice(rows, BATCH_SIZE)
+                ]
+            if not batch:
+                break
+            SimilarRecipe.objects.bulk_create(batch)
+
+
+def rebuild(workers=1, chunk_size=CHUNK_SIZE):
+    """Похожие для всех рецептов. Возвращает число рецептов."""
+
+    started = timezone.now()
+    features = load_features()
+    rows = np.arange(len(features.recipe_ids))
+    store(by_id(features, compute(features, rows, workers, chunk_size)))
+    SimilarityTask.objects.filter(created__lte=started).delete()
+    return len(rows)
+
+
+def recompute(recipe_ids, workers=1, chunk_size=CHUNK_SIZE):
+    """
+    Пересчет рецептов recipe_ids и связанных с ними. Загружаются
+    признаки только этих рецептов и их кандидатов в соседи, новые
+    соседи recipe_ids считаются по второй такой загрузке.
+    """
+
+    targets = set(recipe_ids) | set(SimilarRecipe.objects.filter(
+        similar_id__in=recipe_ids).values_list('recipe_id', flat=True))
+    features = load_features(targets)
+    pairs = compute(features, rows_of(features, targets), workers, chunk_size)
+    changed = np.isin(pairs[0], rows_of(features, recipe_ids))
+    extra = set(features.recipe_ids[pairs[1][changed]].tolist()) - targets
+    pairs = by_id(features, pairs)
+    if extra:
+        features = load_features(extra)
+        pairs = tuple(np.concatenate(parts) for parts in zip(
+            pairs, by_id(features, compute(
+                features, rows_of(features, extra), workers, chunk_size))))
+    store(pairs, targets | extra)
+
+
+def update(workers=1, chunk_size=CHUNK_SIZE, limit=None):
+    """
+    Разбор очереди SimilarityTask, не больше limit рецептов за раз.
+    Возвращает число разобранных рецептов.
+    """
+
+    with transaction.atomic():
+        recipe_ids = list(SimilarityTask.objects.select_for_update(
+            skip_locked=True).order_by('created').values_list(
+            'recipe_id', flat=True)[:limit])
+        SimilarityTask.objects.filter(recipe_id__in=recipe_ids).delete()
+    if not recipe_ids:
+        return 0
+    try:
+        recompute(recipe_ids, workers, chunk_size)
+    except Exception:
+        mark_stale(recipe_ids)
+        raise
+    return len(recipe_ids)
+
+
+def mark_stale(recipe_ids):
+    """У рецептов изменились состав или теги."""
+
+    SimilarityTask.objects.bulk_create(
+        [SimilarityTask(recipe_id=recipe_id) for recipe_id in recipe_ids],
+        ignore_conflicts=True,
+        )
+
+
+def similar_to(recipe_id):
+    """Похожие рецепты, от более похожих к менее."""
+
+    return SimilarRecipe.objects.filter(recipe_id=recipe_id).select_related(
+        'similar').order_by('-score', '-similar_id')
@@ -0,0 +1,40 @@
+import hashlib
+import os
+import re
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+CONTENT_NAME = re.compile(r'(^|/)[0-9a-f]{64}[._]')
+
+
+def is_content_addressed(name):
+    """Имя оригинала или его копии выведено из хэша содержимого."""
+
+    return CONTENT_NAME.search(name) is not None
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Файл сохраняется под именем sha256 содержимого в подкаталоге
+    по первым двум символам хэша. Повторная загрузка того же файла
+    возвращает имя уже сохраненного без записи на диск. Содержимое
+    файла под таким именем не меняется, поэтому его можно кэшировать
+    бессрочно. Удаляются файлы по счетчику ссылок, см. api.images.
+    """
+
+    def digest(self, content):
+        sha = hashlib.sha256()
+        for chunk in content.chunks():
+            sha.update(chunk)
+        return sha.hexdigest()
+
+    def _save(self, name, content):
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        digest = self.digest(content)
+        name = os.path.join(directory, digest[:2], digest + extension)
+        if self.exists(name):
+            return name
+        return super()._save(name, content)
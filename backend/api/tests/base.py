@@ -0,0 +1,87 @@
+import base64
+import shutil
+import tempfile
+from io import BytesIO
+
+from django.core.cache import cache
+from django.test import TransactionTestCase, override_settings
+from PIL import Image
+from rest_framework.test import APIClient
+
+from api.models import Ingredient, Tag
+from users.models import User
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def image_data():
+    """Картинка рецепта в base64, как ее присылает фронтенд."""
+
+    buffer = BytesIO()
+    Image.new('RGB', (10, 10), 'red').save(buffer, 'PNG')
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    return f'data:image/png;base64,{encoded}'
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class RecipeAPITestCase(TransactionTestCase):
+    """
+    Пользователи, теги и ингредиенты для проверок через API.
+    Кэш рецептов сбрасывается после фиксации транзакции, поэтому
+    тесты идут без общей транзакции.
+    """
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.author = self.create_user('author')
+        self.user = self.create_user('reader')
+        self.tags = [
+            Tag.objects.create(
+                name=f'Тег {number}', color=f'#00000{number}',
+                slug=f'tag{number}')
+            for number in range(3)
+            ]
+        self.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}', measurement_unit='г')
+            for number in range(6)
+            ]
+        self.client = self.client_for(self.user)
+
+    def create_user(self, username):
+        return User.objects.create_user(
+            username=username, email=f'{username}@example.com',
+            password='password-12345', first_name=username,
+            last_name=username,
+            )
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def create_recipe(self, amounts, tags=None, author=None,
+                      name='Рецепт', text='Описание'):
+        """Рецепт через API: amounts — {номер ингредиента: количество}."""
+
+        response = self.client_for(author or self.author).post(
+            '/api/recipes/', {
+                'ingredients': [
+                    {'id': self.ingredients[number].id, 'amount': amount}
+                    for number, amount in amounts.items()
+                    ],
+                'tags': [tag.id for tag in tags or self.tags[:1]],
+                'image': image_data(),
+                'name': name,
+                'text': text,
+                'cooking_time': 10,
+                },
+            format='json',
+            )
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()['id']
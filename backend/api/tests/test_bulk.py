@@ -0,0 +1,102 @@
+from django.conf import settings
+
+from api.models import Recipe, ShoppingListItem
+from api.tests.base import RecipeAPITestCase
+from users.models import Subscription
+
+
+class BulkMembershipTests(RecipeAPITestCase):
+    """Массовые действия возвращают результат для каждого id."""
+
+    def setUp(self):
+        super().setUp()
+        self.recipes = [
+            self.create_recipe({number: 10}) for number in range(3)]
+
+    def test_cart_statuses_per_id(self):
+        first, second, third = self.recipes
+        self.client.post(f'/api/recipes/{first}/shopping_cart/')
+
+        response = self.client.post(
+            '/api/recipes/shopping_cart/',
+            {'ids': [first, second, 999999, second]}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [
+            {'id': first, 'status': 400,
+             'errors': 'Данный объект уже создан.'},
+            {'id': second, 'status': 201},
+            {'id': 999999, 'status': 404, 'errors': 'Не найдено.'},
+            ])
+        self.assertEqual(ShoppingListItem.objects.count(), 2)
+
+        response = self.client.delete(
+            '/api/recipes/shopping_cart/',
+            {'ids': [second, third]}, format='json')
+
+        self.assertEqual(response.json(), [
+            {'id': second, 'status': 204},
+            {'id': third, 'status': 400,
+             'errors': 'Невозможно удалить. Данного объекта не существует.'},
+            ])
+        self.assertEqual(ShoppingListItem.objects.count(), 1)
+
+    def test_favorite_counters_follow_bulk_changes(self):
+        response = self.client.post(
+            '/api/recipes/favorite/', {'ids': self.recipes}, format='json')
+
+        self.assertEqual(
+            [result['status'] for result in response.json()], [201] * 3)
+        self.assertEqual(
+            set(Recipe.objects.values_list('favorites_count', flat=True)),
+            {1})
+
+        self.client.delete(
+            '/api/recipes/favorite/', {'ids': self.recipes[:2]},
+            format='json')
+
+        self.assertEqual(
+            dict(Recipe.objects.values_list('id', 'favorites_count')),
+            dict(zip(self.recipes, (0, 0, 1))))
+
+    def test_subscribe_statuses_per_id(self):
+        other = self.create_user('other')
+
+        response = self.client.post(
+            '/api/users/subscribe/',
+            {'ids': [self.author.id, self.user.id, other.id, 999999]},
+            format='json')
+
+        self.assertEqual(response.json(), [
+            {'id': self.author.id, 'status': 201},
+            {'id': self.user.id, 'status': 400,
+             'errors': 'Вы не можете подписаться сами на себя.'},
+            {'id': other.id, 'status': 201},
+            {'id': 999999, 'status': 404, 'errors': 'Не найдено.'},
+            ])
+        self.assertEqual(Subscription.objects.count(), 2)
+
+        response = self.client.delete(
+            '/api/users/subscribe/', {'ids': [other.id]}, format='json')
+
+        self.assertEqual(response.json(), [{'id': other.id, 'status': 204}])
+        self.assertEqual(
+            list(Subscription.objects.values_list('author_id', flat=True)),
+            [self.author.id])
+
+    def test_invalid_ids_are_rejected(self):
+        too_many = list(range(1, settings.BULK_MAX_IDS + 2))
+        for ids in ([], too_many, ['abc'], [0]):
+            with self.subTest(ids=ids[:3]):
+                response = self.client.post(
+                    '/api/recipes/favorite/', {'ids': ids}, format='json')
+                self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            self.client.post('/api/recipes/favorite/').status_code, 400)
+
+    def test_anonymous_user_is_rejected(self):
+        response = self.client_class().post(
+            '/api/recipes/favorite/', {'ids': self.recipes},
+            content_type='application/json')
+
+        self.assertEqual(response.status_code, 401)
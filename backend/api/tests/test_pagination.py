@@ -0,0 +1,84 @@
+import json
+from base64 import urlsafe_b64encode
+from datetime import date, timedelta
+
+from api.models import Recipe
+from api.tests.base import RecipeAPITestCase
+
+
+class KeysetPaginationTests(RecipeAPITestCase):
+    """Страницы по ключу (pub_date, id) без пропусков и повторов."""
+
+    def setUp(self):
+        super().setUp()
+        self.recipes = [self.create_recipe({0: 10}) for _ in range(7)]
+        # Несколько рецептов за один день: порядок внутри дня по id.
+        today = date.today()
+        for position, recipe_id in enumerate(self.recipes):
+            Recipe.objects.filter(id=recipe_id).update(
+                pub_date=today - timedelta(days=position % 3))
+        self.expected = list(Recipe.objects.order_by(
+            '-pub_date', '-id').values_list('id', flat=True))
+
+    def walk(self, url, link='next'):
+        ids, pages = [], []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, response.content)
+            data = response.json()
+            self.assertNotIn('count', data)
+            pages.append([recipe['id'] for recipe in data['results']])
+            ids += pages[-1]
+            url = data[link]
+        return ids, pages
+
+    def test_cursor_walks_all_recipes_in_order(self):
+        ids, pages = self.walk('/api/recipes/?cursor=&limit=3')
+
+        self.assertEqual(ids, self.expected)
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+
+    def test_previous_link_returns_to_first_page(self):
+        first = self.client.get('/api/recipes/?cursor=&limit=3').json()
+        second = self.client.get(first['next']).json()
+        self.assertIsNone(first['previous'])
+
+        back = self.client.get(second['previous']).json()
+
+        self.assertEqual(back['results'], first['results'])
+
+    def test_cursor_with_filter(self):
+        tagged = self.create_recipe({1: 5}, tags=self.tags[1:2])
+        other = self.create_recipe({1: 5}, tags=self.tags[1:2])
+
+        ids, _ = self.walk('/api/recipes/?cursor=&limit=1&tags=tag1')
+
+        self.assertEqual(ids, [other, tagged])
+
+    def test_page_numbers_without_cursor(self):
+        data = self.client.get('/api/recipes/?limit=3&page=3').json()
+
+        self.assertEqual(data['count'], len(self.recipes))
+        self.assertEqual(
+            [recipe['id'] for recipe in data['results']], self.expected[6:])
+
+    def test_invalid_cursor_is_not_found(self):
+        short = urlsafe_b64encode(
+            json.dumps({'v': [1], 'r': 0}).encode()).decode()
+        for cursor in ('abc', short):
+            with self.subTest(cursor=cursor):
+                response = self.client.get(f'/api/recipes/?cursor={cursor}')
+                self.assertEqual(response.status_code, 404)
+
+    def test_feed_pages_follow_subscriptions(self):
+        stranger = self.create_user('stranger')
+        self.create_recipe({0: 1}, author=stranger)
+        self.client.post(f'/api/users/{self.author.id}/subscribe/')
+
+        ids, _ = self.walk('/api/recipes/feed/?limit=2')
+
+        self.assertEqual(ids, self.expected)
+
+        self.client.delete(f'/api/users/{self.author.id}/subscribe/')
+        ids, _ = self.walk('/api/recipes/feed/?limit=2')
+        self.assertEqual(ids, [])
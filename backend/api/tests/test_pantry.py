@@ -0,0 +1,99 @@
+from api import pantry
+from api.models import PantryIndex
+from api.tests.base import RecipeAPITestCase
+
+
+class PantryTests(RecipeAPITestCase):
+    """Подбор рецептов по продуктам в наличии."""
+
+    def setUp(self):
+        super().setUp()
+        self.full = self.create_recipe({0: 1, 1: 1})
+        self.partial = self.create_recipe({0: 1, 1: 1, 2: 1, 3: 1})
+        self.single = self.create_recipe({0: 1, 4: 1})
+        self.unrelated = self.create_recipe({5: 1})
+
+    def pantry(self, *ingredients, **params):
+        ids = ','.join(str(self.ingredients[number].id)
+                       for number in ingredients)
+        return self.client.get(
+            '/api/recipes/pantry/', {'ingredients': ids, **params})
+
+    def index(self):
+        """Непустые массивы индекса: пустые остаются после удалений."""
+
+        index = {
+            ingredient_id: pantry.load(recipes).tolist()
+            for ingredient_id, recipes in PantryIndex.objects.values_list(
+                'ingredient_id', 'recipes')
+            }
+        return {key: value for key, value in index.items() if value}
+
+    def test_recipes_ranked_by_matches_then_missing(self):
+        response = self.pantry(0, 1, 2)
+
+        self.assertEqual(response.status_code, 200, response.content)
+        results = response.json()
+        self.assertEqual(
+            [(recipe['id'], recipe['matched_count']) for recipe in results],
+            [(self.partial, 3), (self.full, 2), (self.single, 1)])
+        missing = {
+            recipe['id']: [item['id'] for item in
+                           recipe['missing_ingredients']]
+            for recipe in results
+            }
+        self.assertEqual(missing[self.partial], [self.ingredients[3].id])
+        self.assertEqual(missing[self.full], [])
+        self.assertEqual(missing[self.single], [self.ingredients[4].id])
+
+    def test_equal_matches_prefer_fewer_missing(self):
+        results = self.pantry(0, 1).json()
+
+        self.assertEqual(
+            [recipe['id'] for recipe in results],
+            [self.full, self.partial, self.single])
+
+    def test_limit_and_repeated_parameter(self):
+        response = self.client.get(
+            '/api/recipes/pantry/?ingredients={}&ingredients={}&limit=1'
+            .format(self.ingredients[0].id, self.ingredients[1].id))
+
+        self.assertEqual(
+            [recipe['id'] for recipe in response.json()], [self.full])
+
+    def test_invalid_parameters_are_rejected(self):
+        for query in ('', 'ingredients=abc', 'ingredients=1&limit=0',
+                      'ingredients=1&limit=51'):
+            with self.subTest(query=query):
+                response = self.client.get(f'/api/recipes/pantry/?{query}')
+                self.assertEqual(response.status_code, 400)
+
+    def test_unknown_ingredient_finds_nothing(self):
+        response = self.client.get(
+            '/api/recipes/pantry/', {'ingredients': '999999'})
+
+        self.assertEqual(response.json(), [])
+
+    def test_index_follows_recipe_changes(self):
+        response = self.client_for(self.author).patch(
+            f'/api/recipes/{self.single}/', {
+                'ingredients': [
+                    {'id': self.ingredients[number].id, 'amount': 1}
+                    for number in (1, 2, 5)
+                    ],
+                'tags': [self.tags[0].id],
+                'name': 'Рецепт',
+                'text': 'Описание',
+                'cooking_time': 10,
+                },
+            format='json',
+            )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.client_for(self.author).delete(f'/api/recipes/{self.full}/')
+
+        index = self.index()
+        pantry.rebuild()
+        self.assertEqual(self.index(), index)
+        self.assertEqual(
+            [recipe['id'] for recipe in self.pantry(5).json()],
+            [self.unrelated, self.single])
@@ -0,0 +1,93 @@
+from api import ranking
+from api.models import EMPTY_SCORE, Recipe
+from api.tests.base import RecipeAPITestCase
+
+
+class RankingTests(RecipeAPITestCase):
+    """Оценки популярности меняются при каждом добавлении и удалении."""
+
+    def setUp(self):
+        super().setUp()
+        self.recipes = [self.create_recipe({0: 10}) for _ in range(3)]
+        self.others = [self.create_user(f'fan{number}') for number in range(2)]
+
+    def scores(self):
+        return {
+            recipe_id: (popular, trending)
+            for recipe_id, popular, trending in Recipe.objects.values_list(
+                'id', 'popular_score', 'trending_score')
+            }
+
+    def assert_rebuild_matches(self):
+        scores = self.scores()
+        ranking.rebuild()
+        for recipe_id, values in self.scores().items():
+            for value, expected in zip(values, scores[recipe_id]):
+                self.assertAlmostEqual(value, expected, places=6)
+
+    def ordered(self, ordering, **params):
+        response = self.client.get(
+            '/api/recipes/', {'ordering': ordering, **params})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_add_and_remove_return_to_empty_score(self):
+        first, second, _ = self.recipes
+        self.client.post(f'/api/recipes/{first}/favorite/')
+        self.client.post(
+            '/api/recipes/shopping_cart/', {'ids': [first, second]},
+            format='json')
+
+        scores = self.scores()
+        self.assertGreater(scores[first][0], scores[second][0])
+        self.assertGreater(scores[second][0], EMPTY_SCORE)
+        self.assertEqual(scores[self.recipes[2]], (EMPTY_SCORE, EMPTY_SCORE))
+        self.assert_rebuild_matches()
+
+        self.client.delete(f'/api/recipes/{first}/favorite/')
+        self.client.delete(
+            '/api/recipes/shopping_cart/', {'ids': [first, second]},
+            format='json')
+
+        self.assertEqual(
+            set(self.scores().values()), {(EMPTY_SCORE, EMPTY_SCORE)})
+
+    def test_recipes_ordered_by_score(self):
+        first, second, third = self.recipes
+        for user in self.others:
+            self.client_for(user).post(f'/api/recipes/{first}/favorite/')
+        self.client.post(f'/api/recipes/{third}/favorite/')
+        self.client.post(f'/api/recipes/{first}/favorite/')
+
+        for ordering in ranking.ORDERINGS:
+            with self.subTest(ordering=ordering):
+                data = self.ordered(ordering)
+                self.assertEqual(
+                    [recipe['id'] for recipe in data['results']],
+                    [first, third, second])
+
+    def test_cursor_follows_score_order(self):
+        first, second, third = self.recipes
+        self.client.post(f'/api/recipes/{second}/favorite/')
+        ids, url = [], '/api/recipes/?ordering=popular&cursor=&limit=1'
+        while url:
+            data = self.client.get(url).json()
+            ids += [recipe['id'] for recipe in data['results']]
+            url = data['next']
+
+        self.assertEqual(ids, [second, third, first])
+
+    def test_scores_stay_out_of_responses(self):
+        self.client.post(f'/api/recipes/{self.recipes[0]}/favorite/')
+
+        listed = self.ordered('popular')['results'][0]
+        detail = self.client.get(f'/api/recipes/{self.recipes[0]}/').json()
+
+        for recipe in (listed, detail):
+            self.assertNotIn('popular_score', recipe)
+            self.assertNotIn('trending_score', recipe)
+
+    def test_unknown_ordering_is_rejected(self):
+        response = self.client.get('/api/recipes/', {'ordering': 'bogus'})
+
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,74 @@
+from api.tests.base import RecipeAPITestCase
+
+
+class SearchTests(RecipeAPITestCase):
+    """Полнотекстовый поиск по названию и описанию."""
+
+    def setUp(self):
+        super().setUp()
+        self.borsch = self.create_recipe(
+            {0: 100}, name='Борщ', text='Свекла, капуста и картофель')
+        self.soup = self.create_recipe(
+            {0: 100}, name='Суп с капустой', text='Щи без свеклы',
+            tags=self.tags[1:2])
+        self.pancakes = self.create_recipe(
+            {1: 10}, name='Оладьи', text='Кефир и мука')
+
+    def search(self, query, **params):
+        response = self.client.get(
+            '/api/recipes/', {'search': query, **params})
+        self.assertEqual(response.status_code, 200, response.content)
+        return [recipe['id'] for recipe in response.json()['results']]
+
+    def test_finds_words_in_name_and_text(self):
+        self.assertEqual(self.search('борщ'), [self.borsch])
+        self.assertEqual(self.search('кефир'), [self.pancakes])
+
+    def test_words_match_by_prefix_and_all_are_required(self):
+        self.assertEqual(
+            set(self.search('капуст')), {self.borsch, self.soup})
+        self.assertEqual(self.search('капуст щи'), [self.soup])
+
+    def test_name_match_ranks_first(self):
+        self.assertEqual(self.search('капуст'), [self.soup, self.borsch])
+
+    def test_case_and_operators_are_ignored(self):
+        self.assertEqual(self.search('БОРЩ!!'), [self.borsch])
+        self.assertEqual(self.search('" OR *'), [])
+
+    def test_blank_query_returns_all_recipes(self):
+        self.assertEqual(
+            self.search('  '), [self.pancakes, self.soup, self.borsch])
+
+    def test_combines_with_filters(self):
+        self.assertEqual(self.search('капуст', tags='tag1'), [self.soup])
+        self.client.post(f'/api/recipes/{self.borsch}/favorite/')
+        self.assertEqual(
+            self.search('капуст', is_favorited=1), [self.borsch])
+
+    def test_index_follows_updates_and_deletes(self):
+        response = self.client_for(self.author).patch(
+            f'/api/recipes/{self.pancakes}/', {
+                'ingredients': [{'id': self.ingredients[1].id,
+                                 'amount': 10}],
+                'tags': [self.tags[0].id],
+                'name': 'Борщ зеленый',
+                'text': 'Щавель',
+                'cooking_time': 10,
+                },
+            format='json',
+            )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.search('кефир'), [])
+        self.assertEqual(
+            set(self.search('борщ')), {self.borsch, self.pancakes})
+
+        self.client_for(self.author).delete(f'/api/recipes/{self.borsch}/')
+        self.assertEqual(self.search('борщ'), [self.pancakes])
+
+    def test_cursor_is_rejected_with_search(self):
+        response = self.client.get(
+            '/api/recipes/', {'search': 'борщ', 'cursor': ''})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('cursor', response.json())
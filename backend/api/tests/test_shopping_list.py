@@ -0,0 +1,95 @@
+from api import shopping_list
+from api.models import ShoppingListItem
+from api.tests.base import RecipeAPITestCase
+
+
+class ShoppingListTests(RecipeAPITestCase):
+    """Список покупок меняется на разницу при каждой правке корзины."""
+
+    def items(self, user=None):
+        return dict(ShoppingListItem.objects.filter(
+            user=user or self.user).values_list('ingredient_id', 'amount'))
+
+    def amounts(self, amounts):
+        return {
+            self.ingredients[number].id: amount
+            for number, amount in amounts.items()
+            }
+
+    def assert_rebuild_matches(self):
+        items = self.items()
+        shopping_list.rebuild()
+        self.assertEqual(self.items(), items)
+
+    def test_cart_changes_add_and_subtract_amounts(self):
+        first = self.create_recipe({0: 100, 1: 20})
+        second = self.create_recipe({1: 5, 2: 3})
+        self.client.post(f'/api/recipes/{first}/shopping_cart/')
+        self.client.post(f'/api/recipes/{second}/shopping_cart/')
+        self.assertEqual(self.items(), self.amounts({0: 100, 1: 25, 2: 3}))
+        self.assert_rebuild_matches()
+
+        self.client.delete(f'/api/recipes/{first}/shopping_cart/')
+        self.assertEqual(self.items(), self.amounts({1: 5, 2: 3}))
+        self.client.delete(f'/api/recipes/{second}/shopping_cart/')
+        self.assertEqual(self.items(), {})
+
+    def test_recipe_update_changes_lists_of_cart_users(self):
+        recipe = self.create_recipe({0: 100, 1: 20})
+        other = self.create_user('other')
+        self.client.post(f'/api/recipes/{recipe}/shopping_cart/')
+        self.client_for(other).post(f'/api/recipes/{recipe}/shopping_cart/')
+
+        response = self.client_for(self.author).patch(
+            f'/api/recipes/{recipe}/', {
+                'ingredients': [
+                    {'id': self.ingredients[1].id, 'amount': 30},
+                    {'id': self.ingredients[3].id, 'amount': 7},
+                    ],
+                'tags': [self.tags[0].id],
+                'name': 'Рецепт',
+                'text': 'Описание',
+                'cooking_time': 10,
+                },
+            format='json',
+            )
+
+        self.assertEqual(response.status_code, 200, response.content)
+        expected = self.amounts({1: 30, 3: 7})
+        self.assertEqual(self.items(), expected)
+        self.assertEqual(self.items(other), expected)
+        self.assert_rebuild_matches()
+
+    def test_recipe_delete_subtracts_its_ingredients(self):
+        kept = self.create_recipe({0: 10})
+        deleted = self.create_recipe({0: 5, 1: 1})
+        self.client.post(f'/api/recipes/{kept}/shopping_cart/')
+        self.client.post(f'/api/recipes/{deleted}/shopping_cart/')
+
+        self.client_for(self.author).delete(f'/api/recipes/{deleted}/')
+
+        self.assertEqual(self.items(), self.amounts({0: 10}))
+
+    def test_download_reflects_latest_changes(self):
+        first = self.create_recipe({0: 100})
+        second = self.create_recipe({0: 50, 1: 2})
+        self.client.post(f'/api/recipes/{first}/shopping_cart/')
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/?format=txt')
+        self.assertEqual(
+            b''.join(response.streaming_content).decode(),
+            'Ингредиент 0: 100 г\r\n')
+
+        self.client.post(f'/api/recipes/{second}/shopping_cart/')
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/?format=txt')
+
+        self.assertEqual(
+            b''.join(response.streaming_content).decode(),
+            'Ингредиент 0: 150 г\r\nИнгредиент 1: 2 г\r\n')
+
+    def test_empty_list_download_is_rejected(self):
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/?format=txt')
+
+        self.assertEqual(response.status_code, 400)
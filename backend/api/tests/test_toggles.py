@@ -0,0 +1,64 @@
+from api import membership
+from api.models import Favorite, Recipe, ShoppingCart
+from api.tests.base import RecipeAPITestCase
+
+
+class ToggleTests(RecipeAPITestCase):
+    """Избранное и корзина меняются одним запросом к таблице связи."""
+
+    def setUp(self):
+        super().setUp()
+        self.recipe = self.create_recipe({0: 10})
+
+    def test_favorite_add_and_remove_once(self):
+        url = f'/api/recipes/{self.recipe}/favorite/'
+
+        self.assertEqual(self.client.post(url).status_code, 201)
+        self.assertEqual(self.client.post(url).status_code, 400)
+        self.assertEqual(
+            Recipe.objects.get(id=self.recipe).favorites_count, 1)
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.client.delete(url).status_code, 400)
+        self.assertEqual(
+            Recipe.objects.get(id=self.recipe).favorites_count, 0)
+        self.assertFalse(Favorite.objects.exists())
+
+    def test_shopping_cart_add_and_remove_once(self):
+        url = f'/api/recipes/{self.recipe}/shopping_cart/'
+
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            response.json(), {'recipe': self.recipe, 'user': self.user.id})
+        self.assertEqual(self.client.post(url).status_code, 400)
+        self.assertEqual(ShoppingCart.objects.count(), 1)
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.client.delete(url).status_code, 400)
+        self.assertFalse(ShoppingCart.objects.exists())
+
+    def test_missing_recipe_is_not_found(self):
+        for url in ('/api/recipes/999999/favorite/',
+                    '/api/recipes/999999/shopping_cart/'):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.post(url).status_code, 404)
+                self.assertEqual(self.client.delete(url).status_code, 404)
+
+    def test_link_returns_only_changed_rows(self):
+        added = membership.link(
+            Favorite, self.user.id, [self.recipe, 999999])
+        self.assertEqual(list(added), [self.recipe])
+        self.assertEqual(
+            membership.link(Favorite, self.user.id, [self.recipe]), {})
+
+        removed = membership.unlink(
+            Favorite, self.user.id, [self.recipe, 999999])
+        self.assertEqual(list(removed), [self.recipe])
+        self.assertEqual(removed[self.recipe], added[self.recipe])
+        self.assertEqual(
+            membership.unlink(Favorite, self.user.id, [self.recipe]), {})
+
+    def test_anonymous_user_is_rejected(self):
+        client = self.client_class()
+        response = client.post(f'/api/recipes/{self.recipe}/favorite/')
+
+        self.assertEqual(response.status_code, 401)
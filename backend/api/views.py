@@ -1,23 +1,147 @@
-from django.db.models import F, Sum
-from django.http.response import HttpResponse
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Prefetch
+from django.http.response import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
 from rest_framework import status
 from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.parsers import JSONParser
+from rest_framework.permissions import SAFE_METHODS, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 
+from api import cache as recipe_cache
+from api import counters
+from api import feed as recipe_feed
+from api import images, membership
+from api import pantry as recipe_pantry
+from api import ranking, shopping_list
+from api import similar as recipe_similar
 from api.filters import (FavoritedAndshoppingCartAndAuthorAndTagFilter,
-                         IngredientSearchFilter)
+                         IngredientAutocompleteFilter, IngredientSearchFilter)
+from api.membership import get_membership
 from api.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
-                        ShoppingCart, Tag)
-from api.pagination import LimitPageNumberPagination
+                        ShoppingCart, ShoppingListItem, Tag)
+from api.pagination import KeysetPagination, RecipePagination
+from api.parsers import RecipeMultiPartParser
 from api.permissions import IsAdmin, IsOwner, ReadOnly
-from api.serializers import (FavoriteSerializer, IngredientSerializer,
+from api.renderers import SHOPPING_LIST_RENDERERS
+from api.serializers import (BulkIdsSerializer, FavoriteSerializer,
+                             IngredientRepresentationSerializer,
+                             IngredientSerializer, PantrySerializer,
                              RecipeSerializer, TagSerializer)
+from users.serializers import ShoppingCartSerializer
 
 
-class TagViewSet(ReadOnlyModelViewSet):
+class CatalogConditionalMixin:
+    """
+    Условные GET-запросы к справочникам.
+    Версия справочника — число записей и время последней правки;
+    при совпадении If-None-Match или If-Modified-Since ответ 304
+    отдается без обращения к сериализатору.
+    """
+
+    catalog_max_age = settings.CATALOG_CACHE_MAX_AGE
+
+    def get_catalog_version(self):
+        model = self.get_queryset().model
+        state = model.objects.aggregate(
+            total=Count('id'), updated=Max('updated'))
+        updated = state['updated']
+        last_modified = int(updated.timestamp()) if updated else 0
+        etag = quote_etag(
+            f'{model._meta.model_name}-{state["total"]}-'
+            f'{updated.timestamp() if updated else 0}')
+        return etag, last_modified
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return super().dispatch(request, *args, **kwargs)
+        etag, last_modified = self.get_catalog_version()
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = super().dispatch(request, *args, **kwargs)
+        if response.status_code in (status.HTTP_200_OK,
+                                    status.HTTP_304_NOT_MODIFIED):
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+            patch_cache_control(
+                response, public=True, max_age=self.catalog_max_age)
+        return response
+
+
+class BulkMembershipMixin:
+    """
+    Массовое добавление (POST) и удаление (DELETE) избранного, корзины
+    или подписок по списку {"ids": [...]}. Весь список применяется
+    в одной транзакции одним INSERT или одним DELETE, для каждого id
+    возвращается свой результат со статусом и текстом ошибки
+    одиночного действия.
+    """
+
+    bulk_errors = {
+        'POST': 'Данный объект уже создан.',
+        'DELETE': 'Невозможно удалить. Данного объекта не существует.',
+        }
+    not_found_error = 'Не найдено.'
+
+    def invalidate_membership(self, request, model):
+        """Сброс закэшированных в запросе избранного, корзины или подписок."""
+
+        get_membership(request).invalidate(membership.NAMES[model])
+
+    def bulk_membership(self, request, model, targets, apply,
+                        rejected=None):
+        """
+        Изменение связей пользователя с целями targets по списку id.
+        apply(user_id, changed, model, delta) в той же транзакции
+        переносит добавление (1) или удаление (-1) в производные данные,
+        changed — {id цели: время добавления связи}.
+        rejected — id, недопустимые для пользователя, с текстом ошибки.
+        Наличие целей проверяется одним запросом только для тех id,
+        связь с которыми не изменилась.
+        """
+
+        serializer = BulkIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = list(dict.fromkeys(serializer.validated_data['ids']))
+        rejected = rejected or {}
+        allowed = [pk for pk in ids if pk not in rejected]
+        adding = request.method == 'POST'
+        change = membership.link if adding else membership.unlink
+        with transaction.atomic():
+            changed = change(model, request.user.id, allowed)
+            if changed:
+                apply(
+                    request.user.id, dict(sorted(changed.items())), model,
+                    1 if adding else -1)
+        if changed:
+            self.invalidate_membership(request, model)
+        unchanged = [pk for pk in allowed if pk not in changed]
+        existing = set(targets.filter(id__in=unchanged).values_list(
+            'id', flat=True)) if unchanged else set()
+        success = (status.HTTP_201_CREATED if adding
+                   else status.HTTP_204_NO_CONTENT)
+        results = []
+        for pk in ids:
+            if pk in changed:
+                results.append({'id': pk, 'status': success})
+            elif pk in rejected:
+                results.append({'id': pk, 'status': 400,
+                                'errors': rejected[pk]})
+            elif pk in existing:
+                results.append({'id': pk, 'status': 400,
+                                'errors': self.bulk_errors[request.method]})
+            else:
+                results.append({'id': pk, 'status': 404,
+                                'errors': self.not_found_error})
+        return Response(results)
+
+
+class TagViewSet(CatalogConditionalMixin, ReadOnlyModelViewSet):
     """
     Обработка тегов по запросу.
     Права на изменение тегов только у Администратора.
@@ -28,7 +152,7 @@ class TagViewSet(ReadOnlyModelViewSet):
     permission_classes = [IsAdmin | ReadOnly]
 
 
-class IngredientViewSet(ReadOnlyModelViewSet):
+class IngredientViewSet(CatalogConditionalMixin, ReadOnlyModelViewSet):
     """
     Обработка запросов связанных с игридиентами.
     Права на изменение ингридиентов только у Администратора.
@@ -40,49 +164,253 @@ class IngredientViewSet(ReadOnlyModelViewSet):
     filter_backends = [IngredientSearchFilter, ]
     search_fields = ['^name', ]
 
+    @action(
+        methods=['get'],
+        detail=False,
+        url_path='autocomplete',
+        url_name='autocomplete',
+        filter_backends=[IngredientAutocompleteFilter],
+        )
+    def autocomplete(self, request):
+        """Подсказки при вводе названия: ?name=...&limit=..."""
+
+        ingredients = self.filter_queryset(self.get_queryset())
+        serializer = self.get_serializer(ingredients, many=True)
+        return Response(serializer.data)
 
-class RecipeViewSet(ModelViewSet):
+
+class RecipeViewSet(BulkMembershipMixin, ModelViewSet):
     """
     Обработка запросов, связанных с рецептами.
     Права доступа на изменение: Автор, Администратор.
     """
     queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
-    pagination_class = LimitPageNumberPagination
+    pagination_class = RecipePagination
+    parser_classes = [JSONParser, RecipeMultiPartParser]
     filter_class = FavoritedAndshoppingCartAndAuthorAndTagFilter
     permission_classes = [IsOwner | IsAdmin | ReadOnly]
+    lookup_value_regex = r'\d+'
+    original_image_size = 'original'
+
+    def get_queryset(self):
+        """
+        Рецепты для чтения загружаются вместе с автором, тегами и
+        ингредиентами, чтобы страница любого размера отдавалась
+        за постоянное число запросов.
+        """
+
+        queryset = Recipe.objects.select_related('author')
+        if self.request.method not in SAFE_METHODS:
+            return queryset
+        return queryset.prefetch_related(
+            Prefetch('tags', to_attr='tag_list'),
+            Prefetch(
+                'ingredientinrecipe_set',
+                queryset=IngredientInRecipe.objects.select_related(
+                    'ingredient'),
+                to_attr='ingredient_amounts',
+                ),
+            )
+
+    def get_image_size(self):
+        """
+        Размер изображения в ответе: ?image_size=thumbnail|card|full|original,
+        по умолчанию card для списка, ленты и подбора по продуктам,
+        full для остальных действий.
+        """
+
+        sizes = dict(images.SIZES)
+        size = self.request.query_params.get('image_size')
+        if size == self.original_image_size:
+            return None
+        if size in sizes:
+            return size
+        if self.action in ('list', 'feed', 'pantry'):
+            return images.CARD
+        return images.FULL
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.request is not None:
+            context['image_size'] = self.get_image_size()
+        return context
+
+    def list(self, request, *args, **kwargs):
+        """Страницы списка отдаются из кэша с признаками пользователя."""
+
+        if not recipe_cache.is_cacheable(request):
+            return super().list(request, *args, **kwargs)
+        key = recipe_cache.list_key(request)
+        data = recipe_cache.load(key)
+        if data is None:
+            data = super().list(request, *args, **kwargs).data
+            recipe_cache.store(key, data)
+        else:
+            recipe_cache.refresh_favorites(data['results'])
+        recipe_cache.overlay(data['results'], request)
+        return Response(data)
+
+    def retrieve(self, request, *args, **kwargs):
+        """Рецепт отдается из кэша с признаками пользователя."""
+
+        key = recipe_cache.detail_key(request, kwargs['pk'])
+        data = recipe_cache.load(key)
+        if data is None:
+            data = super().retrieve(request, *args, **kwargs).data
+            recipe_cache.store(key, data)
+        else:
+            recipe_cache.refresh_favorites([data])
+        recipe_cache.overlay([data], request)
+        return Response(data)
 
     def perform_create(self, serializer):
         """Добавление рецепта."""
 
         serializer.save(author=self.request.user)
 
+    def perform_destroy(self, instance):
+        """
+        Удаление рецепта с вычетом его из списков покупок, индекса
+        продуктов и счетчика и освобождением ссылки на изображение.
+        """
+
+        with transaction.atomic():
+            shopping_list.delete_recipe(instance.id)
+            recipe_pantry.delete_recipes([instance.id])
+            instance.delete()
+            counters.change_recipes(instance.author_id, -1)
+            images.release(instance.image.name)
+
+    @action(
+        methods=['get'],
+        detail=False,
+        permission_classes=[IsAuthenticated],
+        url_path='feed',
+        url_name='feed',
+        )
+    def feed(self, request):
+        """
+        Лента рецептов авторов, на которых подписан пользователь:
+        ?cursor=...&limit=... Страница ленты и рецепты авторов
+        вне ленты выбираются по ключу и сливаются, затем рецепты
+        страницы загружаются одним запросом с тегами и ингредиентами.
+        """
+
+        paginator = KeysetPagination(ordering=recipe_feed.ORDERING)
+        entries = paginator.paginate_querysets(
+            [recipe_feed.entries(request.user),
+             recipe_feed.merged(request.user)],
+            request,
+            )
+        recipes = self.get_queryset().in_bulk(
+            [entry.recipe_id for entry in entries])
+        serializer = self.get_serializer(
+            [recipes[entry.recipe_id] for entry in entries
+             if entry.recipe_id in recipes],
+            many=True,
+            )
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(
+        methods=['get'],
+        detail=False,
+        url_path='pantry',
+        url_name='pantry',
+        )
+    def pantry(self, request):
+        """
+        Подбор рецептов по продуктам в наличии: ?ingredients=1,2,3&limit=...
+        Сначала рецепты, в которых есть больше продуктов из списка,
+        у каждого — число совпадений и недостающие ингредиенты.
+        """
+
+        params = request.query_params
+        data = {'ingredients': [
+            value for values in params.getlist('ingredients')
+            for value in values.split(',') if value
+            ]}
+        if 'limit' in params:
+            data['limit'] = params['limit']
+        query = PantrySerializer(data=data)
+        query.is_valid(raise_exception=True)
+        have = set(query.validated_data['ingredients'])
+        ranked = recipe_pantry.rank(have, query.validated_data['limit'])
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _, _ in ranked])
+        found = [
+            (recipes[recipe_id], matched)
+            for recipe_id, matched, _ in ranked if recipe_id in recipes
+            ]
+        results = self.get_serializer(
+            [recipe for recipe, _ in found], many=True).data
+        for result, (recipe, matched) in zip(results, found):
+            result['matched_count'] = matched
+            result['missing_ingredients'] = (
+                IngredientRepresentationSerializer(
+                    [amount for amount in recipe.ingredient_amounts
+                     if amount.ingredient_id not in have],
+                    many=True,
+                    ).data
+                )
+        return Response(results)
+
+    @action(
+        methods=['get'],
+        detail=True,
+        url_path='similar',
+        url_name='similar',
+        )
+    def similar(self, request, pk=None):
+        """
+        Похожие рецепты по общим ингредиентам и тегам, от более похожих
+        к менее, со сходством от 0 до 1 в поле similarity.
+        """
+
+        rows = list(recipe_similar.similar_to(pk))
+        if not rows:
+            get_object_or_404(Recipe, pk=pk)
+        results = ShoppingCartSerializer(
+            [row.similar for row in rows],
+            many=True,
+            context=self.get_serializer_context(),
+            ).data
+        for result, row in zip(results, rows):
+            result['similarity'] = round(row.score, 3)
+        return Response(results)
+
     @action(
         methods=['get'],
         detail=False,
         permission_classes=[IsAuthenticated],
         url_path='download_shopping_cart',
         url_name='download_shopping_cart',
+        renderer_classes=SHOPPING_LIST_RENDERERS,
         )
     def download_shopping_cart(self, request):
-        """Выгрузка данных о покупке в текстовом формате."""
+        """
+        Выгрузка списка покупок: ?format=txt|csv|json|pdf.
+        Файл пишется в ответ частями прямо из курсора и сохраняется
+        в кэше до следующего изменения списка.
+        """
 
-        user = request.user
-        if not user.shopping_carts.exists():
-            return Response(status=status.HTTP_400_BAD_REQUEST)
-        ingredients = IngredientInRecipe.objects.filter(
-            recipe__shopping_carts__user=user
-        ).values('ingredient__name', 'ingredient__measurement_unit').annotate(
-            name=F('ingredient__name'),
-            unit=F('ingredient__measurement_unit'),
-            total_amount=Sum('amount')
-            ).order_by('-total_amount')
-        buy_list = '\r\n'.join(
-            [(f"{ing['name']}: {ing['total_amount']} {ing['unit']} ")
-             for ing in ingredients]
-            )
-        response = HttpResponse(buy_list, 'Content-Type: text/plain')
-        response['Content-Disposition'] = 'attachment; filename="buy_list.txt"'
+        renderer = request.accepted_renderer
+        key = recipe_cache.shopping_list_key(request.user.id, renderer.format)
+        content = recipe_cache.load(key)
+        if content is not None:
+            chunks = [content]
+        else:
+            items = ShoppingListItem.objects.filter(user=request.user)
+            if not items.exists():
+                return Response(status=status.HTTP_400_BAD_REQUEST)
+            rows = items.values_list(
+                'ingredient__name', 'amount', 'ingredient__measurement_unit'
+                ).order_by('-amount', 'ingredient__name').iterator()
+            chunks = recipe_cache.store_stream(key, renderer.stream(rows))
+        response = StreamingHttpResponse(
+            chunks, content_type=renderer.content_type)
+        response['Content-Disposition'] = (
+            f'attachment; filename="buy_list.{renderer.extension}"')
         return response
 
     @action(
@@ -107,24 +435,60 @@ class RecipeViewSet(ModelViewSet):
         """Добавление и удаление рецепта из избранное."""
         return self.metod_delete_create(request, pk, Favorite)
 
+    @action(
+        methods=['post', 'delete'],
+        detail=False,
+        permission_classes=[IsAuthenticated],
+        url_path='shopping_cart',
+        url_name='shopping_cart-bulk',
+        )
+    def shopping_cart_bulk(self, request):
+        """Добавление и удаление рецептов списка ids в список покупок."""
+        return self.bulk_membership(
+            request, ShoppingCart, Recipe.objects, self.apply_membership)
+
+    @action(
+        methods=['post', 'delete'],
+        detail=False,
+        permission_classes=[IsAuthenticated],
+        url_path='favorite',
+        url_name='favorite-bulk',
+        )
+    def favorite_bulk(self, request):
+        """Добавление и удаление рецептов списка ids в избранное."""
+        return self.bulk_membership(
+            request, Favorite, Recipe.objects, self.apply_membership)
+
     def metod_delete_create(self, request, pk, model):
+        """
+        Добавление (POST) или удаление (DELETE) связи одним запросом
+        к таблице связи. Ответ определяется числом затронутых строк,
+        наличие рецепта проверяется только при неудаче.
+        """
+
         user = request.user
-        recipe = get_object_or_404(Recipe, id=pk)
+        recipe_id = int(pk)
         if request.method == 'POST':
-            creation_model = model.objects.filter(user=user, recipe=recipe)
-            if creation_model.exists():
+            with transaction.atomic():
+                added = membership.link(model, user.id, [recipe_id])
+                if added:
+                    self.apply_membership(user.id, added, model, 1)
+            if not added:
+                get_object_or_404(Recipe, id=recipe_id)
                 return Response(
                     {'errors': 'Данный объект уже создан.'},
                     status=status.HTTP_400_BAD_REQUEST
                     )
-            favorite = model.objects.create(user=user, recipe=recipe)
-            serializer = FavoriteSerializer(favorite)
+            self.invalidate_membership(request, model)
+            serializer = FavoriteSerializer(
+                model(user=user, recipe_id=recipe_id))
             return Response(serializer.data, status=status.HTTP_201_CREATED)
-        if request.method == 'DELETE':
-            delete_model = model.objects.filter(user=user, recipe=recipe)
-            if delete_model.exists():
-                delete_model.delete()
-                return Response(status=status.HTTP_204_NO_CONTENT)
+        with transaction.atomic():
+            removed = membership.unlink(model, user.id, [recipe_id])
+            if removed:
+                self.apply_membership(user.id, removed, model, -1)
+        if not removed:
+            get_object_or_404(Recipe, id=recipe_id)
             return Response(
                 {
                     'errors': 'Невозможно удалить. '
@@ -132,3 +496,24 @@ class RecipeViewSet(ModelViewSet):
                     },
                 status=status.HTTP_400_BAD_REQUEST
                 )
+        self.invalidate_membership(request, model)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def apply_membership(self, user_id, changed, model, delta):
+        """
+        Перенос добавления (1) или удаления (-1) рецептов в производные
+        данные: список покупок или счетчики избранного и оценки
+        популярности.
+        """
+
+        recipe_ids = list(changed)
+        if model is ShoppingCart:
+            if delta > 0:
+                shopping_list.add_recipes(user_id, recipe_ids)
+            else:
+                shopping_list.remove_recipes(user_id, recipe_ids)
+            ranking.change(changed, delta)
+        else:
+            counters.change_favorites(
+                recipe_ids, delta, **ranking.updates(changed, delta))
+        recipe_cache.invalidate_ranking()
@@ -112,6 +112,11 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
+# Внутренний адрес nginx, из которого отдаются файлы MEDIA_ROOT
+# (X-Accel-Redirect). По умолчанию файлы отдает Django, за nginx
+# адрес задается в окружении, см. infra/docker-compose.yml.
+MEDIA_ACCEL_REDIRECT = os.getenv('MEDIA_ACCEL_REDIRECT', '')
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework.authentication.TokenAuthentication',
@@ -123,6 +128,58 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Бэкенд кэша: локальная память процесса по умолчанию, файловый кэш
+# (django.core.cache.backends.filebased.FileBasedCache) или Redis
+# (django_redis.cache.RedisCache), адрес или путь задается в CACHE_LOCATION.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    },
+}
+
+RECIPE_CACHE_ALIAS = 'default'
+RECIPE_CACHE_TIMEOUT = int(os.getenv('RECIPE_CACHE_TIMEOUT', 60 * 60))
+
+# Срок кэширования справочников тегов и ингредиентов клиентом (секунды).
+CATALOG_CACHE_MAX_AGE = int(os.getenv('CATALOG_CACHE_MAX_AGE', 60 * 60 * 24))
+
+# Наибольший размер изображения рецепта в multipart/form-data (байты).
+RECIPE_IMAGE_MAX_SIZE = int(
+    os.getenv('RECIPE_IMAGE_MAX_SIZE', 10 * 1024 * 1024))
+
+# Наибольшее число id в одном запросе массового добавления и удаления.
+BULK_MAX_IDS = int(os.getenv('BULK_MAX_IDS', 100))
+
+# Авторы, у которых больше подписчиков, не раскладываются в ленты
+# подписок при публикации: их рецепты подмешиваются при чтении ленты.
+FEED_FANOUT_LIMIT = int(os.getenv('FEED_FANOUT_LIMIT', 10000))
+
+# Конфигурация полнотекстового поиска рецептов на PostgreSQL.
+RECIPE_SEARCH_CONFIG = os.getenv('RECIPE_SEARCH_CONFIG', 'russian')
+
+# Наибольшее число продуктов в запросе подбора рецептов по наличию.
+PANTRY_MAX_INGREDIENTS = int(os.getenv('PANTRY_MAX_INGREDIENTS', 100))
+
+# Число похожих рецептов у каждого рецепта.
+SIMILAR_RECIPES_COUNT = int(os.getenv('SIMILAR_RECIPES_COUNT', 10))
+
+# Ингредиенты и теги, которые есть у большей доли рецептов, учитываются
+# в сходстве, но сами по себе не делают рецепты похожими.
+SIMILAR_COMMON_SHARE = float(os.getenv('SIMILAR_COMMON_SHARE', 0.05))
+
+# Периоды полураспада оценок популярности (сутки): вклад добавления
+# в избранное или список покупок в ordering=popular и ordering=trending
+# уменьшается вдвое за это время. После изменения выполните recount.
+POPULAR_HALF_LIFE_DAYS = float(os.getenv('POPULAR_HALF_LIFE_DAYS', 30))
+TRENDING_HALF_LIFE_DAYS = float(os.getenv('TRENDING_HALF_LIFE_DAYS', 2))
+
+# TTF-шрифт с кириллицей для выгрузки списка покупок в PDF.
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf')
+
 DJOSER = {
     'LOGIN_FIELD': 'email',
     'HIDE_USERS': False,
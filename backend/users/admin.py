@@ -1,14 +1,28 @@
 from django.contrib import admin
+from django.db import transaction
 
+from api import accounts, counters, feed
 from users.models import Subscription, User
 
 
 class UserAdmin(admin.ModelAdmin):
-    list_display = ('username', 'email', 'id')
+    list_display = ('username', 'email', 'id', 'recipes_count',
+                    'followers_count')
+    readonly_fields = ('recipes_count', 'followers_count')
     list_filter = ('username', 'email')
     search_fields = ('username', 'email')
     empty_value_display = '-пусто-'
 
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            accounts.delete_users([obj.id])
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            accounts.delete_users(list(queryset.values_list('id', flat=True)))
+            super().delete_queryset(request, queryset)
+
 
 class SubscriptionAdmin(admin.ModelAdmin):
     list_display = ('user', 'author')
@@ -16,6 +30,33 @@ class SubscriptionAdmin(admin.ModelAdmin):
     search_fields = ('user', )
     empty_value_display = '-пусто-'
 
+    def save_model(self, request, obj, form, change):
+        """Правка подписки меняет счетчики подписчиков и ленты."""
+
+        changed = not change or {'user', 'author'} & set(form.changed_data)
+        with transaction.atomic():
+            if change and changed:
+                counters.change_followers([form.initial['author']], -1)
+                feed.unfollow(form.initial['user'], [form.initial['author']])
+            super().save_model(request, obj, form, change)
+            if changed:
+                counters.change_followers([obj.author_id], 1)
+                feed.follow(obj.user_id, [obj.author_id])
+
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            super().delete_model(request, obj)
+            counters.change_followers([obj.author_id], -1)
+            feed.unfollow(obj.user_id, [obj.author_id])
+
+    def delete_queryset(self, request, queryset):
+        pairs = list(queryset.values_list('user_id', 'author_id'))
+        with transaction.atomic():
+            super().delete_queryset(request, queryset)
+            for user_id, author_id in pairs:
+                counters.change_followers([author_id], -1)
+                feed.unfollow(user_id, [author_id])
+
 
 admin.site.register(User, UserAdmin)
 admin.site.register(Subscription, SubscriptionAdmin)
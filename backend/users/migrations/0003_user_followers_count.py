@@ -0,0 +1,32 @@
+# Generated by Django 2.2.16 on 2026-10-18 17:27
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_followers(apps, schema_editor):
+    """Начальные значения счетчика по существующим подпискам."""
+
+    Subscription = apps.get_model('users', 'Subscription')
+    User = apps.get_model('users', 'User')
+    followers = Subscription.objects.filter(author=OuterRef('pk')).order_by(
+        ).values('author').annotate(total=Count('id')).values('total')
+    User.objects.update(followers_count=Coalesce(
+        Subquery(followers, output_field=IntegerField()), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_user_recipes_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Подписчиков'),
+        ),
+        migrations.RunPython(fill_followers, migrations.RunPython.noop),
+    ]
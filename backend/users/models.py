@@ -27,6 +27,10 @@ class User(AbstractUser):
     password = models.CharField(verbose_name='Пароль', max_length=150)
     role = models.CharField(verbose_name='Роль', max_length=200,
                             choices=ROLE_CHOICES, default=AUTHENTICATED)
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Рецептов', default=0, editable=False)
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Подписчиков', default=0, editable=False)
 
     USERNAME_FIELD = 'username'
     REQUIRED_FIELDS = ['email', 'first_name', 'last_name', 'password']
@@ -44,6 +48,14 @@ class User(AbstractUser):
     def __str__(self):
         return self.username
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Загруженные значения, чтобы при сохранении увидеть изменения."""
+
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
     @property
     def is_admin(self):
         return self.role == User.ADMINISTRATOR
@@ -1,6 +1,14 @@
 from rest_framework.pagination import PageNumberPagination
 
+from api.pagination import OptionalKeysetPagination
+
 
 class LimitPageNumberPagination(PageNumberPagination):
     page_size = 6
     page_size_query_param = 'limit'
+
+
+class SubscriptionPagination(OptionalKeysetPagination):
+    """Подписки: по номеру страницы или по ключу id при наличии cursor."""
+
+    keyset_ordering = ('-id',)
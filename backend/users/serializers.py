@@ -1,9 +1,11 @@
 from djoser.serializers import UserCreateSerializer, UserSerializer
-from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 from rest_framework.serializers import ModelSerializer
 from rest_framework.validators import UniqueValidator
 
+from api import images
+from api.fields import RecipeImageField
+from api.membership import get_membership
 from api.models import Recipe
 from users.models import Subscription, User
 
@@ -55,16 +57,14 @@ class CustomUserSerializer(UserSerializer):
         }
 
     def get_is_subscribed(self, obj):
-        user = self.context.get('request').user
-        return user.is_authenticated and Subscription.objects.filter(
-            user=user, author=obj.id
-        ).exists()
+        request = self.context.get('request')
+        return obj.id in get_membership(request).following
 
 
 class ShoppingCartSerializer(ModelSerializer):
     """Серилайзер для модели ShoppingCart."""
 
-    image = Base64ImageField()
+    image = RecipeImageField(size=images.CARD)
 
     class Meta:
         model = Recipe
@@ -72,6 +72,25 @@ class ShoppingCartSerializer(ModelSerializer):
         read_only_fields = ('id', 'name', 'image', 'cooking_time')
 
 
+class RecipesLimitSerializer(serializers.Serializer):
+    """Число последних рецептов автора в ответе о подписках."""
+
+    recipes_limit = serializers.IntegerField(
+        min_value=1, max_value=100, required=False)
+
+
+def get_recipes_limit(request):
+    """Проверенный параметр recipes_limit или None, если его нет."""
+
+    data = {}
+    limit = request.query_params.get('recipes_limit')
+    if limit:
+        data['recipes_limit'] = limit
+    query = RecipesLimitSerializer(data=data)
+    query.is_valid(raise_exception=True)
+    return query.validated_data.get('recipes_limit')
+
+
 class SubscriptionSerializer(serializers.ModelSerializer):
     """Серилайзер для подписки."""
 
@@ -84,7 +103,7 @@ class SubscriptionSerializer(serializers.ModelSerializer):
     last_name = serializers.ReadOnlyField(source='author.last_name')
     is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.ReadOnlyField(source='author.recipes_count')
 
     class Meta:
         model = Subscription
@@ -95,17 +114,14 @@ class SubscriptionSerializer(serializers.ModelSerializer):
         }
 
     def get_is_subscribed(self, obj):
-        return Subscription.objects.filter(
-            user=obj.user, author=obj.author
-        ).exists()
+        request = self.context.get('request')
+        return obj.author_id in get_membership(request).following
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
-        queryset = Recipe.objects.filter(author=obj.author)
-        if limit:
-            queryset = queryset[:int(limit)]
+        queryset = getattr(obj.author, 'latest_recipes', None)
+        if queryset is None:
+            limit = self.context.get('recipes_limit')
+            queryset = Recipe.objects.filter(author=obj.author)
+            if limit:
+                queryset = queryset[:limit]
         return ShoppingCartSerializer(queryset, many=True).data
-
-    def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj.author).count()
@@ -0,0 +1,35 @@
+from api.tests.base import RecipeAPITestCase
+from users.models import Subscription, User
+
+
+class SubscribeToggleTests(RecipeAPITestCase):
+    """Подписка меняется одним запросом к таблице подписок."""
+
+    def followers(self):
+        return User.objects.get(id=self.author.id).followers_count
+
+    def test_subscribe_and_unsubscribe_once(self):
+        url = f'/api/users/{self.author.id}/subscribe/'
+
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(response.json()['is_subscribed'])
+        self.assertEqual(self.client.post(url).status_code, 400)
+        self.assertEqual(self.followers(), 1)
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.client.delete(url).status_code, 400)
+        self.assertEqual(self.followers(), 0)
+        self.assertFalse(Subscription.objects.exists())
+
+    def test_self_subscription_is_rejected(self):
+        url = f'/api/users/{self.user.id}/subscribe/'
+
+        self.assertEqual(self.client.post(url).status_code, 400)
+        self.assertEqual(self.client.delete(url).status_code, 400)
+        self.assertFalse(Subscription.objects.exists())
+
+    def test_missing_author_is_not_found(self):
+        url = '/api/users/999999/subscribe/'
+
+        self.assertEqual(self.client.post(url).status_code, 404)
+        self.assertEqual(self.client.delete(url).status_code, 404)
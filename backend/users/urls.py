@@ -10,6 +10,5 @@ router.register("users", CustomUserViewset)
 
 urlpatterns = [
     path('', include(router.urls)),
-    path('', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken')),
 ]
@@ -1,3 +1,5 @@
+from django.db import transaction
+from django.db.models import OuterRef, Prefetch, Subquery
 from djoser import views
 from rest_framework import status
 from rest_framework.decorators import action
@@ -5,18 +7,42 @@ from rest_framework.generics import get_object_or_404
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
+from api import accounts, counters, feed, membership
+from api.membership import get_membership
+from api.models import Recipe
+from api.views import BulkMembershipMixin
 from users.models import Subscription, User
-from users.pagination import LimitPageNumberPagination
-from users.serializers import SubscriptionSerializer
+from users.pagination import LimitPageNumberPagination, SubscriptionPagination
+from users.serializers import SubscriptionSerializer, get_recipes_limit
 
 
-class CustomUserViewset(views.UserViewSet):
+class CustomUserViewset(BulkMembershipMixin, views.UserViewSet):
     """
     Стандартный djoser класс пользователя с
     добавлением методов управления подписками.
     """
 
     pagination_class = LimitPageNumberPagination
+    lookup_value_regex = r'\d+'
+    bulk_errors = {
+        'POST': 'Вы уже подписаны на данного пользователя.',
+        'DELETE': 'Вы не подписаны на данного пользователя.',
+        }
+    # Вход выполняется по email: маршруты смены username из djoser
+    # проверяют new_email, а читают new_username, и не подключаются.
+    set_username = None
+    reset_username = None
+    reset_username_confirm = None
+
+    def perform_destroy(self, instance):
+        """
+        Удаление пользователя с правкой списков покупок, счетчиков
+        и оценок, которые зависят от его рецептов и связей.
+        """
+
+        with transaction.atomic():
+            accounts.delete_users([instance.id])
+            super().perform_destroy(instance)
 
     @action(
         methods=['get'],
@@ -24,12 +50,31 @@ class CustomUserViewset(views.UserViewSet):
         permission_classes=[IsAuthenticated],
         url_path='subscriptions',
         url_name='subscriptions',
+        pagination_class=SubscriptionPagination,
         )
     def subscriptions(self, request):
-        """метод запроса подписок."""
+        """
+        метод запроса подписок.
+        Авторы, их последние recipes_limit рецептов и количество
+        рецептов загружаются за постоянное число запросов.
+        """
 
         user = request.user
-        queryset = Subscription.objects.filter(user=user)
+        recipes = Recipe.objects.order_by('-pub_date', '-id')
+        limit = get_recipes_limit(request)
+        if limit:
+            recipes = recipes.filter(id__in=Subquery(
+                Recipe.objects.filter(
+                    author=OuterRef('author')
+                    ).order_by('-pub_date', '-id').values('id')[:limit]
+                ))
+        queryset = Subscription.objects.filter(
+            user=user
+            ).select_related('author').prefetch_related(Prefetch(
+                'author__recipes',
+                queryset=recipes,
+                to_attr='latest_recipes',
+                )).order_by('-id')
         pages = self.paginate_queryset(queryset)
         serializer = SubscriptionSerializer(
             pages,
@@ -38,6 +83,24 @@ class CustomUserViewset(views.UserViewSet):
         )
         return self.get_paginated_response(serializer.data)
 
+    @action(
+        methods=['post', 'delete'],
+        detail=False,
+        permission_classes=[IsAuthenticated],
+        url_path='subscribe',
+        url_name='subscribe-bulk',
+        )
+    def subscribe_bulk(self, request):
+        """Подписка на авторов списка ids и отписка от них."""
+
+        rejected = {request.user.id: (
+            'Вы не можете подписаться сами на себя.'
+            if request.method == 'POST' else
+            'Вы не можете отписаться сами от себя.')}
+        return self.bulk_membership(
+            request, Subscription, User.objects, self.apply_membership,
+            rejected)
+
     @action(
         methods=['post', 'delete'],
         detail=True,
@@ -46,36 +109,56 @@ class CustomUserViewset(views.UserViewSet):
         url_name='subscribe',
         )
     def subscribe(self, request, id=None):
-        """Метод управления подписками."""
+        """
+        Метод управления подписками.
+        Подписка добавляется и удаляется одним запросом к таблице
+        подписок, наличие автора проверяется только при неудаче.
+        """
 
+        user = request.user
+        author_id = int(id)
+        if author_id == user.id:
+            return Response(
+                {'errors': 'Вы не можете подписаться сами на себя.'
+                 if request.method == 'POST' else
+                 'Вы не можете отписаться сами от себя.'},
+                status=status.HTTP_400_BAD_REQUEST)
         if request.method == 'POST':
-            user = request.user
-            author = get_object_or_404(User, id=id)
-            if user == author:
-                return Response(
-                    {'errors': 'Вы не можете подписаться сами на себя.'},
-                    status=status.HTTP_400_BAD_REQUEST)
-            if Subscription.objects.filter(user=user, author=author).exists():
+            limit = get_recipes_limit(request)
+            with transaction.atomic():
+                added = membership.link(Subscription, user.id, [author_id])
+                if added:
+                    self.apply_membership(user.id, added, Subscription, 1)
+            if not added:
+                get_object_or_404(User, id=author_id)
                 return Response(
                     {'errors': 'Вы уже подписаны на данного пользователя.'},
                     status=status.HTTP_400_BAD_REQUEST)
-            follow = Subscription.objects.create(user=user, author=author)
+            get_membership(request).invalidate('following')
+            follow = Subscription(
+                user=user, author=User.objects.get(id=author_id))
             serializer = SubscriptionSerializer(
-                follow, context={'request': request}
+                follow, context={'request': request, 'recipes_limit': limit}
             )
             return Response(serializer.data, status=status.HTTP_201_CREATED)
-        if request.method == 'DELETE':
-            user = request.user
-            author = get_object_or_404(User, id=id)
-            if user == author:
-                return Response({
-                    'errors': 'Вы не можете отписаться сами от себя.'
-                })
-            follow = Subscription.objects.filter(user=user, author=author)
-            if follow.exists():
-                follow.delete()
-                return Response(status=status.HTTP_204_NO_CONTENT)
-            return Response(serializer.data, {
-                'errors': 'Подписка на данного пользователя отменена.'
-            })
+        with transaction.atomic():
+            removed = membership.unlink(Subscription, user.id, [author_id])
+            if removed:
+                self.apply_membership(user.id, removed, Subscription, -1)
+        if not removed:
+            get_object_or_404(User, id=author_id)
+            return Response(
+                {'errors': 'Вы не подписаны на данного пользователя.'},
+                status=status.HTTP_400_BAD_REQUEST)
+        get_membership(request).invalidate('following')
         return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def apply_membership(self, user_id, changed, model, delta):
+        """Подписка (1) или отписка (-1): счетчики авторов и лента."""
+
+        author_ids = list(changed)
+        counters.change_followers(author_ids, delta)
+        if delta > 0:
+            feed.follow(user_id, author_ids)
+        else:
+            feed.unfollow(user_id, author_ids)